@@ -0,0 +1,93 @@
+"""Per-user activity bitmaps: one bit per calendar day with a mood entry.
+
+The bitmap lives on the user's summary document as
+``activity.<year>.<word>``, twelve 32-bit words per year, so a mood save
+sets its day with a single atomic ``$bit`` update and a decade of history
+is 120 small integers. Streaks and the calendar heatmap are answered from
+those words alone: ``ActivityMap`` packs them into one Python integer
+where bit ``n`` is day ``origin + n``, and every query is a handful of
+big-integer operations instead of a scan over mood documents.
+"""
+from datetime import date
+from typing import Dict, Iterable, List, Optional
+
+WORD_BITS = 32
+WORDS_PER_YEAR = 12
+
+
+def day_word(day: date) -> tuple:
+    """``(path, mask)`` of ``day``'s bit, the path relative to ``activity``."""
+    offset = day.timetuple().tm_yday - 1
+    return f"{day.year}.{offset // WORD_BITS}", 1 << (offset % WORD_BITS)
+
+
+def bit_masks(days: Iterable[date]) -> Dict[str, int]:
+    """OR-masks per word path, combining days that share a word."""
+    masks: Dict[str, int] = {}
+    for day in days:
+        path, mask = day_word(day)
+        masks[path] = masks.get(path, 0) | mask
+    return masks
+
+
+def build_activity(days: Iterable[date]) -> Dict[str, Dict[str, int]]:
+    """The stored ``activity`` document for a set of days, e.g. on a rebuild."""
+    activity: Dict[str, Dict[str, int]] = {}
+    for path, mask in bit_masks(days).items():
+        year, word = path.split(".")
+        activity.setdefault(year, {})[word] = mask
+    return activity
+
+
+def days_in_year(year: int) -> int:
+    return (date(year + 1, 1, 1) - date(year, 1, 1)).days
+
+
+class ActivityMap:
+    """Read-only view of a stored ``activity`` document."""
+
+    def __init__(self, activity: Optional[dict]):
+        activity = activity or {}
+        years = sorted(int(year) for year in activity)
+        self.origin = date(years[0], 1, 1) if years else None
+        self.bits = 0
+        for year in years:
+            words = activity[str(year)]
+            packed = 0
+            for word, value in words.items():
+                packed |= int(value) << (WORD_BITS * int(word))
+            self.bits |= packed << (date(year, 1, 1) - self.origin).days
+
+    def _position(self, day: date) -> int:
+        return (day - self.origin).days if self.origin else -1
+
+    def active(self, day: date) -> bool:
+        position = self._position(day)
+        return position >= 0 and bool(self.bits >> position & 1)
+
+    def active_days(self) -> int:
+        return bin(self.bits).count("1")
+
+    def current_streak(self, today: date) -> int:
+        """Consecutive active days ending today; 0 if today has no entry yet."""
+        if not self.active(today):
+            return 0
+        window = (1 << (self._position(today) + 1)) - 1
+        gaps = ~self.bits & window
+        # Everything above the most recent gap (up to today) is the streak.
+        return window.bit_length() - gaps.bit_length()
+
+    def longest_streak(self) -> int:
+        return max(len(run) for run in bin(self.bits)[2:].split("0")) if self.bits else 0
+
+    def year(self, year: int) -> List[int]:
+        """One 0/1 entry per day of ``year``, January 1st first."""
+        length = days_in_year(year)
+        start = self._position(date(year, 1, 1))
+        if self.origin is None:
+            bits = 0
+        elif start >= 0:
+            bits = self.bits >> start
+        else:
+            bits = self.bits << -start
+        return [bits >> offset & 1 for offset in range(length)]
@@ -0,0 +1,127 @@
+"""Admission control: per-client rate limits and global load shedding.
+
+``TokenBucketLimiter`` gives every key (a user id, or a client IP for the
+unauthenticated auth routes) a bucket of ``burst`` tokens refilled at
+``rate`` per second. A check is one dict lookup and some arithmetic, and
+the table is an LRU capped at ``max_keys``: the least recently seen
+client is forgotten first and simply starts over with a full bucket.
+Client IPs are the addresses the server sees, so behind a proxy they are
+only meaningful once the proxy is trusted (``TRUSTED_PROXIES``, see
+serve.py); otherwise every client shares the proxy's bucket.
+
+``LoadShedder`` caps the requests being served at once. Up to
+``max_queued`` more wait (at most ``queue_timeout`` seconds) for a slot;
+beyond that, requests are answered 503 with ``Retry-After`` right away,
+before they can take a database connection. Health and metrics endpoints
+are never shed.
+
+Both are per process: with ``WEB_CONCURRENCY`` workers the effective
+limits are that many times higher.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+from starlette.responses import JSONResponse
+
+from metrics import ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS
+
+RATE_LIMIT_USER_PER_SECOND = float(os.environ.get('RATE_LIMIT_USER_PER_SECOND', '10'))
+RATE_LIMIT_USER_BURST = float(os.environ.get('RATE_LIMIT_USER_BURST', '40'))
+RATE_LIMIT_IP_PER_SECOND = float(os.environ.get('RATE_LIMIT_IP_PER_SECOND', '1'))
+RATE_LIMIT_IP_BURST = float(os.environ.get('RATE_LIMIT_IP_BURST', '20'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '100000'))
+MAX_CONCURRENT_REQUESTS = int(os.environ.get('MAX_CONCURRENT_REQUESTS', '0'))
+MAX_QUEUED_REQUESTS = int(os.environ.get('MAX_QUEUED_REQUESTS', '200'))
+REQUEST_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('REQUEST_QUEUE_TIMEOUT_SECONDS', '2'))
+
+NEVER_SHED = ("/api/health", "/api/metrics")
+
+
+def retry_after(seconds: float) -> str:
+    """``Retry-After`` value: whole seconds, at least one."""
+    return str(max(1, math.ceil(seconds)))
+
+
+class TokenBucketLimiter:
+    """Token buckets keyed by client, in a bounded LRU table. ``rate <= 0`` disables it."""
+
+    def __init__(self, rate: float, burst: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.rate = rate
+        self.burst = max(burst, 1.0)
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+
+    def acquire(self, key: Hashable) -> float:
+        """Take a token: 0 if granted, else the seconds until one is available."""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = self.burst
+            if len(self.buckets) >= self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            tokens, stamp = bucket
+            tokens = min(self.burst, tokens + (now - stamp) * self.rate)
+            self.buckets.move_to_end(key)
+        if tokens >= 1:
+            self.buckets[key] = (tokens - 1, now)
+            return 0.0
+        self.buckets[key] = (tokens, now)
+        return (1 - tokens) / self.rate
+
+
+class LoadShedder:
+    """Pure ASGI middleware bounding concurrent requests; ``max_concurrent <= 0`` disables it."""
+
+    def __init__(self, app, max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 max_queued: int = MAX_QUEUED_REQUESTS,
+                 queue_timeout: float = REQUEST_QUEUE_TIMEOUT_SECONDS):
+        self.app = app
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.slots = asyncio.Semaphore(max(max_concurrent, 1))
+        self.waiting = 0
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] != "http" or self.max_concurrent <= 0
+                or scope["path"].startswith(NEVER_SHED)):
+            await self.app(scope, receive, send)
+            return
+
+        if self.slots.locked():
+            if self.waiting >= self.max_queued:
+                await self._shed(scope, receive, send)
+                return
+            self.waiting += 1
+            ADMISSION_QUEUE_DEPTH.set(value=self.waiting)
+            try:
+                await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                await self._shed(scope, receive, send)
+                return
+            finally:
+                self.waiting -= 1
+                ADMISSION_QUEUE_DEPTH.set(value=self.waiting)
+        else:
+            await self.slots.acquire()
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.slots.release()
+
+    async def _shed(self, scope, receive, send):
+        ADMISSION_REJECTIONS.inc("shed")
+        response = JSONResponse(
+            {"detail": "Server is busy, please retry"},
+            status_code=503,
+            headers={"Retry-After": retry_after(self.queue_timeout)}
+        )
+        await response(scope, receive, send)
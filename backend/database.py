@@ -0,0 +1,898 @@
+"""Async data layer for the Daily Wellness API.
+
+Every route in ``server.py`` goes through the repositories defined here
+instead of touching the driver directly, so no handler ever blocks the
+event loop on a MongoDB round trip. The repositories only rely on the
+motor collection API, so the storage engine underneath is pluggable:
+``STORAGE_ENGINE=mongo`` (default) uses motor, ``STORAGE_ENGINE=memory``
+uses the embedded engine in ``memorydb.py``.
+"""
+import asyncio
+import os
+import uuid
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from activity import bit_masks
+from memorydb import DUPLICATE_KEY_ERROR, MemoryClient
+from timestamps import utcnow
+from writebehind import WRITE_BEHIND_MODE, WRITE_BEHIND_MODES, WriteBehindQueue
+
+# Environment variables
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'mongo')
+MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
+MONGO_DB_NAME = os.environ.get('MONGO_DB_NAME', 'wellness_db')
+MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_MAX_IDLE_TIME_MS = int(os.environ.get('MONGO_MAX_IDLE_TIME_MS', '60000'))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.environ.get('MONGO_CONNECT_TIMEOUT_MS', '5000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.environ.get('MONGO_SOCKET_TIMEOUT_MS', '10000'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+# A summary write still pending after this long is taken to have crashed
+# half way, and the summary is rebuilt on its next read.
+SUMMARY_PENDING_WRITE_SECONDS = float(os.environ.get('SUMMARY_PENDING_WRITE_SECONDS', '60'))
+
+
+STORAGE_ENGINES = ("mongo", "memory")
+
+# Points awarded for completing a challenge
+CHALLENGE_POINTS = 10
+
+# Namespace for mood ids derived from client idempotency keys
+MOOD_CLIENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "daily-wellness/mood")
+
+
+def create_client(url: str = MONGO_URL, engine: str = STORAGE_ENGINE):
+    """Create a client for the configured storage engine.
+
+    For MongoDB this is a motor client with the configured pool sizes and
+    timeouts; for ``memory`` it is an empty embedded database.
+    """
+    if engine == "memory":
+        return MemoryClient()
+    if engine != "mongo":
+        raise ValueError(f"Unknown STORAGE_ENGINE {engine!r}, expected one of {STORAGE_ENGINES}")
+    return AsyncIOMotorClient(
+        url,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+        socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    )
+
+
+class UserRepository:
+    """Users by id are read through an optional cache, which every write
+    to a user record invalidates."""
+
+    def __init__(self, collection, cache=None):
+        self.collection = collection
+        self.cache = cache
+
+    async def get_by_id(self, user_id: str):
+        if self.cache is None:
+            return await self.collection.find_one({"_id": user_id})
+        user = self.cache.get(user_id)
+        if user is None:
+            user = await self.collection.find_one({"_id": user_id})
+            if user is not None:
+                self.cache.set(user_id, user)
+        return user
+
+    async def get_by_username(self, username: str):
+        return await self.collection.find_one({"username": username})
+
+    async def get_by_email(self, email: str):
+        return await self.collection.find_one({"email": email})
+
+    async def create(self, user: dict):
+        await self.collection.insert_one(user)
+        self._invalidate(user["_id"])
+
+    async def create_many(self, users: List[dict]) -> Dict[int, dict]:
+        """Unordered bulk insert; returns ``{index: write error}`` for rejected users.
+
+        Conflicts are left to the unique ``username``/``email`` indexes.
+        """
+        if not users:
+            return {}
+        try:
+            await self.collection.insert_many(users, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error for error in e.details.get("writeErrors", [])}
+        return {}
+
+    async def ids_by_username(self, usernames: Iterable[str]) -> Dict[str, str]:
+        cursor = self.collection.find({"username": {"$in": list(usernames)}}, {"_id": 1, "username": 1})
+        return {user["username"]: user["_id"] async for user in cursor}
+
+    def iter_ids(self):
+        return self.collection.find({}, {"_id": 1})
+
+    def iter_usernames(self):
+        return self.collection.find({}, {"_id": 1, "username": 1})
+
+    async def update(self, user_id: str, fields: dict):
+        await self.collection.update_one({"_id": user_id}, {"$set": fields})
+        self._invalidate(user_id)
+
+    def _invalidate(self, user_id: str):
+        if self.cache is not None:
+            self.cache.invalidate(user_id)
+
+
+class MoodRepository:
+    """Mood entries: ``date`` is a UTC datetime, ``day`` its day bucket (see ``timestamps.py``).
+
+    History reads are covered by the ``(user_id, date, _id, mood,
+    created_at)`` index and day-grouped reads by ``(user_id, day, mood)``,
+    so neither has to fetch documents.
+    """
+
+    HISTORY_FIELDS = {"date": 1, "mood": 1, "created_at": 1}
+
+    def __init__(self, collection, writer: Optional[WriteBehindQueue] = None):
+        self.collection = collection
+        self.writer = writer
+
+    @property
+    def acknowledged_writes_visible(self) -> bool:
+        """False when acknowledged mood writes may still be sitting in a queue."""
+        return self.writer is None or self.writer.durability != "enqueue"
+
+    def pending_writes(self, user_id: str) -> int:
+        """Entries of ``user_id`` acknowledged but not yet visible to reads."""
+        if self.acknowledged_writes_visible:
+            return 0
+        return self.writer.pending_for(user_id)
+
+    async def add(self, entry: dict):
+        if self.writer is not None:
+            await self.writer.submit(entry)
+        else:
+            await self.collection.insert_one(entry)
+
+    async def add_many(self, entries: List[dict]) -> Dict[int, int]:
+        """Unordered bulk insert; returns ``{index: error code}`` for rejected entries."""
+        if not entries:
+            return {}
+        try:
+            await self.collection.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error["code"] for error in e.details.get("writeErrors", [])}
+        return {}
+
+    @staticmethod
+    def _range_filter(user_id: str, date_from: Optional[datetime], date_to: Optional[datetime],
+                      after: Optional[Tuple[datetime, str]] = None) -> dict:
+        query = {"user_id": user_id}
+        date_range = {}
+        if date_from is not None:
+            date_range["$gte"] = date_from
+        if date_to is not None:
+            date_range["$lt"] = date_to
+        if date_range:
+            query["date"] = date_range
+        if after is not None:
+            # Keyset continuation: strictly older than the last (date, _id) seen.
+            after_date, after_id = after
+            query["$or"] = [
+                {"date": {"$lt": after_date}},
+                {"date": after_date, "_id": {"$lt": after_id}}
+            ]
+        return query
+
+    async def page(self, user_id: str, limit: int = 30, date_from: Optional[datetime] = None,
+                   date_to: Optional[datetime] = None, after: Optional[Tuple[datetime, str]] = None):
+        """Newest-first page of entries; ``_id`` is kept so callers can build a cursor."""
+        cursor = self.collection.find(
+            self._range_filter(user_id, date_from, date_to, after),
+            self.HISTORY_FIELDS
+        ).sort([("date", -1), ("_id", -1)]).limit(limit)
+        return await cursor.to_list(length=limit)
+
+    def iter_range(self, user_id: str, date_from: Optional[datetime] = None,
+                   date_to: Optional[datetime] = None, batch_size: int = 1000):
+        return self.collection.find(
+            self._range_filter(user_id, date_from, date_to),
+            {"_id": 0, **self.HISTORY_FIELDS}
+        ).sort([("date", -1), ("_id", -1)]).batch_size(batch_size)
+
+    def iter_values(self, user_id: str, batch_size: int = 5000):
+        return self.collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "day": 1, "mood": 1}
+        ).batch_size(batch_size)
+
+    def iter_days(self, user_id: str, batch_size: int = 5000):
+        return self.collection.find({"user_id": user_id}, {"_id": 0, "day": 1}).batch_size(batch_size)
+
+    def iter_created(self, after: Optional[datetime], until: datetime, batch_size: int = 5000):
+        """Entries written in ``(after, until]``, for the population rollups."""
+        created = {"$lte": until}
+        if after is not None:
+            created["$gt"] = after
+        return self.collection.find(
+            {"created_at": created},
+            {"_id": 0, "user_id": 1, "day": 1, "mood": 1}
+        ).batch_size(batch_size)
+
+    def iter_for_users(self, user_ids: List[str], batch_size: int = 5000):
+        return self.collection.find(
+            {"user_id": {"$in": user_ids}},
+            {"_id": 0, "user_id": 1, "day": 1, "mood": 1, "created_at": 1}
+        ).batch_size(batch_size)
+
+    def iter_older(self, user_id: str, before: datetime):
+        """Entries dated before ``before``, oldest first, with every field kept."""
+        return self.collection.find({"user_id": user_id, "date": {"$lt": before}}).sort("date", 1)
+
+    async def existing_ids(self, ids: List[str]) -> Set[str]:
+        cursor = self.collection.find({"_id": {"$in": ids}}, {"_id": 1})
+        return {entry["_id"] async for entry in cursor}
+
+    async def delete_ids(self, ids: List[str]):
+        if ids:
+            await self.collection.delete_many({"_id": {"$in": ids}})
+
+
+class ChallengeRepository:
+    """One document per challenge attempt, moved through its states atomically.
+
+    ``started`` -> ``completed``: a partial unique index allows a single
+    started attempt per user and challenge, so a duplicate start is
+    rejected by the insert itself, and completion is one find-and-modify
+    that flips the status and records the awarded points together. The
+    completed attempts are the points ledger; nothing else has to be
+    written for the points to count.
+    """
+
+    def __init__(self, collection, writer: Optional[WriteBehindQueue] = None):
+        self.collection = collection
+        self.writer = writer
+
+    async def add_many(self, entries: List[dict]) -> Dict[int, int]:
+        """Unordered bulk insert of attempts in any state; ``{index: error code}`` for rejected ones."""
+        if not entries:
+            return {}
+        try:
+            await self.collection.insert_many(entries, ordered=False)
+        except BulkWriteError as e:
+            return {error["index"]: error["code"] for error in e.details.get("writeErrors", [])}
+        return {}
+
+    async def start(self, entry: dict) -> bool:
+        """Insert a started attempt; False if one is already in progress."""
+        try:
+            if self.writer is not None:
+                await self.writer.submit(entry)
+            else:
+                await self.collection.insert_one(entry)
+        except DuplicateKeyError:
+            return False
+        except BulkWriteError as e:
+            if all(error.get("code") == DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                return False
+            raise
+        return True
+
+    async def complete(self, user_id: str, challenge_id: int, completed_at: datetime, points: int) -> Optional[dict]:
+        """Complete the started attempt; its completion record, or None if there was none."""
+        return await self.collection.find_one_and_update(
+            {
+                "user_id": user_id,
+                "challenge_id": challenge_id,
+                "status": "started"
+            },
+            {
+                "$set": {
+                    "status": "completed",
+                    "completed_at": completed_at,
+                    "points": points
+                }
+            },
+            projection={"_id": 0, "challenge_id": 1, "completed_at": 1, "points": 1},
+            return_document=ReturnDocument.AFTER
+        )
+
+    def iter_for_user(self, user_id: str):
+        """Every attempt in one indexed query: completed newest first, then started ones."""
+        return self.collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "user_id": 0}
+        ).sort("completed_at", -1)
+
+    def iter_for_users(self, user_ids: List[str], batch_size: int = 5000):
+        return self.collection.find(
+            {"user_id": {"$in": user_ids}},
+            {"_id": 0, "user_id": 1, "started_at": 1, "completed_at": 1}
+        ).batch_size(batch_size)
+
+    def iter_changed(self, after: datetime, until: datetime, batch_size: int = 5000):
+        """Attempts started or completed in ``(after, until]``."""
+        window = {"$gt": after, "$lte": until}
+        return self.collection.find(
+            {"$or": [{"started_at": window}, {"completed_at": window}]},
+            {"_id": 0, "user_id": 1}
+        ).batch_size(batch_size)
+
+    def iter_completed(self, batch_size: int = 5000):
+        return self.collection.find(
+            {"status": "completed"},
+            {"_id": 0, "user_id": 1, "completed_at": 1, "points": 1}
+        ).batch_size(batch_size)
+
+    async def drop_duplicate_starts(self) -> int:
+        """Keep the oldest started attempt per user and challenge, delete the rest."""
+        seen = set()
+        duplicates = []
+        cursor = self.collection.find(
+            {"status": "started"},
+            {"user_id": 1, "challenge_id": 1}
+        ).sort([("user_id", 1), ("challenge_id", 1), ("started_at", 1)]).batch_size(5000)
+        async for attempt in cursor:
+            key = (attempt["user_id"], attempt["challenge_id"])
+            if key in seen:
+                duplicates.append(attempt["_id"])
+            else:
+                seen.add(key)
+        for start in range(0, len(duplicates), 1000):
+            await self.collection.delete_many({"_id": {"$in": duplicates[start:start + 1000]}})
+        return len(duplicates)
+
+    async def backfill_points(self, progress) -> int:
+        """Copy points from the retired ``progress`` collection onto completed attempts."""
+        updated = 0
+        async for completion in progress.find({}, {"_id": 0, "user_id": 1, "challenge_id": 1, "points": 1}):
+            result = await self.collection.update_one(
+                {
+                    "user_id": completion["user_id"],
+                    "challenge_id": completion["challenge_id"],
+                    "status": "completed",
+                    "points": {"$exists": False}
+                },
+                {"$set": {"points": completion.get("points", 0)}}
+            )
+            updated += result.modified_count
+        return updated
+
+
+class MoodRollupRepository:
+    """Compacted mood entries, one document per user and month.
+
+    ``_id`` is ``"<user_id>:<YYYY-MM>"``. ``count``, ``sum`` and
+    ``histogram`` (mood value -> entries) cover the whole month; ``days``
+    holds ``count``/``sum``/``sum_sq`` per two-digit day of the month.
+    ``pending`` lists the raw entry ids absorbed by the last update until
+    they are gone from ``moods`` (see ``rollups.py``); ``ids`` lists every
+    entry id the month ever absorbed, so entries sent again are still
+    recognised after compaction.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def absorb(self, user_id: str, month: str, rollup: dict, ids: List[str]):
+        """Add ``rollup``'s totals to the month and mark ``ids`` as absorbed."""
+        increments = {"count": rollup["count"], "sum": rollup["sum"]}
+        for value, count in rollup["histogram"].items():
+            increments[f"histogram.{value}"] = count
+        for day, totals in rollup["days"].items():
+            for field, amount in totals.items():
+                increments[f"days.{day}.{field}"] = amount
+        await self.collection.update_one(
+            {"_id": f"{user_id}:{month}"},
+            {
+                "$inc": increments,
+                "$set": {"pending": ids},
+                "$addToSet": {"ids": {"$each": ids}},
+                "$setOnInsert": {"user_id": user_id, "month": month}
+            },
+            upsert=True
+        )
+
+    async def absorbed(self, user_ids: List[str], ids: List[str]) -> Set[str]:
+        """Those of ``ids`` (entries of ``user_ids``) already absorbed into a rollup."""
+        wanted = set(ids)
+        found = set()
+        async for rollup in self.collection.find(
+            {"user_id": {"$in": user_ids}, "ids": {"$in": ids}}, {"_id": 0, "ids": 1}
+        ):
+            found.update(wanted.intersection(rollup["ids"]))
+        return found
+
+    def iter_pending(self, user_id: str):
+        return self.collection.find({"user_id": user_id, "pending": {"$exists": True}}, {"pending": 1})
+
+    async def clear_pending(self, rollup_id: str):
+        await self.collection.update_one({"_id": rollup_id}, {"$unset": {"pending": ""}})
+
+    def iter_for_user(self, user_id: str):
+        return self.collection.find(
+            {"user_id": user_id},
+            {"_id": 0, "month": 1, "count": 1, "days": 1}
+        ).sort("month", 1)
+
+    @staticmethod
+    def day_totals(rollup: dict) -> Iterator[Tuple[date, dict]]:
+        """``(day, {"count", "sum", "sum_sq"})`` for every day in the rollup."""
+        year, month = (int(part) for part in rollup["month"].split("-"))
+        for day, totals in rollup.get("days", {}).items():
+            yield date(year, month, int(day)), totals
+
+
+class PopulationRollupRepository:
+    """Mood totals across all users (see ``population.py``).
+
+    ``day`` documents (``_id`` ``"day:<bucket>"``) hold ``count``/``sum``/
+    ``sum_sq``/``histogram`` per participation segment; ``offset``
+    documents (``"offset:<n>"``) hold the same totals for entries ``n``
+    days from their author's first challenge completion. The ``state``
+    document records how far the rollups have got.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get_state(self) -> Optional[dict]:
+        return await self.collection.find_one({"_id": "state"})
+
+    async def set_state(self, fields: dict):
+        await self.collection.update_one(
+            {"_id": "state"},
+            {"$set": fields, "$setOnInsert": {"kind": "state"}},
+            upsert=True
+        )
+
+    async def request_rebuild(self):
+        """Have the next rollup run start over, e.g. after importing backdated challenges."""
+        await self.set_state({"rebuild": True})
+
+    async def clear(self):
+        await self.collection.delete_many({"kind": {"$in": ["day", "offset"]}})
+
+    async def apply(self, increments: Dict[str, Tuple[dict, dict]], chunk_size: int = 500):
+        """``$inc`` each ``{doc_id: (fields set on insert, increments)}`` with upserts."""
+        updates = [
+            self.collection.update_one(
+                {"_id": doc_id},
+                {"$inc": fields, "$setOnInsert": seed},
+                upsert=True
+            )
+            for doc_id, (seed, fields) in increments.items() if fields
+        ]
+        for start in range(0, len(updates), chunk_size):
+            await asyncio.gather(*updates[start:start + chunk_size])
+
+    def iter_days(self, first_day: int, last_day: int):
+        return self.collection.find(
+            {"kind": "day", "day": {"$gte": first_day, "$lte": last_day}},
+            {"_id": 0, "kind": 0}
+        )
+
+    def iter_offsets(self, window: int):
+        return self.collection.find(
+            {"kind": "offset", "offset": {"$gte": -window, "$lte": window}},
+            {"_id": 0, "kind": 0}
+        )
+
+
+class SummaryRepository:
+    """One materialized summary document per user, keyed by user id.
+
+    Writers update it with single-document atomic operators so the read
+    endpoints never have to scan a user's history. Counter updates never
+    upsert: a user without a summary gets one rebuilt from the raw
+    collections on the next read, which already includes the write that
+    was skipped.
+
+    Every write also increments ``version``, the per-user data version the
+    read endpoints derive their ETags from. Rebuilds use it as an
+    optimistic lock: a rebuild only replaces the version it started from,
+    so a write landing during its scan is never overwritten.
+
+    A write endpoint brackets its writes with ``begin_write``, which
+    records a token under ``pending`` before the primary write, and the
+    ``record_*`` call, which applies the counters and removes the token in
+    one update. ``record_*`` only applies to a summary still holding the
+    token: one rebuilt in between already counted the write. A token left
+    behind for ``SUMMARY_PENDING_WRITE_SECONDS`` (the request failed half
+    way) makes the summary stale, and rebuilds wait for younger ones.
+    """
+
+    RECENT_COMPLETIONS = 5
+
+    # Bumped whenever summaries gain a field that cannot be maintained
+    # incrementally from an older document (2: activity bitmaps,
+    # 3: the ``compacted`` flag).
+    SCHEMA = 3
+    LEGACY_FIELDS = ("current_streak", "last_mood_day")
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def get(self, user_id: str):
+        return await self.collection.find_one({"_id": user_id})
+
+    async def version(self, user_id: str) -> Optional[int]:
+        """Data version, or None while the summary is missing or due for a rebuild."""
+        summary = await self.collection.find_one(
+            {"_id": user_id}, {"_id": 0, "version": 1, "schema": 1, "pending": 1}
+        )
+        if not self.is_current(summary):
+            return None
+        return summary.get("version", 0)
+
+    def is_current(self, summary: Optional[dict]) -> bool:
+        """False for a missing summary, an older schema or one left with an expired pending write."""
+        if summary is None or summary.get("schema") != self.SCHEMA:
+            return False
+        return not any(self.expired(write) for write in summary.get("pending", {}).values())
+
+    @staticmethod
+    def expired(write: dict) -> bool:
+        """Whether a pending write (``{"kind", "started_at"}``) has been pending too long."""
+        return utcnow() - write["started_at"] > timedelta(seconds=SUMMARY_PENDING_WRITE_SECONDS)
+
+    async def create(self, user_id: str):
+        try:
+            await self.collection.insert_one(self._initial(user_id))
+        except DuplicateKeyError:
+            pass  # a rebuild got there first; it will include everything
+
+    def _initial(self, user_id: str) -> dict:
+        return {
+            "_id": user_id,
+            "schema": self.SCHEMA,
+            "version": 0,
+            "mood_count": 0,
+            "activity": {},
+            "completed_count": 0,
+            "total_points": 0,
+            "recent_completions": [],
+            "current_challenges": []
+        }
+
+    async def begin_rebuild(self, user_id: str) -> Tuple[int, dict]:
+        """Version a rebuild of ``user_id`` starts from, and the writes pending then.
+
+        Read before the rebuild scans. A missing summary is first created
+        as a stale placeholder, so that writes during the scan have a
+        version to bump.
+        """
+        projection = {"_id": 0, "version": 1, "pending": 1}
+        try:
+            summary = await self.collection.find_one_and_update(
+                {"_id": user_id},
+                {"$setOnInsert": {"schema": None, "version": 0}},
+                projection=projection,
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            summary = await self.collection.find_one({"_id": user_id}, projection)
+        if "version" not in summary:
+            await self.collection.update_one({"_id": user_id, "version": {"$exists": False}}, {"$set": {"version": 0}})
+            return await self.begin_rebuild(user_id)
+        return summary["version"], summary.get("pending", {})
+
+    async def replace(self, summary: dict, version: int) -> bool:
+        """Store a rebuilt summary unless the data changed since ``version``; False if it did."""
+        # Keep counting from the old version: a rebuilt summary must never
+        # reuse a version, or a stale ETag could match again.
+        fields = {key: value for key, value in summary.items() if key not in ("_id", "version")}
+        result = await self.collection.update_one(
+            {"_id": summary["_id"], "version": version},
+            {
+                "$set": {**fields, "pending": {}},
+                "$unset": {field: "" for field in self.LEGACY_FIELDS},
+                "$inc": {"version": 1}
+            }
+        )
+        return result.matched_count == 1
+
+    async def begin_write(self, user_id: str, kind: str) -> str:
+        """Record a pending write of ``kind`` before its primary write; returns its token.
+
+        A missing summary gets a stale placeholder holding the token (as
+        in ``begin_rebuild``).
+        """
+        token = uuid.uuid4().hex
+        update = {
+            "$set": {f"pending.{token}": {"kind": kind, "started_at": utcnow()}},
+            "$inc": {"version": 1}
+        }
+        try:
+            await self.collection.update_one({"_id": user_id}, update, upsert=True)
+        except DuplicateKeyError:
+            await self.collection.update_one({"_id": user_id}, update)
+        return token
+
+    async def end_write(self, user_id: str, token: str):
+        """Drop the token of a write that changed nothing the counters track, or was already counted."""
+        await self.collection.update_one(
+            {"_id": user_id},
+            {"$unset": {f"pending.{token}": ""}, "$inc": {"version": 1}}
+        )
+
+    async def _record(self, user_id: str, token: str, update: dict):
+        """Apply ``update`` and drop ``token`` in one write, if the summary still holds the token.
+
+        Summaries on an older schema are rebuilt on their next read, and
+        one rebuilt since ``begin_write`` already includes the write, so
+        both only lose the token. Their version is still bumped, so a
+        rebuild already scanning is retried.
+        """
+        update["$unset"] = {f"pending.{token}": ""}
+        update.setdefault("$inc", {})["version"] = 1
+        result = await self.collection.update_one(
+            {"_id": user_id, "schema": self.SCHEMA, f"pending.{token}": {"$exists": True}}, update
+        )
+        if result.matched_count == 0:
+            await self.end_write(user_id, token)
+
+    async def record_moods(self, user_id: str, token: str, count: int, days: Iterable[date]):
+        """Count ``count`` new entries and set their days in the activity bitmap."""
+        update = {"$inc": {"mood_count": count}}
+        masks = bit_masks(days)
+        if masks:
+            update["$bit"] = {f"activity.{path}": {"or": mask} for path, mask in masks.items()}
+        await self._record(user_id, token, update)
+
+    async def mark_stale(self, user_ids: List[str]):
+        """Have these summaries rebuilt on their next read, e.g. after a bulk import."""
+        if user_ids:
+            await self.collection.update_many(
+                {"_id": {"$in": user_ids}},
+                {"$set": {"schema": None}, "$inc": {"version": 1}}
+            )
+
+    async def compacted(self, user_id: str) -> bool:
+        """Whether the user may have entries in the cold tier (always, while the summary is stale)."""
+        summary = await self.collection.find_one(
+            {"_id": user_id}, {"_id": 0, "schema": 1, "pending": 1, "compacted": 1}
+        )
+        if not self.is_current(summary):
+            return True
+        return summary.get("compacted", False)
+
+    async def mark_compacted(self, user_id: str):
+        """Flag the user as having compacted months, before any entry leaves ``moods``.
+
+        The flag is only ever set, never cleared: rebuilds leave it out
+        unless they find rollups, and ``replace`` keeps fields it does not
+        write. A missing summary gets a stale placeholder carrying it (as
+        in ``begin_rebuild``), so a rebuild scanning meanwhile cannot lose it.
+        """
+        update = {"$set": {"compacted": True}, "$inc": {"version": 1}}
+        try:
+            await self.collection.update_one({"_id": user_id}, update, upsert=True)
+        except DuplicateKeyError:
+            await self.collection.update_one({"_id": user_id}, update)
+
+    async def touch(self, user_id: str):
+        """Bump the data version after a change the counters do not reflect."""
+        await self.collection.update_one({"_id": user_id}, {"$inc": {"version": 1}})
+
+    async def record_start(self, user_id: str, token: str, challenge: dict):
+        await self._record(user_id, token, {"$push": {"current_challenges": challenge}})
+
+    async def record_completion(self, user_id: str, token: str, completion: dict):
+        await self._record(user_id, token, {
+            "$inc": {"completed_count": 1, "total_points": completion.get("points", 0)},
+            "$pull": {"current_challenges": {"challenge_id": completion["challenge_id"]}},
+            "$push": {"recent_completions": {
+                "$each": [completion],
+                "$position": 0,
+                "$slice": self.RECENT_COMPLETIONS
+            }}
+        })
+
+
+class LeaderboardRepository:
+    """One document per (board, user) holding that user's points on the board.
+
+    Entries given an ``expires_at`` (those of weekly boards) are deleted by
+    a TTL index once it has passed. ``replace_all`` builds the new
+    collection in ``staging`` and renames it over the live one, so readers
+    see either the old boards or the new.
+    """
+
+    STAGING = "leaderboard_staging"
+
+    def __init__(self, collection, staging=None):
+        self.collection = collection
+        self.staging = staging
+
+    @staticmethod
+    async def create_indexes(collection):
+        await collection.create_index([("board", 1), ("updated_at", 1)])
+        await collection.create_index("expires_at", expireAfterSeconds=0)
+
+    @staticmethod
+    def _seed(board: str, user_id: str, expires_at: Optional[datetime]) -> dict:
+        seed = {"board": board, "user_id": user_id}
+        if expires_at is not None:
+            seed["expires_at"] = expires_at
+        return seed
+
+    async def add_points(self, board: str, user_id: str, username: str, points: int, at,
+                         expires_at: Optional[datetime] = None) -> dict:
+        return await self.collection.find_one_and_update(
+            {"_id": f"{board}:{user_id}"},
+            {
+                "$inc": {"points": points},
+                "$set": {"username": username, "updated_at": at},
+                "$setOnInsert": self._seed(board, user_id, expires_at)
+            },
+            projection={"_id": 0, "username": 1, "points": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def set_points(self, board: str, user_id: str, username: str, points: int, at,
+                         expires_at: Optional[datetime] = None):
+        await self.collection.update_one(
+            {"_id": f"{board}:{user_id}"},
+            {
+                "$set": {"username": username, "points": points, "updated_at": at},
+                "$setOnInsert": self._seed(board, user_id, expires_at)
+            },
+            upsert=True
+        )
+
+    def iter_board(self, board: str, since=None):
+        query = {"board": board}
+        if since is not None:
+            query["updated_at"] = {"$gte": since}
+        return self.collection.find(
+            query,
+            {"_id": 0, "user_id": 1, "username": 1, "points": 1, "updated_at": 1}
+        ).batch_size(5000)
+
+    async def replace_all(self, entries: List[dict], chunk_size: int = 1000):
+        await self.staging.drop()
+        await self.create_indexes(self.staging)
+        for start in range(0, len(entries), chunk_size):
+            await self.staging.insert_many(entries[start:start + chunk_size], ordered=False)
+        await self.staging.rename(self.collection.name, dropTarget=True)
+
+
+class Database:
+    """Bundles the client and one repository per collection.
+
+    ``wrap_collection`` is applied to every collection handed to a
+    repository, e.g. to instrument it. ``write_behind`` (``off``, ``flush``
+    or ``enqueue``) routes mood inserts, and in ``flush`` mode challenge
+    starts, through a ``WriteBehindQueue`` each; see ``writebehind.py``.
+    ``mood_archive`` and ``mood_rollups`` are the cold tier of ``moods``;
+    see ``rollups.py``. ``population_rollups`` backs the admin analytics;
+    see ``population.py``.
+    """
+
+    # Repository attribute -> collection name
+    COLLECTIONS = {
+        "users": "users",
+        "moods": "moods",
+        "mood_archive": "mood_archive",
+        "mood_rollups": "mood_rollups",
+        "challenges": "challenges",
+        "summaries": "user_summaries",
+        "leaderboard": "leaderboard",
+        "population_rollups": "population_rollups",
+    }
+
+    def __init__(self, client, db_name: str = MONGO_DB_NAME, user_cache=None, wrap_collection=None,
+                 write_behind: str = WRITE_BEHIND_MODE):
+        if write_behind not in WRITE_BEHIND_MODES:
+            raise ValueError(f"Unknown WRITE_BEHIND_MODE {write_behind!r}, expected one of {WRITE_BEHIND_MODES}")
+        self.db_name = db_name
+        self.wrap = wrap_collection or (lambda collection: collection)
+        self.writers = {}
+        if write_behind != "off":
+            self.writers["moods"] = WriteBehindQueue(None, durability=write_behind)
+        if write_behind == "flush":
+            # A start is only accepted once the insert has passed the
+            # one-started-attempt index, so starts are never just enqueued.
+            self.writers["challenges"] = WriteBehindQueue(None, durability=write_behind)
+        self.users = UserRepository(None, cache=user_cache)
+        self.moods = MoodRepository(None, writer=self.writers.get("moods"))
+        self.mood_archive = MoodRepository(None)
+        self.mood_rollups = MoodRollupRepository(None)
+        self.challenges = ChallengeRepository(None, writer=self.writers.get("challenges"))
+        self.summaries = SummaryRepository(None)
+        self.leaderboard = LeaderboardRepository(None)
+        self.population_rollups = PopulationRollupRepository(None)
+        self.bind(client)
+
+    def bind(self, client):
+        """Point every repository (and write-behind queue) at ``client``.
+
+        Prefork workers call this after ``fork()`` so each process gets its
+        own connection pool; everything holding a repository keeps working.
+        """
+        self.client = client
+        self.db = client[self.db_name]
+        for attribute, name in self.COLLECTIONS.items():
+            collection = self.wrap(self.db[name])
+            getattr(self, attribute).collection = collection
+            if attribute in self.writers:
+                self.writers[attribute].collection = collection
+        self.leaderboard.staging = self.wrap(self.db[LeaderboardRepository.STAGING])
+
+    # Collection name -> indexes superseded by the ones below (manage.py migrate-dates)
+    LEGACY_INDEXES = {
+        # Prefixes of the covering history index
+        "moods": ["user_id_1_date_-1", "user_id_1_date_-1__id_-1"],
+        "mood_archive": ["user_id_1_date_-1__id_-1"],
+        # Retired along with the collection by one-document-per-attempt challenges
+        "progress": ["user_id_1_challenge_id_1"],
+    }
+
+    async def create_indexes(self, strict: bool = False) -> List[str]:
+        """Build every index; returns the names of those skipped.
+
+        ``one_started_attempt`` cannot be built while duplicate starts from
+        before it remain (``manage.py migrate-challenges`` drops them and
+        builds it); it is then skipped, or with ``strict`` the error raised.
+        """
+        await self.users.collection.create_index("username", unique=True)
+        await self.users.collection.create_index("email", unique=True)
+        for moods in (self.moods, self.mood_archive):
+            await moods.collection.create_index(
+                [("user_id", 1), ("date", -1), ("_id", -1), ("mood", 1), ("created_at", 1)]
+            )
+            await moods.collection.create_index([("user_id", 1), ("day", 1), ("mood", 1)])
+        await self.moods.collection.create_index([("created_at", 1)])
+        await self.mood_rollups.collection.create_index([("user_id", 1), ("month", 1)])
+        await self.challenges.collection.create_index([("user_id", 1), ("challenge_id", 1)])
+        await self.challenges.collection.create_index([("user_id", 1), ("completed_at", -1)])
+        await self.challenges.collection.create_index([("started_at", 1)])
+        await self.challenges.collection.create_index([("completed_at", 1)])
+        await self.population_rollups.collection.create_index([("kind", 1), ("day", 1)])
+        await self.leaderboard.create_indexes(self.leaderboard.collection)
+        try:
+            await self.challenges.collection.create_index(
+                [("user_id", 1), ("challenge_id", 1)],
+                name="one_started_attempt",
+                unique=True,
+                partialFilterExpression={"status": "started"}
+            )
+        except OperationFailure as e:
+            if strict or e.code != DUPLICATE_KEY_ERROR:
+                raise
+            return ["one_started_attempt"]
+        return []
+
+    async def drop_legacy_indexes(self) -> List[str]:
+        dropped = []
+        for collection, names in self.LEGACY_INDEXES.items():
+            for name in names:
+                try:
+                    await self.db[collection].drop_index(name)
+                except OperationFailure:
+                    continue
+                dropped.append(f"{collection}.{name}")
+        return dropped
+
+    def start_writers(self):
+        for writer in self.writers.values():
+            writer.start()
+
+    async def drain_writers(self):
+        for writer in self.writers.values():
+            await writer.close()
+
+    async def ping(self):
+        await self.client.admin.command('ping')
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,28 @@
+"""Entity tags for conditional GETs on per-user read endpoints.
+
+Every write to a user's data bumps ``version`` on their summary document
+(see ``SummaryRepository``), so an ETag built from that counter changes
+exactly when the user's data may have. Checking ``If-None-Match`` costs a
+single ``_id`` lookup, done before any of the endpoint's real queries.
+"""
+import hashlib
+from typing import Optional
+
+# Browsers may keep the response but must revalidate it before each reuse.
+CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts) -> str:
+    """Opaque strong ETag over the user, their data version and the request variant."""
+    digest = hashlib.sha1("|".join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest[:24]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """``If-None-Match`` uses weak comparison, so a ``W/`` prefix is ignored."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == etag for candidate in candidates)
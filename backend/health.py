@@ -0,0 +1,160 @@
+"""Startup index building and the readiness check behind the health probes.
+
+Workers must come up without waiting on MongoDB: the lifespan only starts
+``IndexBuilder`` in the background, which retries ``create_indexes`` with
+exponential backoff (capped at ``max_delay``) a bounded number of times.
+The unique indexes are what keeps usernames, emails and idempotency keys
+unique, so a worker whose build gave up never reports ready. The one
+index old data can block (``one_started_attempt``) is skipped with a
+warning instead. A database still waiting on a ``manage.py`` migration
+(see ``migrations.pending_migrations``) is not ready either, and
+``MigrationGate`` answers 503 to everything but the health and metrics
+endpoints until it has run. ``ReadinessCheck`` pings
+the database at most once per ``ttl`` seconds, however many probes arrive,
+and bounds each ping so a down database fails the probe quickly instead
+of holding it for the driver's server selection timeout.
+"""
+import asyncio
+import os
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from starlette.responses import JSONResponse
+
+from admission import NEVER_SHED, retry_after
+from migrations import pending_migrations
+
+STARTUP_INDEX_ATTEMPTS = int(os.environ.get('STARTUP_INDEX_ATTEMPTS', '10'))
+STARTUP_RETRY_DELAY_SECONDS = float(os.environ.get('STARTUP_RETRY_DELAY_SECONDS', '1'))
+STARTUP_RETRY_MAX_DELAY_SECONDS = float(os.environ.get('STARTUP_RETRY_MAX_DELAY_SECONDS', '30'))
+HEALTH_READY_CACHE_SECONDS = float(os.environ.get('HEALTH_READY_CACHE_SECONDS', '2'))
+HEALTH_PING_TIMEOUT_SECONDS = float(os.environ.get('HEALTH_PING_TIMEOUT_SECONDS', '1'))
+
+
+class IndexBuilder:
+    """Runs ``db.create_indexes()`` in the background until it succeeds or gives up.
+
+    ``state`` is ``pending`` while attempts remain, then ``ready`` or
+    ``failed``; ``migration_required`` in between while the data needs a
+    ``manage.py`` migration, checked again every ``max_delay`` seconds.
+    ``skipped`` lists indexes left out because of old data.
+    """
+
+    def __init__(self, db, attempts: int = STARTUP_INDEX_ATTEMPTS,
+                 delay: float = STARTUP_RETRY_DELAY_SECONDS,
+                 max_delay: float = STARTUP_RETRY_MAX_DELAY_SECONDS):
+        self.db = db
+        self.attempts = attempts
+        self.delay = delay
+        self.max_delay = max_delay
+        self.state = "pending"
+        self.error: Optional[str] = None
+        self.skipped: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        delay = self.delay
+        for attempt in range(1, self.attempts + 1):
+            try:
+                self.skipped = await self.db.create_indexes()
+            except Exception as e:
+                self.error = str(e)
+                print(f"❌ Index build attempt {attempt}/{self.attempts} failed: {e}")
+                if attempt < self.attempts:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, self.max_delay)
+            else:
+                for name in self.skipped:
+                    print(f"⚠️ Index {name} skipped: duplicate challenge starts remain, "
+                          f"run manage.py migrate-challenges")
+                await self._wait_for_migrations()
+                self.state = "ready"
+                self.error = None
+                print("✅ Connected to MongoDB successfully")
+                return
+        self.state = "failed"
+
+    async def _wait_for_migrations(self):
+        while True:
+            try:
+                pending = await pending_migrations(self.db)
+            except Exception as e:
+                pending, error = None, str(e)
+            else:
+                error = f"run manage.py {' and '.join(pending)}"
+            if pending == []:
+                return
+            if pending:
+                self.state = "migration_required"
+            if error != self.error:
+                self.error = error
+                print(f"❌ Database needs migrating: {error}" if pending else f"❌ Migration check failed: {error}")
+            await asyncio.sleep(self.max_delay)
+
+    async def stop(self):
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+class MigrationGate:
+    """Pure ASGI middleware: 503 while ``builder`` waits on a data migration."""
+
+    def __init__(self, app, builder: IndexBuilder):
+        self.app = app
+        self.builder = builder
+
+    async def __call__(self, scope, receive, send):
+        if (scope["type"] == "http" and self.builder.state == "migration_required"
+                and not scope["path"].startswith(NEVER_SHED)):
+            response = JSONResponse(
+                {"detail": f"Database migration required: {self.builder.error}"},
+                status_code=503,
+                headers={"Retry-After": retry_after(self.builder.max_delay)}
+            )
+            await response(scope, receive, send)
+            return
+        await self.app(scope, receive, send)
+
+
+class ReadinessCheck:
+    """Cached, single-flight database ping."""
+
+    def __init__(self, db, ttl: float = HEALTH_READY_CACHE_SECONDS,
+                 timeout: float = HEALTH_PING_TIMEOUT_SECONDS):
+        self.db = db
+        self.ttl = ttl
+        self.timeout = timeout
+        self.result: Optional[dict] = None
+        self.checked = float("-inf")
+        self.lock: Optional[asyncio.Lock] = None
+
+    async def check(self) -> dict:
+        """``{"connected": bool, "error": str|None, "checked_at": iso}``, at most ``ttl`` old."""
+        if time.monotonic() - self.checked < self.ttl:
+            return self.result
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            if time.monotonic() - self.checked >= self.ttl:
+                error = None
+                try:
+                    await asyncio.wait_for(self.db.ping(), self.timeout)
+                except asyncio.TimeoutError:
+                    error = f"ping timed out after {self.timeout}s"
+                except Exception as e:
+                    error = str(e)
+                self.result = {
+                    "connected": error is None,
+                    "error": error,
+                    "checked_at": datetime.utcnow().isoformat()
+                }
+                self.checked = time.monotonic()
+        return self.result
@@ -0,0 +1,228 @@
+"""Points leaderboards backed by a precomputed ranking index.
+
+``complete_challenge`` adds the awarded points to one ``leaderboard``
+document per board (all-time and the current ISO week), so completed
+challenges are never scanned to rank users. Weekly entries expire a day
+after their week ends, and rebuilds only write the boards being served. Each worker keeps
+an in-memory ``RankIndex`` per board, a sorted array answering top-K and
+rank queries in O(log n). It applies its own writes immediately and pulls
+other workers' writes with a cheap ``updated_at`` delta query at most
+every ``sync_interval`` seconds.
+"""
+import asyncio
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from timestamps import parse_timestamp
+
+ALL_TIME = "all"
+
+# Delta syncs re-read this much before the watermark to tolerate clock skew
+# between workers; re-applying an entry is harmless since points are absolute.
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# Past weeks are never served; their entries are kept this long after the
+# week ends so a worker still ranking it at midnight is not left empty.
+WEEKLY_BOARD_GRACE = timedelta(days=1)
+
+
+def week_board(moment: datetime) -> str:
+    year, week, _ = moment.isocalendar()
+    return f"week:{year}-W{week:02d}"
+
+
+def boards_for(moment: datetime) -> List[str]:
+    return [ALL_TIME, week_board(moment)]
+
+
+def board_expiry(board: str, moment: datetime) -> Optional[datetime]:
+    """When entries of ``board`` (the board of ``moment``) may be deleted; None for all-time."""
+    if board == ALL_TIME:
+        return None
+    monday = datetime.combine(moment.date() - timedelta(days=moment.weekday()), datetime.min.time())
+    return monday + timedelta(days=7) + WEEKLY_BOARD_GRACE
+
+
+class RankIndex:
+    """Users ordered by points (desc), ties broken by user id."""
+
+    def __init__(self):
+        self.order: List[tuple] = []
+        self.points: Dict[str, int] = {}
+        self.usernames: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def set(self, user_id: str, username: str, points: int):
+        previous = self.points.get(user_id)
+        if previous is not None:
+            if previous == points:
+                self.usernames[user_id] = username
+                return
+            del self.order[bisect_left(self.order, (-previous, user_id))]
+        insort(self.order, (-points, user_id))
+        self.points[user_id] = points
+        self.usernames[user_id] = username
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """Competition rank: 1 + number of users with strictly more points."""
+        points = self.points.get(user_id)
+        if points is None:
+            return None
+        return bisect_left(self.order, (-points, "")) + 1
+
+    def entry(self, position: int) -> dict:
+        negative_points, user_id = self.order[position]
+        return {
+            "rank": bisect_left(self.order, (negative_points, "")) + 1,
+            "username": self.usernames.get(user_id),
+            "points": -negative_points,
+        }
+
+    def top(self, limit: int) -> List[dict]:
+        return [self.entry(position) for position in range(min(limit, len(self.order)))]
+
+    def around(self, user_id: str, radius: int) -> List[dict]:
+        points = self.points.get(user_id)
+        if points is None:
+            return []
+        position = bisect_left(self.order, (-points, user_id))
+        start = max(0, position - radius)
+        return [self.entry(index) for index in range(start, min(len(self.order), position + radius + 1))]
+
+
+class Leaderboards:
+    def __init__(self, repository, sync_interval: float = 5.0):
+        self.repository = repository
+        self.sync_interval = sync_interval
+        self.boards: Dict[str, RankIndex] = {}
+        self.watermarks: Dict[str, datetime] = {}
+        self.synced_at: Dict[str, float] = {}
+        self.locks: Dict[str, asyncio.Lock] = {}
+
+    async def record(self, user_id: str, username: str, points: int, at: datetime):
+        boards = boards_for(at)
+        entries = await asyncio.gather(*(
+            self.repository.add_points(board, user_id, username, points, at, board_expiry(board, at))
+            for board in boards
+        ))
+        for board, entry in zip(boards, entries):
+            # Boards not loaded yet pick the write up on their first sync.
+            if board in self.boards:
+                self.boards[board].set(user_id, entry["username"], entry["points"])
+
+    async def get(self, board: str) -> RankIndex:
+        if time.monotonic() - self.synced_at.get(board, float("-inf")) >= self.sync_interval:
+            lock = self.locks.setdefault(board, asyncio.Lock())
+            async with lock:
+                if time.monotonic() - self.synced_at.get(board, float("-inf")) >= self.sync_interval:
+                    await self._sync(board)
+        return self.boards[board]
+
+    async def _sync(self, board: str):
+        if board not in self.boards:
+            if board != ALL_TIME:
+                # Only the current week is served; drop boards of past weeks.
+                for stale in [name for name in self.boards if name != ALL_TIME]:
+                    self.boards.pop(stale)
+                    self.watermarks.pop(stale, None)
+                    self.synced_at.pop(stale, None)
+            self.boards[board] = RankIndex()
+        index = self.boards[board]
+        watermark = self.watermarks.get(board)
+        since = watermark - SYNC_OVERLAP if watermark else None
+        async for entry in self.repository.iter_board(board, since):
+            index.set(entry["user_id"], entry["username"], entry["points"])
+            if watermark is None or entry["updated_at"] > watermark:
+                watermark = entry["updated_at"]
+        if watermark is not None:
+            self.watermarks[board] = watermark
+        self.synced_at[board] = time.monotonic()
+
+
+async def rebuild_leaderboards(db) -> int:
+    """Recompute the boards being served from completed challenges; returns the number of entries.
+
+    Entries of past weeks are not written, so the swap also prunes them.
+    """
+    now = datetime.utcnow()
+    served = set(boards_for(now))
+    totals: Dict[tuple, int] = {}
+    usernames: Dict[str, str] = {}
+    async for completion in db.challenges.iter_completed():
+        completed_at = parse_timestamp(completion["completed_at"])
+        for board in boards_for(completed_at):
+            if board in served:
+                key = (board, completion["user_id"])
+                totals[key] = totals.get(key, 0) + completion.get("points", 0)
+    async for user in db.users.iter_usernames():
+        usernames[user["_id"]] = user["username"]
+    entries = []
+    for (board, user_id), points in totals.items():
+        entry = {
+            "_id": f"{board}:{user_id}",
+            "board": board,
+            "user_id": user_id,
+            "username": usernames.get(user_id),
+            "points": points,
+            "updated_at": now,
+        }
+        expires_at = board_expiry(board, now)
+        if expires_at is not None:
+            entry["expires_at"] = expires_at
+        entries.append(entry)
+    await db.leaderboard.replace_all(entries)
+    return len(totals)
+
+
+async def add_completions(db, completions: List[dict]) -> int:
+    """Add the points of new completed challenges to the boards being served; returns the entries updated.
+
+    ``completions`` are challenge documents with the user's ``username``
+    added, e.g. from an import. Past weeks are never served, so their
+    boards are left alone.
+    """
+    now = datetime.utcnow()
+    served = set(boards_for(now))
+    totals: Dict[tuple, int] = {}
+    usernames: Dict[str, str] = {}
+    for completion in completions:
+        usernames[completion["user_id"]] = completion["username"]
+        for board in boards_for(parse_timestamp(completion["completed_at"])):
+            if board in served:
+                key = (board, completion["user_id"])
+                totals[key] = totals.get(key, 0) + completion.get("points", 0)
+    entries = list(totals.items())
+    for start in range(0, len(entries), 500):
+        await asyncio.gather(*(
+            db.leaderboard.add_points(board, user_id, usernames[user_id], points, now, board_expiry(board, now))
+            for (board, user_id), points in entries[start:start + 500]
+        ))
+    return len(entries)
+
+
+async def rebuild_user_leaderboards(db, user_id: str):
+    """Recompute one user's entries on the boards being served from their completed challenges.
+
+    Used to repair a completion that failed between awarding its points
+    and adding them to the boards (see ``rebuild_summary``).
+    """
+    now = datetime.utcnow()
+    boards = boards_for(now)
+    totals = dict.fromkeys(boards, 0)
+    async for attempt in db.challenges.iter_for_user(user_id):
+        if attempt.get("status") != "completed":
+            continue
+        for board in boards_for(parse_timestamp(attempt["completed_at"])):
+            if board in totals:
+                totals[board] += attempt.get("points", 0)
+    user = await db.users.get_by_id(user_id)
+    if user is None:
+        return
+    await asyncio.gather(*(
+        db.leaderboard.set_points(board, user_id, user["username"], points, now, board_expiry(board, now))
+        for board, points in totals.items() if points
+    ))
@@ -0,0 +1,156 @@
+"""Maintenance commands for the Daily Wellness API.
+
+    python manage.py rebuild-summaries [--user-id ID]
+    python manage.py rebuild-leaderboard
+    python manage.py migrate-challenges
+    python manage.py compact-moods [--user-id ID]
+    python manage.py migrate-dates [--batch-size N] [--restart]
+    python manage.py import-data users|moods|challenges FILE [--format csv|ndjson] [--batch-size N] [--errors PATH]
+    python manage.py rollup-population [--rebuild]
+"""
+import asyncio
+import json
+import os
+from typing import Optional
+
+import typer
+
+from database import Database, create_client
+from leaderboard import rebuild_leaderboards
+from migrations import MIGRATION_BATCH_SIZE, mark_complete, migrate_dates
+from population import update_population_rollups
+from provisioning import IMPORT_BATCH_SIZE, IMPORT_FORMATS, IMPORT_KINDS, import_hasher, import_rows, read_rows
+from rollups import MOOD_ARCHIVE, MOOD_HOT_DAYS, compact_all, compact_user, hot_boundary
+from summaries import rebuild_all_summaries, rebuild_summary
+
+cli = typer.Typer(help="Daily Wellness API maintenance commands.")
+
+
+@cli.callback()
+def main():
+    """Daily Wellness API maintenance commands."""
+
+
+def run(command):
+    """Run ``command(db)`` on a fresh database handle and close it afterwards."""
+    async def runner():
+        db = Database(create_client())
+        try:
+            return await command(db)
+        finally:
+            db.close()
+    return asyncio.run(runner())
+
+
+@cli.command("rebuild-summaries")
+def rebuild_summaries(user_id: Optional[str] = typer.Option(None, help="Rebuild a single user only.")):
+    """Recompute per-user summary documents from the raw collections."""
+    if user_id:
+        summary = run(lambda db: rebuild_summary(db, user_id))
+        typer.echo(f"Rebuilt summary for {user_id}: {summary['mood_count']} moods, "
+                   f"{summary['total_points']} points")
+    else:
+        rebuilt = run(rebuild_all_summaries)
+        typer.echo(f"Rebuilt {rebuilt} summaries")
+
+
+@cli.command("rebuild-leaderboard")
+def rebuild_leaderboard():
+    """Recompute the all-time and weekly leaderboards from completed challenges."""
+    entries = run(rebuild_leaderboards)
+    typer.echo(f"Rebuilt {entries} leaderboard entries")
+
+
+@cli.command("migrate-challenges")
+def migrate_challenges():
+    """Move to one-document-per-attempt challenges: drop duplicate starts, copy points over."""
+    async def migrate(db):
+        dropped = await db.challenges.drop_duplicate_starts()
+        backfilled = await db.challenges.backfill_points(db.db.progress)
+        await db.create_indexes(strict=True)
+        await mark_complete(db, "migrate-challenges")
+        return dropped, backfilled
+    dropped, backfilled = run(migrate)
+    typer.echo(f"Dropped {dropped} duplicate starts, backfilled points on {backfilled} completed challenges")
+
+
+@cli.command("compact-moods")
+def compact_moods(user_id: Optional[str] = typer.Option(None, help="Compact a single user only.")):
+    """Roll mood entries older than MOOD_HOT_DAYS into monthly rollups (see rollups.py)."""
+    boundary = hot_boundary()
+    typer.echo(f"Compacting entries before {boundary} (MOOD_HOT_DAYS={MOOD_HOT_DAYS}, MOOD_ARCHIVE={MOOD_ARCHIVE})")
+    if user_id:
+        entries = run(lambda db: compact_user(db, user_id, boundary))
+        typer.echo(f"Compacted {entries} entries for {user_id}")
+    else:
+        users, entries = run(lambda db: compact_all(db, boundary))
+        typer.echo(f"Compacted {entries} entries of {users} users")
+
+
+@cli.command("migrate-dates")
+def migrate_dates_command(
+    batch_size: int = typer.Option(MIGRATION_BATCH_SIZE, help="Documents per batch."),
+    restart: bool = typer.Option(False, help="Ignore saved checkpoints and scan from the start."),
+):
+    """Store mood and challenge timestamps as native datetimes with day buckets (resumable)."""
+    results = run(lambda db: migrate_dates(db, batch_size=batch_size, restart=restart))
+    for name in ("moods", "mood_archive", "challenges"):
+        typer.echo(f"{name}: converted {results[name]['updated']} of {results[name]['scanned']} scanned, "
+                   f"quarantined {results[name]['quarantined']}")
+    typer.echo(f"Dropped superseded indexes: {', '.join(results['dropped_indexes']) or 'none'}")
+
+
+
+@cli.command("import-data")
+def import_data(
+    kind: str = typer.Argument(..., help=f"What the file holds: {', '.join(IMPORT_KINDS)}."),
+    path: str = typer.Argument(..., help="CSV (with a header line) or NDJSON file."),
+    format: Optional[str] = typer.Option(None, help="csv or ndjson; by default taken from the file extension."),
+    batch_size: int = typer.Option(IMPORT_BATCH_SIZE, help="Rows per insert batch."),
+    errors: Optional[str] = typer.Option(None, help="Write every rejected row to this NDJSON file."),
+):
+    """Bulk import users or their mood/challenge history (see provisioning.py)."""
+    if kind not in IMPORT_KINDS:
+        raise typer.BadParameter(f"expected one of {', '.join(IMPORT_KINDS)}", param_hint="KIND")
+    format = format or os.path.splitext(path)[1].lstrip(".").lower()
+    if format not in IMPORT_FORMATS:
+        raise typer.BadParameter(f"expected one of {', '.join(IMPORT_FORMATS)}", param_hint="--format")
+
+    async def load(db):
+        # Conflict detection is the unique indexes' job, so they must exist first.
+        await db.create_indexes()
+        hasher = import_hasher(batch_size) if kind == "users" else None
+        try:
+            with open(path, encoding="utf-8-sig", newline="") as stream:
+                return await import_rows(db, kind, read_rows(stream, format), hasher=hasher,
+                                         batch_size=batch_size, max_errors=None if errors else 20)
+        finally:
+            if hasher is not None:
+                hasher.shutdown()
+    report = run(load)
+    typer.echo(f"Imported {report['created']} {kind} from {report['processed']} rows: "
+               f"{report['duplicates']} duplicates, {report['failed']} failed")
+    if errors:
+        with open(errors, "w") as out:
+            for error in report["errors"]:
+                out.write(json.dumps(error) + "\n")
+        typer.echo(f"Wrote {len(report['errors'])} rejected rows to {errors}")
+    else:
+        for error in report["errors"]:
+            typer.echo(f"  line {error['line']}: {error['error']}")
+        if report["errors_truncated"]:
+            typer.echo("  ... (use --errors PATH for the full list)")
+
+
+
+@cli.command("rollup-population")
+def rollup_population(rebuild: bool = typer.Option(False, help="Recompute from scratch instead of incrementally.")):
+    """Update the population-wide daily mood rollups behind the admin analytics (see population.py)."""
+    result = run(lambda db: update_population_rollups(db, rebuild=rebuild))
+    action = "Rebuilt" if result["rebuilt"] else "Updated"
+    typer.echo(f"{action} population rollups up to {result['watermark']}: {result['entries']} entries added, "
+               f"{result['users_moved']} users changed segment")
+
+
+if __name__ == "__main__":
+    cli()
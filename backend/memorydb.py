@@ -0,0 +1,637 @@
+"""Embedded in-process storage engine with a motor-compatible surface.
+
+Selected with ``STORAGE_ENGINE=memory``. It implements the subset of the
+motor client/collection API that the repositories in ``database.py`` use,
+so the same repository code runs against MongoDB or entirely in process.
+That lets CI, load tests and small single-process deployments run without
+a mongod. Data lives only as long as the process.
+
+Indexes declared through ``create_index`` are maintained for real:
+unique indexes are enforced (raising pymongo's ``DuplicateKeyError`` /
+``BulkWriteError``), partial ones (``partialFilterExpression``) only over
+the documents they cover, and every non-partial index is also a hash
+index on its leading field, so the per-user lookups on ``(user_id, date)``
+and ``(user_id, challenge_id)`` only ever touch that user's documents.
+
+All operations complete without awaiting, so each one is atomic with
+respect to other coroutines on the event loop.
+"""
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+DUPLICATE_KEY_ERROR = 11000
+
+_MISSING = object()
+
+
+def _clone(value):
+    if isinstance(value, dict):
+        return {key: _clone(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_clone(item) for item in value]
+    return value
+
+
+def _get(doc, path: str):
+    value = doc
+    for part in path.split("."):
+        if isinstance(value, dict):
+            value = value.get(part, _MISSING)
+        elif isinstance(value, list) and part.isdigit() and int(part) < len(value):
+            value = value[int(part)]
+        else:
+            return _MISSING
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+def _parent(doc, path: str, create: bool):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        child = doc.get(part)
+        if not isinstance(child, dict):
+            if not create:
+                return None, parts[-1]
+            child = doc[part] = {}
+        doc = child
+    return doc, parts[-1]
+
+
+def _set(doc, path: str, value):
+    parent, key = _parent(doc, path, create=True)
+    parent[key] = value
+
+
+def _unset(doc, path: str):
+    parent, key = _parent(doc, path, create=False)
+    if parent is not None:
+        parent.pop(key, None)
+
+
+def _compare(op):
+    def check(value, arg):
+        if value is _MISSING or value is None or arg is None:
+            return False
+        try:
+            return op(value, arg)
+        except TypeError:
+            return False
+    return check
+
+
+def _equals(value, arg):
+    if value is _MISSING:
+        return arg is None
+    if isinstance(value, list) and not isinstance(arg, list):
+        return arg in value
+    return value == arg
+
+
+_QUERY_OPERATORS = {
+    "$eq": _equals,
+    "$ne": lambda value, arg: not _equals(value, arg),
+    "$gt": _compare(lambda a, b: a > b),
+    "$gte": _compare(lambda a, b: a >= b),
+    "$lt": _compare(lambda a, b: a < b),
+    "$lte": _compare(lambda a, b: a <= b),
+    "$in": lambda value, arg: any(_equals(value, item) for item in arg),
+    "$nin": lambda value, arg: not any(_equals(value, item) for item in arg),
+    "$exists": lambda value, arg: (value is not _MISSING) == bool(arg),
+}
+
+
+def _is_operator_dict(value) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+
+def matches(doc: dict, query: Optional[dict]) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$nor":
+            if any(matches(doc, sub) for sub in condition):
+                return False
+        else:
+            value = _get(doc, key)
+            if _is_operator_dict(condition):
+                for op, arg in condition.items():
+                    if op not in _QUERY_OPERATORS:
+                        raise OperationFailure(f"unsupported query operator {op}")
+                    if not _QUERY_OPERATORS[op](value, arg):
+                        return False
+            elif not _equals(value, condition):
+                return False
+    return True
+
+
+# MongoDB's order across types, so mixed values sort (and compare in
+# $min/$max) like BSON instead of raising TypeError
+_TYPE_ORDER = ((int, float), str, dict, list, bytes, ObjectId, bool, datetime)
+
+
+def _sort_key(value):
+    # Missing and null come before every other value.
+    if value is _MISSING or value is None:
+        return (0, 0)
+    # bool is an int subclass, but sorts after every number
+    rank = 7 if isinstance(value, bool) else next(
+        (rank for rank, types in enumerate(_TYPE_ORDER, start=1) if isinstance(value, types)),
+        len(_TYPE_ORDER) + 1
+    )
+    return (rank, value)
+
+
+def _sort(docs: List[dict], spec) -> List[dict]:
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda doc: _sort_key(_get(doc, field)), reverse=direction < 0)
+    return docs
+
+
+def _normalize_sort(key_or_list, direction=None):
+    if isinstance(key_or_list, str):
+        return [(key_or_list, direction if direction is not None else 1)]
+    return list(key_or_list)
+
+
+def _project(doc: dict, projection: Optional[dict]) -> dict:
+    if not projection:
+        return _clone(doc)
+    include_id = projection.get("_id", 1)
+    fields = {key: value for key, value in projection.items() if key != "_id"}
+    if any(fields.values()):
+        result = {key: _clone(doc[key]) for key in fields if key in doc}
+        if include_id and "_id" in doc:
+            result["_id"] = doc["_id"]
+        return result
+    result = {key: _clone(value) for key, value in doc.items() if key not in fields}
+    if not include_id:
+        result.pop("_id", None)
+    return result
+
+
+def _apply_update(doc: dict, update: dict, inserting: bool):
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            current = _get(doc, path)
+            if op == "$set":
+                _set(doc, path, _clone(arg))
+            elif op == "$setOnInsert":
+                if inserting:
+                    _set(doc, path, _clone(arg))
+            elif op == "$unset":
+                _unset(doc, path)
+            elif op == "$inc":
+                _set(doc, path, (0 if current is _MISSING else current) + arg)
+            elif op == "$bit":
+                value = 0 if current is _MISSING else current
+                for operation, mask in arg.items():
+                    if operation == "and":
+                        value &= mask
+                    elif operation == "or":
+                        value |= mask
+                    elif operation == "xor":
+                        value ^= mask
+                    else:
+                        raise OperationFailure(f"unsupported $bit operation {operation}")
+                _set(doc, path, value)
+            elif op == "$max":
+                if current is _MISSING or _sort_key(arg) > _sort_key(current):
+                    _set(doc, path, _clone(arg))
+            elif op == "$min":
+                if current is _MISSING or _sort_key(arg) < _sort_key(current):
+                    _set(doc, path, _clone(arg))
+            elif op in ("$push", "$addToSet"):
+                array = [] if current is _MISSING else current
+                modifiers = arg if isinstance(arg, dict) and "$each" in arg else {"$each": [arg]}
+                items = [_clone(item) for item in modifiers["$each"]]
+                if op == "$addToSet":
+                    items = [item for item in items if item not in array]
+                position = modifiers.get("$position", len(array))
+                array = array[:position] + items + array[position:]
+                if "$slice" in modifiers:
+                    limit = modifiers["$slice"]
+                    array = array[:limit] if limit >= 0 else array[limit:]
+                _set(doc, path, array)
+            elif op == "$pull":
+                if isinstance(current, list):
+                    if isinstance(arg, dict) and not _is_operator_dict(arg):
+                        kept = [item for item in current
+                                if not (isinstance(item, dict) and matches(item, arg))]
+                    elif _is_operator_dict(arg):
+                        kept = [item for item in current if not matches({"v": item}, {"v": arg})]
+                    else:
+                        kept = [item for item in current if item != arg]
+                    _set(doc, path, kept)
+            else:
+                raise OperationFailure(f"unsupported update operator {op}")
+
+
+def _upsert_seed(query: dict) -> dict:
+    doc = {}
+    for key, value in query.items():
+        if not key.startswith("$") and not _is_operator_dict(value):
+            _set(doc, key, _clone(value))
+    return doc
+
+
+@dataclass
+class InsertOneResult:
+    inserted_id: Any
+
+
+@dataclass
+class InsertManyResult:
+    inserted_ids: List[Any]
+
+
+@dataclass
+class UpdateResult:
+    matched_count: int
+    modified_count: int
+    upserted_id: Any = None
+
+
+@dataclass
+class DeleteResult:
+    deleted_count: int
+
+
+class _Index:
+    def __init__(self, fields: List[str], unique: bool, partial: Optional[dict] = None):
+        self.fields = fields
+        self.unique = unique
+        self.partial = partial
+        self.leading: Dict[Any, set] = {}
+        self.keys: Dict[tuple, Any] = {}
+
+    def covers(self, doc) -> bool:
+        """Partial indexes only hold documents matching their filter."""
+        return self.partial is None or matches(doc, self.partial)
+
+    def key(self, doc):
+        return tuple(_sort_key(_get(doc, field)) for field in self.fields)
+
+    def _leading_value(self, doc):
+        value = _get(doc, self.fields[0])
+        return None if value is _MISSING else value
+
+    def check(self, doc, doc_id):
+        if self.unique and self.covers(doc):
+            owner = self.keys.get(self.key(doc), _MISSING)
+            if owner is not _MISSING and owner != doc_id:
+                raise DuplicateKeyError(
+                    f"E11000 duplicate key error index: {'_'.join(self.fields)}",
+                    DUPLICATE_KEY_ERROR
+                )
+
+    def add(self, doc, doc_id):
+        if not self.covers(doc):
+            return
+        try:
+            self.leading.setdefault(self._leading_value(doc), set()).add(doc_id)
+        except TypeError:
+            pass
+        if self.unique:
+            self.keys[self.key(doc)] = doc_id
+
+    def remove(self, doc, doc_id):
+        if not self.covers(doc):
+            return
+        try:
+            bucket = self.leading.get(self._leading_value(doc))
+        except TypeError:
+            bucket = None
+        if bucket is not None:
+            bucket.discard(doc_id)
+            if not bucket:
+                del self.leading[self._leading_value(doc)]
+        if self.unique and self.keys.get(self.key(doc)) == doc_id:
+            del self.keys[self.key(doc)]
+
+
+class MemoryCursor:
+    def __init__(self, collection, query, projection):
+        self.collection = collection
+        self.query = query
+        self.projection = projection
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._results = None
+
+    def sort(self, key_or_list, direction=None):
+        self._sort = _normalize_sort(key_or_list, direction)
+        return self
+
+    def skip(self, count: int):
+        self._skip = count
+        return self
+
+    def limit(self, count: int):
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int):
+        return self
+
+    def _evaluate(self):
+        if self._results is None:
+            docs = self.collection._select(self.query)
+            if self._sort:
+                _sort(docs, self._sort)
+            docs = docs[self._skip:]
+            if self._limit:
+                docs = docs[:self._limit]
+            self._results = iter([_project(doc, self.projection) for doc in docs])
+        return self._results
+
+    async def to_list(self, length: Optional[int] = None):
+        results = self._evaluate()
+        if length is None:
+            return list(results)
+        return [doc for _, doc in zip(range(length), results)]
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._evaluate())
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class MemoryCollection:
+    def __init__(self, name: str, database: "MemoryDatabase" = None):
+        self.name = name
+        self.database = database
+        self.documents: Dict[Any, dict] = {}
+        self.indexes: Dict[str, _Index] = {}
+
+    async def drop(self):
+        self.documents = {}
+        self.indexes = {}
+
+    async def rename(self, new_name: str, dropTarget: bool = False, **kwargs):
+        """Move every document and index to ``new_name`` in one step, leaving this collection empty."""
+        target = self.database[new_name]
+        if (target.documents or target.indexes) and not dropTarget:
+            raise OperationFailure("target namespace exists")
+        target.documents, target.indexes = self.documents, self.indexes
+        await self.drop()
+
+    # Index maintenance
+
+    async def create_index(self, keys, unique: bool = False, name: Optional[str] = None,
+                           partialFilterExpression: Optional[dict] = None, **kwargs):
+        spec = _normalize_sort(keys, 1)
+        fields = [field for field, _ in spec]
+        name = name or "_".join(f"{field}_{direction}" for field, direction in spec)
+        if name not in self.indexes:
+            index = _Index(fields, unique, partialFilterExpression)
+            for doc_id, doc in self.documents.items():
+                index.check(doc, doc_id)
+                index.add(doc, doc_id)
+            self.indexes[name] = index
+        return name
+
+    async def drop_index(self, name: str):
+        if self.indexes.pop(name, None) is None:
+            raise OperationFailure(f"index not found with name [{name}]")
+
+    def _candidates(self, query: dict):
+        doc_id = query.get("_id", _MISSING)
+        if doc_id is not _MISSING and not _is_operator_dict(doc_id):
+            doc = self.documents.get(doc_id)
+            return [doc] if doc is not None else []
+        best = None
+        for index in self.indexes.values():
+            if index.partial is not None:
+                continue
+            value = query.get(index.fields[0], _MISSING)
+            if value is _MISSING or _is_operator_dict(value):
+                continue
+            try:
+                bucket = index.leading.get(value, ())
+            except TypeError:
+                continue
+            if best is None or len(bucket) < len(best):
+                best = bucket
+        if best is None:
+            return list(self.documents.values())
+        return [self.documents[doc_id] for doc_id in best]
+
+    def _select(self, query: Optional[dict]) -> List[dict]:
+        query = query or {}
+        return [doc for doc in self._candidates(query) if matches(doc, query)]
+
+    def _store(self, doc: dict):
+        doc_id = doc["_id"]
+        if doc_id in self.documents:
+            raise DuplicateKeyError("E11000 duplicate key error index: _id_", DUPLICATE_KEY_ERROR)
+        for index in self.indexes.values():
+            index.check(doc, doc_id)
+        for index in self.indexes.values():
+            index.add(doc, doc_id)
+        self.documents[doc_id] = doc
+
+    def _replace(self, old: dict, new: dict):
+        doc_id = old["_id"]
+        for index in self.indexes.values():
+            index.remove(old, doc_id)
+        try:
+            for index in self.indexes.values():
+                index.check(new, doc_id)
+        except DuplicateKeyError:
+            for index in self.indexes.values():
+                index.add(old, doc_id)
+            raise
+        for index in self.indexes.values():
+            index.add(new, doc_id)
+        self.documents[doc_id] = new
+
+    def _discard(self, doc: dict):
+        doc_id = doc["_id"]
+        for index in self.indexes.values():
+            index.remove(doc, doc_id)
+        del self.documents[doc_id]
+
+    # Reads
+
+    def find(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        cursor = MemoryCursor(self, filter, projection)
+        if kwargs.get("sort"):
+            cursor.sort(kwargs["sort"])
+        if kwargs.get("limit"):
+            cursor.limit(kwargs["limit"])
+        return cursor
+
+    async def find_one(self, filter: Optional[dict] = None, projection: Optional[dict] = None, **kwargs):
+        docs = await self.find(filter, projection, **kwargs).limit(1).to_list(length=1)
+        return docs[0] if docs else None
+
+    async def count_documents(self, filter: Optional[dict] = None, **kwargs) -> int:
+        return len(self._select(filter))
+
+    async def distinct(self, key: str, filter: Optional[dict] = None):
+        values = []
+        for doc in self._select(filter):
+            value = _get(doc, key)
+            if value is not _MISSING and value not in values:
+                values.append(value)
+        return values
+
+    # Writes
+
+    async def insert_one(self, document: dict, **kwargs):
+        doc = _clone(document)
+        doc.setdefault("_id", str(uuid.uuid4()))
+        document.setdefault("_id", doc["_id"])
+        self._store(doc)
+        return InsertOneResult(doc["_id"])
+
+    async def insert_many(self, documents, ordered: bool = True, **kwargs):
+        inserted = []
+        errors = []
+        for index, document in enumerate(documents):
+            doc = _clone(document)
+            doc.setdefault("_id", str(uuid.uuid4()))
+            try:
+                self._store(doc)
+                inserted.append(doc["_id"])
+            except DuplicateKeyError as e:
+                errors.append({"index": index, "code": DUPLICATE_KEY_ERROR, "errmsg": str(e), "op": document})
+                if ordered:
+                    break
+        if errors:
+            raise BulkWriteError({
+                "writeErrors": errors,
+                "writeConcernErrors": [],
+                "nInserted": len(inserted),
+                "nUpserted": 0,
+                "nMatched": 0,
+                "nModified": 0,
+                "nRemoved": 0,
+                "upserted": [],
+            })
+        return InsertManyResult(inserted)
+
+    def _update(self, query, update, upsert: bool, many: bool, sort=None):
+        docs = self._select(query)
+        if sort:
+            _sort(docs, _normalize_sort(sort))
+        if not many:
+            docs = docs[:1]
+        if not docs:
+            if not upsert:
+                return UpdateResult(0, 0), None, None
+            doc = _upsert_seed(query)
+            _apply_update(doc, update, inserting=True)
+            doc.setdefault("_id", str(uuid.uuid4()))
+            self._store(doc)
+            return UpdateResult(0, 0, doc["_id"]), None, doc
+        modified = 0
+        before = after = None
+        for old in docs:
+            new = _clone(old)
+            _apply_update(new, update, inserting=False)
+            if new.get("_id") != old["_id"]:
+                raise OperationFailure("the _id field cannot be changed")
+            if new != old:
+                self._replace(old, new)
+                modified += 1
+            before, after = old, new
+        return UpdateResult(len(docs), modified), before, after
+
+    async def update_one(self, filter: dict, update, upsert: bool = False, **kwargs):
+        return self._update(filter, update, upsert, many=False)[0]
+
+    async def update_many(self, filter: dict, update, upsert: bool = False, **kwargs):
+        return self._update(filter, update, upsert, many=True)[0]
+
+    async def replace_one(self, filter: dict, replacement: dict, upsert: bool = False, **kwargs):
+        docs = self._select(filter)[:1]
+        new = _clone(replacement)
+        if not docs:
+            if not upsert:
+                return UpdateResult(0, 0)
+            for key, value in _upsert_seed(filter).items():
+                new.setdefault(key, value)
+            new.setdefault("_id", str(uuid.uuid4()))
+            self._store(new)
+            return UpdateResult(0, 0, new["_id"])
+        new["_id"] = docs[0]["_id"]
+        self._replace(docs[0], new)
+        return UpdateResult(1, 1)
+
+    async def find_one_and_update(self, filter: dict, update, projection: Optional[dict] = None,
+                                  sort=None, upsert: bool = False,
+                                  return_document=ReturnDocument.BEFORE, **kwargs):
+        result, before, after = self._update(filter, update, upsert, many=False, sort=sort)
+        doc = after if return_document == ReturnDocument.AFTER else before
+        return _project(doc, projection) if doc is not None else None
+
+    async def delete_one(self, filter: dict, **kwargs):
+        docs = self._select(filter)[:1]
+        for doc in docs:
+            self._discard(doc)
+        return DeleteResult(len(docs))
+
+    async def delete_many(self, filter: dict, **kwargs):
+        docs = self._select(filter)
+        for doc in docs:
+            self._discard(doc)
+        return DeleteResult(len(docs))
+
+
+class MemoryDatabase:
+    def __init__(self, name: str):
+        self.name = name
+        self._collections: Dict[str, MemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> MemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = MemoryCollection(name, self)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> MemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class _Admin:
+    async def command(self, name, *args, **kwargs):
+        return {"ok": 1.0}
+
+
+class MemoryClient:
+    """Drop-in for ``AsyncIOMotorClient`` backed by process memory."""
+
+    def __init__(self, *args, **kwargs):
+        self._databases: Dict[str, MemoryDatabase] = {}
+        self.admin = _Admin()
+
+    def __getitem__(self, name: str) -> MemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = MemoryDatabase(name)
+        return self._databases[name]
+
+    def __getattr__(self, name: str) -> MemoryDatabase:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+    def close(self):
+        pass
@@ -0,0 +1,302 @@
+"""Request and database instrumentation exported in Prometheus text format.
+
+Deliberately dependency-free: a metric is a dict from label values to a
+few numbers, updated from the event loop thread only, so recording costs a
+dict lookup and a bisect. ``/api/metrics`` renders every registered metric
+in the Prometheus 0.0.4 exposition format.
+
+Metrics are per process. Under the prefork server (``WEB_CONCURRENCY`` >
+1) every series carries a ``worker`` label, the worker's slot number
+(``WORKER_ID``, reused by its replacement), and each scrape of
+``/api/metrics`` is answered by whichever worker accepts the connection,
+so one scrape only ever shows one worker. Scrape each worker on its own
+port (run one worker per container) or aggregate with ``sum without
+(worker)`` over several scrapes; never compare raw scrapes to each other.
+"""
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, *extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs.extend(pair for pair in extra if pair)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Tuple, float] = {}
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self, worker: str = "") -> List[str]:
+        return self.header() + [
+            f"{self.name}{_labels(self.labelnames, labels, worker)} {value}"
+            for labels, value in self.values.items()
+        ]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = "gauge"
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) - amount
+
+    def set(self, *labels, value: float):
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[Tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            # Per-bucket counts (not cumulative), then sum and count.
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, worker: str = "") -> List[str]:
+        lines = self.header()
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, worker, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels, worker)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels, worker)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+        self.collectors: List[Callable[[], None]] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Run ``collector`` before each render, e.g. to copy cache stats into gauges."""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        for collector in self.collectors:
+            collector()
+        worker_id = os.environ.get("WORKER_ID")
+        worker = f'worker="{_escape(worker_id)}"' if worker_id is not None else ""
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render(worker))
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUESTS = registry.register(Counter(
+    "wellness_http_requests_total", "HTTP requests by route and status code.",
+    ("method", "route", "status")))
+HTTP_ERRORS = registry.register(Counter(
+    "wellness_http_request_errors_total", "HTTP requests that failed with a 5xx or an exception.",
+    ("method", "route")))
+HTTP_LATENCY = registry.register(Histogram(
+    "wellness_http_request_duration_seconds", "HTTP request latency by route.",
+    ("method", "route")))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "wellness_http_requests_in_flight", "HTTP requests currently being served."))
+DB_LATENCY = registry.register(Histogram(
+    "wellness_db_operation_duration_seconds", "Database operation latency by collection and operation.",
+    ("collection", "operation")))
+DB_ERRORS = registry.register(Counter(
+    "wellness_db_operation_errors_total", "Database operations that raised.",
+    ("collection", "operation")))
+CACHE_EVENTS = registry.register(Counter(
+    "wellness_cache_events_total", "In-process cache hits, misses and evictions.",
+    ("cache", "event")))
+CACHE_SIZE = registry.register(Gauge(
+    "wellness_cache_entries", "In-process cache entries.", ("cache",)))
+WRITE_QUEUE_DEPTH = registry.register(Gauge(
+    "wellness_write_behind_queue_depth", "Documents waiting in a write-behind queue.", ("collection",)))
+WRITE_QUEUE_WRITES = registry.register(Counter(
+    "wellness_write_behind_writes_total", "Write-behind documents written or failed.",
+    ("collection", "result")))
+
+ADMISSION_REJECTIONS = registry.register(Counter(
+    "wellness_admission_rejections_total", "Requests rejected by rate limits (429) or load shedding (503).",
+    ("reason",)))
+ADMISSION_QUEUE_DEPTH = registry.register(Gauge(
+    "wellness_admission_queue_depth", "Requests waiting for a slot under MAX_CONCURRENT_REQUESTS."))
+
+
+def watch_cache(name: str, cache):
+    def collect():
+        stats = cache.stats()
+        for event in ("hits", "misses", "evictions"):
+            CACHE_EVENTS.values[(name, event)] = stats[event]
+        CACHE_SIZE.set(name, value=stats["size"])
+    registry.add_collector(collect)
+
+
+def watch_write_queue(name: str, queue):
+    def collect():
+        WRITE_QUEUE_DEPTH.set(name, value=queue.depth)
+        WRITE_QUEUE_WRITES.values[(name, "written")] = queue.written
+        WRITE_QUEUE_WRITES.values[(name, "failed")] = queue.failed
+    registry.add_collector(collect)
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streaming responses pass straight through.
+
+    Routes are labeled by their path template (``/api/mood/history``), never
+    by the raw URL, which keeps label cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception:
+            status_code = 500
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            HTTP_LATENCY.observe(elapsed, method, path)
+            HTTP_REQUESTS.inc(method, path, status_code)
+            if status_code >= 500:
+                HTTP_ERRORS.inc(method, path)
+
+
+TIMED_OPERATIONS = frozenset({
+    "find_one", "count_documents", "distinct",
+    "insert_one", "insert_many", "update_one", "update_many", "replace_one",
+    "find_one_and_update", "delete_one", "delete_many", "bulk_write", "create_index",
+})
+
+
+class InstrumentedCursor:
+    """Times a ``find`` from the first fetch until the cursor is drained."""
+
+    def __init__(self, cursor, collection: str):
+        self.cursor = cursor
+        self.collection = collection
+        self.elapsed = 0.0
+
+    def __getattr__(self, name):
+        attr = getattr(self.cursor, name)
+        if name in ("sort", "limit", "skip", "batch_size"):
+            def chain(*args, **kwargs):
+                attr(*args, **kwargs)
+                return self
+            return chain
+        return attr
+
+    async def to_list(self, length=None):
+        started = time.perf_counter()
+        try:
+            return await self.cursor.to_list(length=length)
+        except Exception:
+            DB_ERRORS.inc(self.collection, "find")
+            raise
+        finally:
+            DB_LATENCY.observe(time.perf_counter() - started, self.collection, "find")
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        started = time.perf_counter()
+        try:
+            return await self.cursor.__anext__()
+        except StopAsyncIteration:
+            DB_LATENCY.observe(self.elapsed + time.perf_counter() - started, self.collection, "find")
+            raise
+        except Exception:
+            DB_ERRORS.inc(self.collection, "find")
+            raise
+        finally:
+            self.elapsed += time.perf_counter() - started
+
+
+class InstrumentedCollection:
+    """Wraps a motor (or embedded) collection and times every operation."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        self.collection_name = collection.name
+
+    def __getattr__(self, name):
+        attr = getattr(self.collection, name)
+        if name == "find":
+            def find(*args, **kwargs):
+                return InstrumentedCursor(attr(*args, **kwargs), self.collection_name)
+            return find
+        if name not in TIMED_OPERATIONS:
+            return attr
+
+        async def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await attr(*args, **kwargs)
+            except Exception:
+                DB_ERRORS.inc(self.collection_name, name)
+                raise
+            finally:
+                DB_LATENCY.observe(time.perf_counter() - started, self.collection_name, name)
+        return timed
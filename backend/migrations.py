@@ -0,0 +1,141 @@
+"""Resumable, batched data migrations run from ``manage.py``.
+
+Each migration walks a collection in ``_id`` order, ``batch_size``
+documents at a time, converts what needs converting with concurrent
+single-document updates, and records the last ``_id`` it finished in the
+``migrations`` collection. An interrupted run picks up from there, and
+conversions are idempotent, so re-running from scratch (``restart``) is
+always safe. Records written by the current code are already converted.
+
+Records a migration cannot convert (a mood dated ``"yesterday"``) are
+moved to the ``quarantine`` collection, with the collection they came
+from, instead of being left where every time-ordered read would trip
+over them. Once every collection is done the migration records itself
+as complete; ``pending_migrations`` is what the API checks at startup,
+and it serves nothing else until that list is empty.
+"""
+import asyncio
+from typing import Callable, Dict, List, Optional
+
+from leaderboard import rebuild_leaderboards
+from timestamps import mood_timestamp, parse_timestamp, utcnow
+
+MIGRATION_BATCH_SIZE = 1000
+
+# Checkpoint prefix of migrate-dates (2: quarantines unparsable records,
+# so databases migrated by the first version are scanned again)
+DATES_MIGRATION = "dates-2"
+
+
+def _timestamp_fields(doc: dict, *fields: str) -> Optional[dict]:
+    converted = {}
+    for field in fields:
+        value = doc.get(field)
+        if isinstance(value, str):
+            try:
+                converted[field] = parse_timestamp(value)
+            except ValueError:
+                return None
+    return converted
+
+
+def mood_date_fields(doc: dict) -> Optional[dict]:
+    """``$set`` fields moving a mood to native dates; empty if it already is, None if it cannot be."""
+    fields = _timestamp_fields(doc, "created_at")
+    if fields is None:
+        return None
+    if doc.get("day") is None:
+        try:
+            fields["date"], fields["day"] = mood_timestamp(doc.get("date"))
+        except (TypeError, ValueError):
+            return None
+    return fields
+
+
+def challenge_date_fields(doc: dict) -> Optional[dict]:
+    return _timestamp_fields(doc, "started_at", "completed_at")
+
+
+async def quarantine(db, name: str, collection, doc: dict):
+    """Move ``doc`` out of ``collection`` into ``quarantine``."""
+    await db.db["quarantine"].replace_one(
+        {"_id": f"{name}:{doc['_id']}"},
+        {"collection": name, "document": doc, "quarantined_at": utcnow()},
+        upsert=True
+    )
+    await collection.delete_one({"_id": doc["_id"]})
+
+
+async def migrate_collection(db, name: str, collection, convert: Callable[[dict], Optional[dict]],
+                             batch_size: int = MIGRATION_BATCH_SIZE, restart: bool = False) -> Dict[str, int]:
+    checkpoints = db.db["migrations"]
+    checkpoint_id = f"{DATES_MIGRATION}:{name}"
+    checkpoint = None if restart else await checkpoints.find_one({"_id": checkpoint_id})
+    last_id: Optional[str] = checkpoint["last_id"] if checkpoint else None
+    scanned = updated = quarantined = 0
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = await collection.find(query).sort("_id", 1).limit(batch_size).to_list(length=batch_size)
+        if not batch:
+            break
+        updates = [(doc, convert(doc)) for doc in batch]
+        await asyncio.gather(*(
+            quarantine(db, name, collection, doc) if fields is None
+            else collection.update_one({"_id": doc["_id"]}, {"$set": fields})
+            for doc, fields in updates if fields != {}
+        ))
+        scanned += len(batch)
+        updated += sum(1 for _, fields in updates if fields)
+        rejected = [doc for doc, fields in updates if fields is None]
+        quarantined += len(rejected)
+        users = {doc["user_id"] for doc in rejected if doc.get("user_id")}
+        if users:
+            await db.summaries.mark_stale(list(users))
+        last_id = batch[-1]["_id"]
+        await checkpoints.update_one({"_id": checkpoint_id}, {"$set": {"last_id": last_id}}, upsert=True)
+    return {"scanned": scanned, "updated": updated, "quarantined": quarantined}
+
+
+async def migrate_dates(db, batch_size: int = MIGRATION_BATCH_SIZE, restart: bool = False) -> Dict[str, dict]:
+    """Store mood and challenge timestamps as datetimes (plus mood day buckets), then swap indexes."""
+    results = {}
+    for name, collection, convert in (
+        ("moods", db.moods.collection, mood_date_fields),
+        ("mood_archive", db.mood_archive.collection, mood_date_fields),
+        ("challenges", db.challenges.collection, challenge_date_fields),
+    ):
+        results[name] = await migrate_collection(db, name, collection, convert, batch_size, restart)
+    await db.create_indexes()
+    results["dropped_indexes"] = await db.drop_legacy_indexes()
+    if results["challenges"]["quarantined"]:
+        await rebuild_leaderboards(db)
+    await mark_complete(db, "migrate-dates")
+    return results
+
+
+async def mark_complete(db, command: str):
+    await db.db["migrations"].update_one(
+        {"_id": command}, {"$set": {"completed_at": utcnow()}}, upsert=True
+    )
+
+
+async def pending_migrations(db) -> List[str]:
+    """``manage.py`` commands this database still needs before the API can serve it.
+
+    A database with nothing to migrate (a new one) is recorded as migrated.
+    """
+    pending = []
+    for command, collections in (
+        ("migrate-dates", (db.moods.collection, db.mood_archive.collection, db.challenges.collection)),
+        # The retired progress collection holds the points of old completions
+        ("migrate-challenges", (db.db["progress"],)),
+    ):
+        if await db.db["migrations"].find_one({"_id": command}):
+            continue
+        for collection in collections:
+            if await collection.find_one({}, {"_id": 1}) is not None:
+                pending.append(command)
+                break
+        else:
+            await mark_complete(db, command)
+    return pending
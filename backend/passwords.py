@@ -0,0 +1,80 @@
+"""Password hashing that stays off the event loop.
+
+Hashes use PBKDF2-SHA256 through passlib with a configurable number of
+rounds, 600,000 by default (current OWASP guidance). Legacy unsalted
+SHA-256 hashes still verify; they and hashes with fewer rounds are
+replaced on the next login (``verify`` returns the new hash).
+
+Each hash or verify runs on a small dedicated thread pool (the OpenSSL
+PBKDF2 implementation releases the GIL). At most ``max_pending`` may be
+queued; a caller waiting longer than ``queue_timeout`` for a slot gets
+``HasherBusy``.
+"""
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+PASSWORD_HASH_ROUNDS = int(os.environ.get('PASSWORD_HASH_ROUNDS', '600000'))
+PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', '64'))
+PASSWORD_HASH_QUEUE_TIMEOUT = float(os.environ.get('PASSWORD_HASH_QUEUE_TIMEOUT', '2'))
+
+LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+
+class HasherBusy(Exception):
+    """Raised when no hashing slot frees up within the queue timeout."""
+
+
+class PasswordHasher:
+    def __init__(self, rounds: int = PASSWORD_HASH_ROUNDS, workers: int = PASSWORD_HASH_WORKERS,
+                 max_pending: int = PASSWORD_HASH_MAX_PENDING,
+                 queue_timeout: float = PASSWORD_HASH_QUEUE_TIMEOUT):
+        self.context = CryptContext(
+            schemes=["pbkdf2_sha256"],
+            pbkdf2_sha256__default_rounds=rounds,
+            # Without a floor passlib never reports weaker hashes as outdated.
+            pbkdf2_sha256__min_rounds=rounds,
+        )
+        # workers=0 hashes inline on the event loop; only useful for comparison.
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix="password-hash") if workers else None
+        self.slots = asyncio.Semaphore(max_pending)
+        self.queue_timeout = queue_timeout
+
+    async def _run(self, fn, *args):
+        try:
+            await asyncio.wait_for(self.slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise HasherBusy()
+        try:
+            if self.executor is None:
+                return fn(*args)
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    def _verify_and_update(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        if LEGACY_SHA256.match(hashed):
+            legacy = hashlib.sha256(password.encode()).hexdigest()
+            if not hmac.compare_digest(legacy, hashed):
+                return False, None
+            return True, self.context.hash(password)
+        return self.context.verify_and_update(password, hashed)
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Return ``(valid, new_hash)``; ``new_hash`` is set when the stored
+        hash is legacy or uses outdated rounds and should be replaced."""
+        return await self._run(self._verify_and_update, password, hashed)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
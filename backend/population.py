@@ -0,0 +1,309 @@
+"""Population-wide mood rollups behind the admin analytics endpoints.
+
+The rollups hold, per day bucket, the ``count``/``sum``/``sum_sq`` and
+value histogram of every mood entry, split into participation segments by
+where the author stood with challenges on that day: ``none`` (no challenge
+started yet), ``started`` (started, none completed yet) or ``completed``.
+A second set of documents holds the same totals by offset in days from
+the author's first challenge completion, up to ``COMPLETION_WINDOW_DAYS``
+either side. Reading a year of any view is a few hundred small
+documents, however many users there are; the endpoints turn them into
+statistics with vectorized pandas/NumPy reductions.
+
+``update_population_rollups`` (``python manage.py rollup-population``,
+e.g. every few minutes) is incremental. Each run covers what was written
+after the previous run's watermark, up to ``POPULATION_ROLLUP_LAG_SECONDS``
+ago so entries still held by write-behind queues are not passed over: new
+entries are added to their segment, and the earlier entries of users who
+started or completed their first challenge in the meantime are moved to
+their new segment and offset. A run that stopped while applying its
+increments, or a bulk challenge import, makes the next run rebuild from
+scratch. Rebuilds read ``moods`` and ``mood_archive``, so with
+``MOOD_ARCHIVE=delete`` they only cover entries that are still stored.
+Run one job at a time.
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from timestamps import bucket_day, day_bucket, parse_timestamp, utcnow
+
+POPULATION_ROLLUP_LAG_SECONDS = float(os.environ.get('POPULATION_ROLLUP_LAG_SECONDS', '300'))
+POPULATION_BATCH_SIZE = int(os.environ.get('POPULATION_BATCH_SIZE', '1000'))
+COMPLETION_WINDOW_DAYS = int(os.environ.get('COMPLETION_WINDOW_DAYS', '90'))
+
+SEGMENTS = ("none", "started", "completed")
+
+# (first challenge start, first challenge completion) as day buckets
+Milestones = Tuple[Optional[int], Optional[int]]
+NO_MILESTONES: Milestones = (None, None)
+
+
+def milestones(attempts: Iterable[dict], until: Optional[datetime]) -> Milestones:
+    """A user's milestones counting only what happened by ``until`` (None: nothing)."""
+    started = completed = None
+    if until is None:
+        return NO_MILESTONES
+    for attempt in attempts:
+        for field in ("started_at", "completed_at"):
+            value = attempt.get(field)
+            if value is None:
+                continue
+            moment = parse_timestamp(value)
+            if moment > until:
+                continue
+            day = day_bucket(moment.date())
+            if field == "started_at":
+                started = day if started is None else min(started, day)
+            else:
+                completed = day if completed is None else min(completed, day)
+    return started, completed
+
+
+def segment(day: int, user_milestones: Milestones) -> str:
+    started, completed = user_milestones
+    if completed is not None and day >= completed:
+        return "completed"
+    if started is not None and day >= started:
+        return "started"
+    return "none"
+
+
+class Increments:
+    """``$inc`` updates for ``PopulationRollupRepository.apply``, summed in memory."""
+
+    def __init__(self, window: int = COMPLETION_WINDOW_DAYS):
+        self.window = window
+        self.docs: Dict[str, Tuple[dict, dict]] = {}
+        self.entries = 0
+
+    def add(self, mood: dict, user_milestones: Milestones, sign: int = 1):
+        day, value = mood.get("day"), mood.get("mood")
+        if day is None or isinstance(value, bool) or not isinstance(value, (int, float)):
+            return
+        self.entries += sign
+        self._add(f"day:{day}", {"kind": "day", "day": day}, segment(day, user_milestones) + ".", value, sign)
+        completed = user_milestones[1]
+        if completed is not None and abs(day - completed) <= self.window:
+            offset = day - completed
+            self._add(f"offset:{offset}", {"kind": "offset", "offset": offset}, "", value, sign)
+
+    def move(self, mood: dict, old: Milestones, new: Milestones):
+        self.add(mood, old, -1)
+        self.add(mood, new)
+
+    def _add(self, doc_id: str, seed: dict, prefix: str, value, sign: int):
+        fields = self.docs.setdefault(doc_id, (seed, {}))[1]
+        for field, amount in (
+            ("count", 1),
+            ("sum", value),
+            ("sum_sq", value * value),
+            (f"histogram.{str(value).replace('.', '_')}", 1),
+        ):
+            path = prefix + field
+            fields[path] = fields.get(path, 0) + sign * amount
+
+    def pending(self) -> Dict[str, Tuple[dict, dict]]:
+        """Updates left after moves that cancel out are dropped."""
+        pending = {}
+        for doc_id, (seed, fields) in self.docs.items():
+            fields = {path: amount for path, amount in fields.items() if amount}
+            if fields:
+                pending[doc_id] = (seed, fields)
+        return pending
+
+
+async def load_milestones(db, user_ids: List[str], *moments: Optional[datetime]) -> Dict[str, List[Milestones]]:
+    """``{user_id: [milestones as of each moment]}``; users without attempts are left out."""
+    attempts: Dict[str, List[dict]] = {}
+    async for attempt in db.challenges.iter_for_users(user_ids):
+        attempts.setdefault(attempt["user_id"], []).append(attempt)
+    return {
+        user_id: [milestones(user_attempts, moment) for moment in moments]
+        for user_id, user_attempts in attempts.items()
+    }
+
+
+def _batches(items: List[str], size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+async def _rebuild(db, increments: Increments, watermark: datetime, batch_size: int):
+    user_ids = [user["_id"] async for user in db.users.iter_ids()]
+    for batch in _batches(user_ids, batch_size):
+        current = await load_milestones(db, batch, watermark)
+        for moods in (db.moods, db.mood_archive):
+            async for mood in moods.iter_for_users(batch):
+                created_at = mood.get("created_at")
+                if isinstance(created_at, datetime) and created_at > watermark:
+                    continue  # the next run's
+                increments.add(mood, current.get(mood["user_id"], [NO_MILESTONES])[0])
+
+
+async def _update(db, increments: Increments, previous: datetime, watermark: datetime, batch_size: int) -> int:
+    """Add entries written since ``previous``; returns how many users changed segment."""
+    new_moods: Dict[str, List[dict]] = {}
+    async for mood in db.moods.iter_created(previous, watermark):
+        new_moods.setdefault(mood["user_id"], []).append(mood)
+    changed = {attempt["user_id"] async for attempt in db.challenges.iter_changed(previous, watermark)}
+
+    moved = 0
+    for batch in _batches(sorted(changed | set(new_moods)), batch_size):
+        history = await load_milestones(db, batch, previous, watermark)
+        moving = [user_id for user_id, (old, new) in history.items() if user_id in changed and old != new]
+        moved += len(moving)
+        if moving:
+            async for mood in db.moods.iter_for_users(moving):
+                created_at = mood.get("created_at")
+                if isinstance(created_at, datetime) and created_at > previous:
+                    continue  # added below, on the new milestones
+                old, new = history[mood["user_id"]]
+                increments.move(mood, old, new)
+        for user_id in batch:
+            current = history.get(user_id, [NO_MILESTONES, NO_MILESTONES])[1]
+            for mood in new_moods.get(user_id, ()):
+                increments.add(mood, current)
+    return moved
+
+
+async def update_population_rollups(db, rebuild: bool = False, now: Optional[datetime] = None,
+                                    batch_size: int = POPULATION_BATCH_SIZE) -> dict:
+    """Bring the population rollups up to ``now`` minus the lag; returns what the run did."""
+    watermark = (now or utcnow()) - timedelta(seconds=POPULATION_ROLLUP_LAG_SECONDS)
+    state = await db.population_rollups.get_state() or {}
+    previous = state.get("watermark")
+    rebuild = rebuild or previous is None or state.get("rebuild") or state.get("applying")
+    if not rebuild and watermark <= previous:
+        return {"rebuilt": False, "watermark": previous, "entries": 0, "users_moved": 0}
+
+    increments = Increments()
+    # Marks the rollups as needing a rebuild until the run has fully applied.
+    await db.population_rollups.set_state({"applying": True})
+    if rebuild:
+        await db.population_rollups.clear()
+        await _rebuild(db, increments, watermark, batch_size)
+        moved = 0
+    else:
+        moved = await _update(db, increments, previous, watermark, batch_size)
+    await db.population_rollups.apply(increments.pending())
+    await db.population_rollups.set_state({
+        "watermark": watermark,
+        "applying": False,
+        "rebuild": False,
+        "updated_at": utcnow(),
+    })
+    return {"rebuilt": bool(rebuild), "watermark": watermark, "entries": increments.entries, "users_moved": moved}
+
+
+def _stats(frame: pd.DataFrame) -> pd.DataFrame:
+    """Add ``mean`` and ``stddev`` columns computed from ``count``/``sum``/``sum_sq``."""
+    count = frame["count"].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = frame["sum"].to_numpy(dtype=float) / count
+        variance = frame["sum_sq"].to_numpy(dtype=float) / count - mean ** 2
+    frame = frame.assign(mean=mean.round(3), stddev=np.sqrt(np.clip(variance, 0, None)).round(3))
+    return frame[count > 0]
+
+
+def _histogram_columns(frame: pd.DataFrame) -> List[str]:
+    return sorted((column for column in frame.columns if column.startswith("h:")),
+                  key=lambda column: float(column[2:].replace("_", ".")))
+
+
+def _totals(row) -> dict:
+    return {
+        "entries": int(row["count"]),
+        "mean": float(row["mean"]),
+        "stddev": float(row["stddev"]),
+    }
+
+
+def _histogram(row, columns: List[str]) -> dict:
+    return {column[2:].replace("_", "."): int(row[column]) for column in columns if row[column]}
+
+
+async def load_days(db, first: date, last: date) -> pd.DataFrame:
+    """One row per (day, segment) in ``[first, last]``: totals and ``h:<value>`` histogram columns."""
+    records = []
+    async for doc in db.population_rollups.iter_days(day_bucket(first), day_bucket(last)):
+        for name in SEGMENTS:
+            totals = doc.get(name)
+            if not totals:
+                continue
+            record = {
+                "day": doc["day"],
+                "segment": name,
+                "count": totals.get("count", 0),
+                "sum": totals.get("sum", 0),
+                "sum_sq": totals.get("sum_sq", 0),
+            }
+            for value, count in totals.get("histogram", {}).items():
+                record[f"h:{value}"] = count
+            records.append(record)
+    if not records:
+        return pd.DataFrame(columns=["day", "segment", "count", "sum", "sum_sq"])
+    return pd.DataFrame.from_records(records).fillna(0)
+
+
+async def load_offsets(db, window: int) -> pd.DataFrame:
+    records = [
+        {"offset": doc["offset"], "count": doc.get("count", 0), "sum": doc.get("sum", 0),
+         "sum_sq": doc.get("sum_sq", 0)}
+        async for doc in db.population_rollups.iter_offsets(window)
+    ]
+    return pd.DataFrame.from_records(records, columns=["offset", "count", "sum", "sum_sq"])
+
+
+def daily_view(frame: pd.DataFrame) -> dict:
+    """Average mood per day over everyone, and over the whole range."""
+    columns = _histogram_columns(frame)
+    daily = _stats(frame.drop(columns="segment").groupby("day").sum().sort_index())
+    overall = _stats(daily.sum().to_frame().T)
+    return {
+        "days": [
+            {"date": bucket_day(day).isoformat(), **_totals(row), "histogram": _histogram(row, columns)}
+            for day, row in daily.iterrows()
+        ],
+        "overall": {**_totals(overall.iloc[0]), "histogram": _histogram(overall.iloc[0], columns)}
+        if len(overall) else None,
+    }
+
+
+def participation_view(frame: pd.DataFrame) -> dict:
+    """Mood distribution per participation segment, overall and per day."""
+    columns = _histogram_columns(frame)
+    segments = _stats(frame.drop(columns="day").groupby("segment").sum())
+    means = _stats(frame.set_index(["day", "segment"])).loc[:, "mean"].unstack("segment")
+    return {
+        "segments": {
+            name: {**_totals(segments.loc[name]), "histogram": _histogram(segments.loc[name], columns)}
+            for name in SEGMENTS if name in segments.index
+        },
+        "daily_means": [
+            {"date": bucket_day(day).isoformat(),
+             **{name: float(row[name]) for name in SEGMENTS if name in row and not np.isnan(row[name])}}
+            for day, row in means.sort_index().iterrows()
+        ],
+    }
+
+
+def completion_view(frame: pd.DataFrame) -> dict:
+    """Mood by day relative to users' first challenge completion, and before vs after."""
+    offsets = _stats(frame.set_index("offset").sort_index())
+    index = offsets.index.to_numpy()
+    periods = {}
+    for name, mask in (("before", index < 0), ("after", index > 0)):
+        totals = _stats(offsets.loc[mask, ["count", "sum", "sum_sq"]].sum().to_frame().T)
+        periods[name] = _totals(totals.iloc[0]) if len(totals) else None
+    change = None
+    if periods["before"] and periods["after"]:
+        change = round(periods["after"]["mean"] - periods["before"]["mean"], 3)
+    return {
+        "offsets": [{"offset": int(offset), **_totals(row)} for offset, row in offsets.iterrows()],
+        **periods,
+        "change": change,
+    }
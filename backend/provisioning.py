@@ -0,0 +1,343 @@
+"""Bulk import of users and their mood/challenge history.
+
+Rows come from CSV (header line) or NDJSON (one object per line) and are
+written ``batch_size`` at a time with unordered ``insert_many`` calls, so
+one bad row never holds up the rest of its batch. Conflicts are left to
+the unique indexes instead of checked up front: a user whose username or
+email is taken, or a row imported before, comes back as a duplicate. Every
+rejected row is reported with its line number.
+
+``users`` rows: ``username``, ``email`` and either ``password`` (hashed
+here, a batch at a time in parallel on a dedicated pool) or
+``password_hash`` (an existing PBKDF2-SHA256 or legacy SHA-256 hash, taken
+as is); optional ``created_at``.
+
+``moods`` rows: ``username``, ``mood``, ``date`` and optional ``clientId``.
+``challenges`` rows: ``username``, ``challenge_id``, ``started_at`` and
+optional ``completed_at`` and ``points``. History rows get ids derived
+from their content (from ``clientId`` the same way bulk saves do), so
+re-running an import only adds what is missing. The summaries of users
+who got history are marked stale and rebuild on their next read;
+imported completions are added to the leaderboards, and importing any
+challenges has the next population rollup run start over.
+
+The unique indexes must exist before an import: the API builds them at
+startup, ``manage.py import-data`` before it starts.
+"""
+import asyncio
+import csv
+import json
+import os
+import uuid
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from database import CHALLENGE_POINTS, DUPLICATE_KEY_ERROR, MOOD_CLIENT_ID_NAMESPACE
+from leaderboard import add_completions
+from passwords import LEGACY_SHA256, PasswordHasher
+from rollups import compacted_ids
+from timestamps import api_timestamp, mood_timestamp, parse_timestamp, utcnow
+
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '1000'))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+IMPORT_HASH_WORKERS = int(os.environ.get('IMPORT_HASH_WORKERS', str(os.cpu_count() or 1)))
+
+IMPORT_KINDS = ("users", "moods", "challenges")
+IMPORT_FORMATS = ("csv", "ndjson")
+
+# Namespace for ids of imported history rows without a clientId
+IMPORT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "daily-wellness/import")
+
+
+class RowError(ValueError):
+    """A row that cannot be imported; the message is reported for its line."""
+
+
+def import_hasher(batch_size: int = IMPORT_BATCH_SIZE) -> PasswordHasher:
+    """Hasher for imports: a whole batch may queue, and nothing is shed."""
+    return PasswordHasher(workers=IMPORT_HASH_WORKERS, max_pending=batch_size, queue_timeout=None)
+
+
+def read_rows(stream: TextIO, format: str) -> Iterator[Tuple[int, Optional[dict], Optional[str]]]:
+    """``(line, row, error)`` for each record of ``stream``; ``row`` is None on parse errors."""
+    if format not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown format {format!r}, expected one of {IMPORT_FORMATS}")
+    if format == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            if None in row:
+                yield reader.line_num, None, "Too many fields"
+            else:
+                yield reader.line_num, row, None
+        return
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            yield line, None, f"Invalid JSON: {e}"
+            continue
+        if isinstance(row, dict):
+            yield line, row, None
+        else:
+            yield line, None, "Expected a JSON object"
+
+
+def _text(row: dict, field: str, required: bool = True) -> Optional[str]:
+    value = row.get(field)
+    if value is None or value == "":
+        if required:
+            raise RowError(f"Missing {field}")
+        return None
+    if not isinstance(value, str):
+        raise RowError(f"Invalid {field}")
+    return value
+
+
+def _integer(row: dict, field: str, default: Optional[int] = None) -> int:
+    value = row.get(field)
+    if value is None or value == "":
+        if default is None:
+            raise RowError(f"Missing {field}")
+        return default
+    if isinstance(value, str):
+        try:
+            return int(value)
+        except ValueError:
+            raise RowError(f"Invalid {field}")
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise RowError(f"Invalid {field}")
+    return value
+
+
+def _timestamp(row: dict, field: str, required: bool = True):
+    value = _text(row, field, required)
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise RowError(f"Invalid {field}")
+
+
+def _duplicate_detail(error: dict) -> str:
+    fields = list(error.get("keyPattern") or ())
+    if not fields:
+        message = error.get("errmsg", "")
+        fields = [field for field in ("username", "email") if field in message]
+    if "username" in fields:
+        return "Username already exists"
+    if "email" in fields:
+        return "Email already exists"
+    return "Already imported"
+
+
+class ImportReport:
+    def __init__(self, kind: str, max_errors: Optional[int]):
+        self.kind = kind
+        self.max_errors = max_errors
+        self.processed = self.created = self.duplicates = self.failed = 0
+        self.errors: List[dict] = []
+        self.errors_truncated = False
+
+    def reject(self, line: int, error: str, duplicate: bool = False):
+        if duplicate:
+            self.duplicates += 1
+        else:
+            self.failed += 1
+        if self.max_errors is not None and len(self.errors) >= self.max_errors:
+            self.errors_truncated = True
+        else:
+            self.errors.append({"line": line, "error": error})
+
+    def to_dict(self) -> dict:
+        return {
+            "kind": self.kind,
+            "processed": self.processed,
+            "created": self.created,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.errors_truncated,
+        }
+
+
+class Importer:
+    """Runs one import; ``import_rows`` is the entry point."""
+
+    def __init__(self, db, kind: str, hasher: Optional[PasswordHasher], report: ImportReport):
+        self.db = db
+        self.kind = kind
+        self.hasher = hasher
+        self.report = report
+        self.touched_users = set()
+        self.completions: List[dict] = []
+
+    async def run_batch(self, batch: List[Tuple[int, dict]]):
+        if self.kind == "users":
+            await self.users(batch)
+            return
+        usernames = {row["username"] for _, row in batch if isinstance(row.get("username"), str)}
+        user_ids = await self.db.users.ids_by_username(usernames) if usernames else {}
+        build = self.mood if self.kind == "moods" else self.challenge
+        documents, lines, usernames = [], [], []
+        for line, row in batch:
+            try:
+                username = _text(row, "username")
+                if username not in user_ids:
+                    raise RowError("Unknown username")
+                documents.append(build(user_ids[username], row))
+                lines.append(line)
+                usernames.append(username)
+            except RowError as e:
+                self.report.reject(line, str(e))
+        if self.kind == "moods":
+            documents, lines, usernames = await self.drop_compacted(documents, lines, usernames)
+        repository = self.db.moods if self.kind == "moods" else self.db.challenges
+        errors = await repository.add_many(documents)
+        for offset, (line, document) in enumerate(zip(lines, documents)):
+            code = errors.get(offset)
+            if code is None:
+                self.report.created += 1
+                self.touched_users.add(document["user_id"])
+                if document.get("status") == "completed":
+                    self.completions.append({**document, "username": usernames[offset]})
+            elif code == DUPLICATE_KEY_ERROR:
+                detail = "Challenge already started" if document.get("status") == "started" else "Already imported"
+                self.report.reject(line, detail, duplicate=True)
+            else:
+                self.report.reject(line, f"Write error {code}")
+
+    async def drop_compacted(self, documents: List[dict], lines: List[int], usernames: List[str]):
+        """Reject entries imported before and since compacted out of ``moods``; returns the rest."""
+        compacted = await compacted_ids(
+            self.db, list({document["user_id"] for document in documents}),
+            [document["_id"] for document in documents]
+        )
+        kept = []
+        for offset, document in enumerate(documents):
+            if document["_id"] in compacted:
+                self.report.reject(lines[offset], "Already imported", duplicate=True)
+            else:
+                kept.append(offset)
+        return ([documents[offset] for offset in kept], [lines[offset] for offset in kept],
+                [usernames[offset] for offset in kept])
+
+    async def user(self, row: dict) -> dict:
+        user = {
+            "_id": str(uuid.uuid4()),
+            "username": _text(row, "username"),
+            "email": _text(row, "email"),
+        }
+        created_at = _timestamp(row, "created_at", required=False)
+        user["created_at"] = (created_at or utcnow()).isoformat()
+        password_hash = _text(row, "password_hash", required=False)
+        if password_hash is not None:
+            if not (LEGACY_SHA256.match(password_hash) or self.hasher.context.identify(password_hash)):
+                raise RowError("Unsupported password_hash")
+            user["password"] = password_hash
+        else:
+            user["password"] = await self.hasher.hash(_text(row, "password"))
+        return user
+
+    async def users(self, batch: List[Tuple[int, dict]]):
+        built = await asyncio.gather(*(self.user(row) for _, row in batch), return_exceptions=True)
+        users, lines = [], []
+        for (line, _), user in zip(batch, built):
+            if isinstance(user, RowError):
+                self.report.reject(line, str(user))
+            elif isinstance(user, BaseException):
+                raise user
+            else:
+                users.append(user)
+                lines.append(line)
+        errors = await self.db.users.create_many(users)
+        for offset, line in enumerate(lines):
+            error = errors.get(offset)
+            if error is None:
+                self.report.created += 1
+            elif error.get("code") == DUPLICATE_KEY_ERROR:
+                self.report.reject(line, _duplicate_detail(error), duplicate=True)
+            else:
+                self.report.reject(line, f"Write error {error.get('code')}")
+
+    def mood(self, user_id: str, row: dict) -> dict:
+        written = _text(row, "date")
+        try:
+            date, day = mood_timestamp(written)
+        except ValueError:
+            raise RowError("Invalid date")
+        client_id = _text(row, "clientId", required=False)
+        if client_id is not None:
+            mood_id = uuid.uuid5(MOOD_CLIENT_ID_NAMESPACE, f"{user_id}:{client_id}")
+        else:
+            mood_id = uuid.uuid5(IMPORT_ID_NAMESPACE, f"mood:{user_id}:{api_timestamp(date)}")
+        return {
+            "_id": str(mood_id),
+            "user_id": user_id,
+            "mood": _integer(row, "mood"),
+            "date": date,
+            "day": day,
+            "created_at": utcnow()
+        }
+
+    def challenge(self, user_id: str, row: dict) -> dict:
+        challenge_id = _integer(row, "challenge_id")
+        started_at = _timestamp(row, "started_at")
+        completed_at = _timestamp(row, "completed_at", required=False)
+        entry = {
+            "_id": str(uuid.uuid5(
+                IMPORT_ID_NAMESPACE, f"challenge:{user_id}:{challenge_id}:{api_timestamp(started_at)}"
+            )),
+            "user_id": user_id,
+            "challenge_id": challenge_id,
+            "started_at": started_at,
+            "status": "started"
+        }
+        if completed_at is not None:
+            if completed_at < started_at:
+                raise RowError("completed_at is before started_at")
+            entry["status"] = "completed"
+            entry["completed_at"] = completed_at
+            entry["points"] = _integer(row, "points", CHALLENGE_POINTS)
+        return entry
+
+    async def finish(self):
+        if self.touched_users:
+            await self.db.summaries.mark_stale(list(self.touched_users))
+        if self.completions:
+            await add_completions(self.db, self.completions)
+        if self.kind == "challenges" and self.report.created:
+            # Backdated attempts change segments the rollups cannot patch up.
+            await self.db.population_rollups.request_rebuild()
+
+
+async def import_rows(db, kind: str, rows: Iterable[Tuple[int, Optional[dict], Optional[str]]],
+                      hasher: Optional[PasswordHasher] = None, batch_size: int = IMPORT_BATCH_SIZE,
+                      max_errors: Optional[int] = IMPORT_MAX_ERRORS) -> dict:
+    """Import ``rows`` (as from ``read_rows``) of ``kind``; returns the report.
+
+    ``hasher`` is required for ``users`` and should allow ``batch_size``
+    pending hashes (see ``import_hasher``). ``max_errors=None`` keeps every
+    row error in the report.
+    """
+    if kind not in IMPORT_KINDS:
+        raise ValueError(f"Unknown import kind {kind!r}, expected one of {IMPORT_KINDS}")
+    if kind == "users" and hasher is None:
+        raise ValueError("Importing users needs a password hasher")
+    report = ImportReport(kind, max_errors)
+    importer = Importer(db, kind, hasher, report)
+    batch: List[Tuple[int, dict]] = []
+    for line, row, error in rows:
+        report.processed += 1
+        if error is not None:
+            report.reject(line, error)
+            continue
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            await importer.run_batch(batch)
+            batch = []
+    if batch:
+        await importer.run_batch(batch)
+    await importer.finish()
+    return report.to_dict()
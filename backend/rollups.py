@@ -0,0 +1,167 @@
+"""Hot/cold tiering of mood entries with monthly rollups.
+
+Entries dated before the hot boundary (``MOOD_HOT_DAYS`` back, rounded
+down to the first of that month) are compacted out of ``moods`` into one
+``mood_rollups`` document per user and month: entry count, sum, histogram
+of mood values, and per-day count/sum/sum of squares. With
+``MOOD_ARCHIVE=archive`` (default) the raw rows move to ``mood_archive``,
+which only history pages reaching past the boundary and exports read;
+with ``MOOD_ARCHIVE=delete`` they are dropped and history ends at the
+boundary. Either way ``moods`` and its index only hold the recent window,
+while summary rebuilds (counts, streaks) and trends read the rollups in
+place of the cold rows, so those keep covering the whole history.
+
+Compaction is resumable: a rollup lists the ids it has absorbed under
+``pending`` until they are deleted from ``moods``, so the next run finishes
+an interrupted one instead of counting its entries twice. Run one
+compactor at a time (``python manage.py compact-moods``, e.g. nightly),
+with the same ``MOOD_HOT_DAYS``/``MOOD_ARCHIVE`` as the API. Lowering
+``MOOD_HOT_DAYS`` is always safe; raising it hides archived entries newer
+than the new boundary from history until the old boundary has passed.
+Bulk saves and imports check ``compacted_ids`` so that entries sent
+again after compaction are reported as duplicates instead of stored twice.
+"""
+import os
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from memorydb import DUPLICATE_KEY_ERROR
+from timestamps import bucket_day
+
+MOOD_HOT_DAYS = int(os.environ.get('MOOD_HOT_DAYS', '365'))
+MOOD_ARCHIVE = os.environ.get('MOOD_ARCHIVE', 'archive')
+
+MOOD_ARCHIVE_MODES = ("archive", "delete")
+
+
+def hot_boundary(today: Optional[date] = None, hot_days: int = MOOD_HOT_DAYS) -> datetime:
+    """Time (UTC) before which entries are cold."""
+    day = (today or datetime.now().date()) - timedelta(days=hot_days)
+    return datetime.combine(day.replace(day=1), datetime.min.time())
+
+
+def month_rollups(rows) -> Dict[str, Tuple[dict, List[str]]]:
+    """Group raw entries by month: ``{"YYYY-MM": (rollup, ids)}``.
+
+    Entries without a day bucket or a numeric mood are left out (and so
+    stay in ``moods``).
+    """
+    months = {}
+    for row in rows:
+        mood = row.get("mood")
+        if row.get("day") is None or isinstance(mood, bool) or not isinstance(mood, (int, float)):
+            continue
+        day = bucket_day(row["day"])
+        rollup, ids = months.setdefault(
+            day.strftime("%Y-%m"),
+            ({"count": 0, "sum": 0, "histogram": {}, "days": {}}, [])
+        )
+        rollup["count"] += 1
+        rollup["sum"] += mood
+        value = str(mood).replace(".", "_")
+        rollup["histogram"][value] = rollup["histogram"].get(value, 0) + 1
+        totals = rollup["days"].setdefault(f"{day.day:02d}", {"count": 0, "sum": 0, "sum_sq": 0})
+        totals["count"] += 1
+        totals["sum"] += mood
+        totals["sum_sq"] += mood * mood
+        ids.append(row["_id"])
+    return months
+
+
+async def compacted_ids(db, user_ids: List[str], ids: List[str]) -> Set[str]:
+    """Those of ``ids`` (entries of ``user_ids``) already compacted out of ``moods``.
+
+    Rollups list the ids they absorbed; the archive also covers months
+    compacted before they did.
+    """
+    if not ids:
+        return set()
+    found = await db.mood_rollups.absorbed(user_ids, ids)
+    if MOOD_ARCHIVE == "archive":
+        found |= await db.mood_archive.existing_ids(ids)
+    return found
+
+
+async def finish_pending(db, user_id: str):
+    """Complete compactions of ``user_id`` that stopped after updating a rollup."""
+    async for rollup in db.mood_rollups.iter_pending(user_id):
+        await db.moods.delete_ids(rollup["pending"])
+        await db.mood_rollups.clear_pending(rollup["_id"])
+
+
+async def compact_user(db, user_id: str, boundary: Optional[datetime] = None,
+                       archive: str = MOOD_ARCHIVE) -> int:
+    """Move one user's entries older than ``boundary`` to the cold tier; returns how many."""
+    if archive not in MOOD_ARCHIVE_MODES:
+        raise ValueError(f"Unknown MOOD_ARCHIVE {archive!r}, expected one of {MOOD_ARCHIVE_MODES}")
+    await finish_pending(db, user_id)
+    rows = await db.moods.iter_older(user_id, boundary or hot_boundary()).to_list(length=None)
+    months = month_rollups(rows)
+    by_id = {row["_id"]: row for row in rows}
+    if months:
+        # History pages only look in the archive for flagged users.
+        await db.summaries.mark_compacted(user_id)
+    compacted = 0
+    for month, (rollup, ids) in sorted(months.items()):
+        if archive == "archive":
+            # Rows archived by an interrupted run come back as duplicates.
+            errors = await db.mood_archive.add_many([by_id[mood_id] for mood_id in ids])
+            if any(code != DUPLICATE_KEY_ERROR for code in errors.values()):
+                raise RuntimeError(f"Failed to archive {len(errors)} entries of {user_id} for {month}")
+        await db.mood_rollups.absorb(user_id, month, rollup, ids)
+        await db.moods.delete_ids(ids)
+        await db.mood_rollups.clear_pending(f"{user_id}:{month}")
+        compacted += len(ids)
+    if compacted:
+        # Totals are unchanged, but history pages may now read differently.
+        await db.summaries.touch(user_id)
+    return compacted
+
+
+async def compact_all(db, boundary: Optional[datetime] = None, archive: str = MOOD_ARCHIVE) -> Tuple[int, int]:
+    """Compact every user; returns ``(users touched, entries compacted)``."""
+    boundary = boundary or hot_boundary()
+    users = entries = 0
+    async for user in db.users.iter_ids():
+        compacted = await compact_user(db, user["_id"], boundary, archive)
+        if compacted:
+            users += 1
+            entries += compacted
+    return users, entries
+
+
+async def history_page(db, user_id: str, limit: int, date_from: Optional[datetime] = None,
+                       date_to: Optional[datetime] = None,
+                       after: Optional[Tuple[datetime, str]] = None) -> List[dict]:
+    """Newest-first page of entries across ``moods`` and ``mood_archive``.
+
+    The archive is only queried when the hot page is short or reaches past
+    the hot boundary, which recent-history reads never do, and only for
+    users whose summary says they have compacted months.
+    """
+    moods = await db.moods.page(user_id, limit=limit, date_from=date_from, date_to=date_to, after=after)
+    if MOOD_ARCHIVE != "archive":
+        return moods
+    boundary = hot_boundary()
+    if len(moods) == limit and moods[-1]["date"] >= boundary:
+        return moods
+    if date_from is not None and date_from >= boundary:
+        return moods
+    if not await db.summaries.compacted(user_id):
+        return moods
+    cold = await db.mood_archive.page(user_id, limit=limit, date_from=date_from, date_to=date_to, after=after)
+    if not cold:
+        return moods
+    moods.extend(cold)
+    moods.sort(key=lambda mood: (mood["date"], mood["_id"]), reverse=True)
+    return moods[:limit]
+
+
+async def iter_history(db, user_id: str, date_from: Optional[datetime] = None,
+                       date_to: Optional[datetime] = None, batch_size: int = 1000):
+    """Every entry in range: hot ones newest first, then archived ones newest first."""
+    async for mood in db.moods.iter_range(user_id, date_from, date_to, batch_size=batch_size):
+        yield mood
+    if MOOD_ARCHIVE == "archive":
+        async for mood in db.mood_archive.iter_range(user_id, date_from, date_to, batch_size=batch_size):
+            yield mood
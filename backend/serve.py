@@ -0,0 +1,195 @@
+"""Prefork serving: one preloaded app, ``WEB_CONCURRENCY`` uvicorn workers.
+
+The master process imports the application once (so the heavy imports and
+module-level setup are shared copy-on-write), binds the listening socket,
+and forks the workers, which all accept on that socket. ``post_fork`` runs
+in each worker before it serves, which is where per-process resources such
+as the MongoDB connection pool are created; a pool must never be shared
+across ``fork()``.
+
+Signals sent to the master:
+
+* ``SIGTERM`` / ``SIGINT``: graceful stop. Workers stop accepting, finish
+  in-flight requests (and drain write-behind queues) for up to
+  ``WORKER_GRACEFUL_TIMEOUT`` seconds, then are killed.
+* ``SIGHUP``: graceful reload. A fresh set of workers is forked, then the
+  old ones are drained as above, so the socket never stops accepting. The
+  app itself is preloaded, so this recycles processes but does not pick up
+  code changes; restart the master for those.
+
+With ``WORKER_MAX_REQUESTS`` set, each worker exits gracefully after that
+many requests (plus up to ``WORKER_MAX_REQUESTS_JITTER``, so workers do not
+all recycle at once) and the master forks a replacement, which bounds
+memory growth from fragmentation or slow leaks. ``WEB_CONCURRENCY=1``
+(the default) runs a single uvicorn server in-process, without forking
+or recycling.
+
+Behind a reverse proxy or ingress, ``TRUSTED_PROXIES`` must list the
+addresses it connects from (``*`` if nothing else can reach the port):
+only then is the client address taken from ``X-Forwarded-For``, and the
+per-IP rate limit keys on the real client instead of the proxy.
+
+Each worker gets a slot number in ``WORKER_ID`` (0 to ``workers - 1``,
+taken over by its replacement), which labels its metrics. Anything kept
+in process memory is per worker: caches, rate limits and metrics, and
+the data itself with the embedded storage engine, which is why the app
+passes ``single_process`` to refuse prefork in that case.
+"""
+import os
+import random
+import signal
+import socket
+import time
+from typing import Callable, Dict, Optional
+
+import uvicorn
+
+WEB_CONCURRENCY = int(os.environ.get('WEB_CONCURRENCY', '1'))
+WORKER_MAX_REQUESTS = int(os.environ.get('WORKER_MAX_REQUESTS', '0'))
+WORKER_MAX_REQUESTS_JITTER = int(os.environ.get('WORKER_MAX_REQUESTS_JITTER', '0'))
+WORKER_GRACEFUL_TIMEOUT = float(os.environ.get('WORKER_GRACEFUL_TIMEOUT', '30'))
+SERVER_HOST = os.environ.get('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8001'))
+# Comma-separated proxy addresses whose X-Forwarded-For is believed, or "*"
+TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '127.0.0.1')
+
+
+def _config(app, max_requests: int) -> uvicorn.Config:
+    limit = None
+    if max_requests > 0:
+        limit = max_requests + random.randint(0, max(WORKER_MAX_REQUESTS_JITTER, 0))
+    return uvicorn.Config(
+        app,
+        limit_max_requests=limit,
+        proxy_headers=True,
+        forwarded_allow_ips=TRUSTED_PROXIES,
+        timeout_graceful_shutdown=WORKER_GRACEFUL_TIMEOUT,
+    )
+
+
+class Arbiter:
+    """Forks, watches and replaces the workers of one listening socket."""
+
+    def __init__(self, app, sock: socket.socket, workers: int, max_requests: int,
+                 post_fork: Optional[Callable[[], None]]):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.post_fork = post_fork
+        self.children: Dict[int, float] = {}
+        self.worker_ids: Dict[int, int] = {}
+        self.retiring: Dict[int, float] = {}
+        self.stopping = False
+        self.reloading = False
+
+    def spawn(self):
+        taken = {self.worker_ids[pid] for pid in self.children}
+        worker_id = next(slot for slot in range(len(taken) + 1) if slot not in taken)
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            self.worker_ids[pid] = worker_id
+            return
+        os.environ["WORKER_ID"] = str(worker_id)
+        # Worker: drop the master's handlers, set up per-process state, serve.
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP, signal.SIGCHLD):
+            signal.signal(signum, signal.SIG_DFL)
+        random.seed()
+        status = 0
+        try:
+            if self.post_fork is not None:
+                self.post_fork()
+            uvicorn.Server(_config(self.app, self.max_requests)).run(sockets=[self.sock])
+        except BaseException as e:
+            print(f"❌ Worker {os.getpid()} crashed: {e}")
+            status = 1
+        finally:
+            os._exit(status)
+
+    def retire(self, pids):
+        deadline = time.monotonic() + WORKER_GRACEFUL_TIMEOUT
+        for pid in pids:
+            self.children.pop(pid, None)
+            self.retiring[pid] = deadline
+            self._signal(pid, signal.SIGTERM)
+
+    def _signal(self, pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.worker_ids.pop(pid, None)
+            if self.children.pop(pid, None) is not None and not self.stopping:
+                code = os.waitstatus_to_exitcode(status)
+                if code != 0:
+                    print(f"❌ Worker {pid} exited with {code}, replacing it")
+            self.retiring.pop(pid, None)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        signal.signal(signal.SIGHUP, self._reload)
+        print(f"✅ Master {os.getpid()} serving with {self.workers} workers")
+        while self.children or self.retiring or not self.stopping:
+            self.reap()
+            if self.reloading:
+                self.reloading = False
+                old = list(self.children)
+                # Out of ``children`` first, so the new workers take over their slots.
+                for pid in old:
+                    self.children.pop(pid)
+                for _ in range(self.workers):
+                    self.spawn()
+                self.retire(old)
+            if not self.stopping:
+                while len(self.children) < self.workers:
+                    self.spawn()
+            now = time.monotonic()
+            for pid, deadline in list(self.retiring.items()):
+                if now > deadline:
+                    self._signal(pid, signal.SIGKILL)
+            time.sleep(0.1)
+        self.sock.close()
+
+    def _stop(self, signum, frame):
+        if not self.stopping:
+            self.stopping = True
+            self.retire(list(self.children))
+
+    def _reload(self, signum, frame):
+        if not self.stopping:
+            self.reloading = True
+
+
+def serve(app, host: str = SERVER_HOST, port: int = SERVER_PORT, workers: int = WEB_CONCURRENCY,
+          max_requests: int = WORKER_MAX_REQUESTS, post_fork: Optional[Callable[[], None]] = None,
+          single_process: Optional[str] = None):
+    """Serve an already imported ``app``, forking ``workers`` processes if more than one.
+
+    ``single_process`` is the reason the app cannot be split across
+    processes, if any; more than one worker is then refused.
+    """
+    if workers > 1 and single_process:
+        raise SystemExit(f"❌ WEB_CONCURRENCY={workers} is not supported: {single_process}")
+    if workers <= 1:
+        # Nothing would replace a recycled process here, so no request limit.
+        config = _config(app, 0)
+        config.host, config.port = host, port
+        uvicorn.Server(config).run()
+        return
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    Arbiter(app, sock, workers, max_requests, post_fork).run()
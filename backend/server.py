@@ -1,22 +1,88 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Header, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 from typing import Optional, List
-import pymongo
 import os
-import hashlib
+import asyncio
+import base64
+import csv
+import hmac
+import io
+import json
+import time
 import jwt
+import tempfile
 import uuid
-from bson import ObjectId
+
+from activity import ActivityMap
+from admission import (
+    RATE_LIMIT_IP_BURST, RATE_LIMIT_IP_PER_SECOND, RATE_LIMIT_USER_BURST, RATE_LIMIT_USER_PER_SECOND,
+    LoadShedder, TokenBucketLimiter, retry_after
+)
+from cache import TTLCache
+from database import (
+    CHALLENGE_POINTS, DUPLICATE_KEY_ERROR, MOOD_CLIENT_ID_NAMESPACE, STORAGE_ENGINE, Database, create_client
+)
+from etags import CACHE_CONTROL, etag_matches, make_etag
+from health import IndexBuilder, MigrationGate, ReadinessCheck
+from leaderboard import ALL_TIME, Leaderboards, week_board
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import (
+    ADMISSION_REJECTIONS, InstrumentedCollection, MetricsMiddleware, registry as metrics_registry, watch_cache,
+    watch_write_queue
+)
+from passwords import HasherBusy, PasswordHasher
+from population import (
+    COMPLETION_WINDOW_DAYS, completion_view, daily_view, load_days, load_offsets, participation_view
+)
+from provisioning import IMPORT_KINDS, import_hasher, import_rows, read_rows
+from rollups import compacted_ids, history_page, iter_history
+from summaries import current_streak, get_or_rebuild_summary, longest_streak
+from timestamps import api_timestamp, bucket_day, mood_timestamp, parse_timestamp, utcnow
+from trends import PERIOD_RULES, compute_trends, load_daily
+from writebehind import WriteQueueFull
 
 # Environment variables
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-here')
 JWT_ALGORITHM = 'HS256'
+AUTH_CACHE_TTL_SECONDS = float(os.environ.get('AUTH_CACHE_TTL_SECONDS', '60'))
+AUTH_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_CACHE_MAX_ENTRIES', '10000'))
+MOOD_BULK_MAX_ENTRIES = int(os.environ.get('MOOD_BULK_MAX_ENTRIES', '10000'))
+MOOD_BULK_CHUNK_SIZE = int(os.environ.get('MOOD_BULK_CHUNK_SIZE', '1000'))
+MOOD_HISTORY_MAX_LIMIT = int(os.environ.get('MOOD_HISTORY_MAX_LIMIT', '500'))
+MOOD_EXPORT_BATCH_SIZE = int(os.environ.get('MOOD_EXPORT_BATCH_SIZE', '1000'))
+TRENDS_CACHE_TTL_SECONDS = float(os.environ.get('TRENDS_CACHE_TTL_SECONDS', '300'))
+TRENDS_CACHE_MAX_USERS = int(os.environ.get('TRENDS_CACHE_MAX_USERS', '1000'))
+LEADERBOARD_SYNC_SECONDS = float(os.environ.get('LEADERBOARD_SYNC_SECONDS', '5'))
+ADMIN_API_KEY = os.environ.get('ADMIN_API_KEY', '')
+# Benchmarks of stateless routes only: every worker gets its own empty database
+MEMORY_ENGINE_ALLOW_WORKERS = os.environ.get('MEMORY_ENGINE_ALLOW_WORKERS', '') == '1'
+IMPORT_SPOOL_BYTES = int(os.environ.get('IMPORT_SPOOL_BYTES', str(8 * 1024 * 1024)))
+ANALYTICS_MAX_DAYS = int(os.environ.get('ANALYTICS_MAX_DAYS', '1096'))
 
-app = FastAPI(title="Daily Wellness API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here waits on MongoDB: indexes are built in the background
+    # and /api/health/ready reports when the database is usable.
+    db.start_writers()
+    index_builder.start()
+    try:
+        yield
+    finally:
+        await index_builder.stop()
+        await db.drain_writers()
+        db.close()
+        hasher.shutdown()
+
+app = FastAPI(title="Daily Wellness API", version="1.0.0", lifespan=lifespan)
+
+# Global concurrency limit with queueing and 503 load shedding (innermost,
+# so shed responses still get CORS headers and are counted in metrics)
+app.add_middleware(LoadShedder)
 
 # CORS middleware
 app.add_middleware(
@@ -27,25 +93,40 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# MongoDB connection
-try:
-    client = pymongo.MongoClient(MONGO_URL)
-    db = client.wellness_db
-    users_collection = db.users
-    moods_collection = db.moods
-    challenges_collection = db.challenges
-    progress_collection = db.progress
-    
-    # Create indexes
-    users_collection.create_index("username", unique=True)
-    users_collection.create_index("email", unique=True)
-    moods_collection.create_index([("user_id", 1), ("date", -1)])
-    challenges_collection.create_index([("user_id", 1), ("challenge_id", 1)])
-    progress_collection.create_index([("user_id", 1), ("challenge_id", 1)])
-    
-    print("✅ Connected to MongoDB successfully")
-except Exception as e:
-    print(f"❌ MongoDB connection failed: {e}")
+# Request instrumentation (outermost, so it times everything below it)
+app.add_middleware(MetricsMiddleware)
+
+# Authenticated-user caches: verified tokens and the user records behind them
+token_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+user_cache = TTLCache(maxsize=AUTH_CACHE_MAX_ENTRIES, ttl=AUTH_CACHE_TTL_SECONDS)
+
+# Per-client token buckets: authenticated users by id, auth routes by client IP
+user_limiter = TokenBucketLimiter(RATE_LIMIT_USER_PER_SECOND, RATE_LIMIT_USER_BURST)
+ip_limiter = TokenBucketLimiter(RATE_LIMIT_IP_PER_SECOND, RATE_LIMIT_IP_BURST)
+
+# Credential hashing runs on a bounded worker pool, off the event loop
+hasher = PasswordHasher()
+
+# Per-user daily mood aggregates behind /api/mood/trends, tagged with the summary
+# data version they were loaded at (writes on other workers bump it too)
+trends_cache = TTLCache(maxsize=TRENDS_CACHE_MAX_USERS, ttl=TRENDS_CACHE_TTL_SECONDS)
+
+watch_cache("token", token_cache)
+watch_cache("user", user_cache)
+watch_cache("trends", trends_cache)
+
+# MongoDB connection (motor, non-blocking)
+db = Database(create_client(), user_cache=user_cache, wrap_collection=InstrumentedCollection)
+for name, writer in db.writers.items():
+    watch_write_queue(name, writer)
+
+# In-process ranking index over the precomputed leaderboard documents
+leaderboards = Leaderboards(db.leaderboard, sync_interval=LEADERBOARD_SYNC_SECONDS)
+
+# Startup index build and the cached database check behind the health probes
+index_builder = IndexBuilder(db)
+readiness = ReadinessCheck(db)
+app.add_middleware(MigrationGate, builder=index_builder)
 
 # Security
 security = HTTPBearer()
@@ -64,6 +145,12 @@ class MoodEntry(BaseModel):
     mood: int
     date: str
 
+class MoodBulkEntry(MoodEntry):
+    clientId: Optional[str] = None  # idempotency key, unique per user
+
+class MoodBulkRequest(BaseModel):
+    entries: List[MoodBulkEntry] = Field(max_length=MOOD_BULK_MAX_ENTRIES)
+
 class ChallengeStart(BaseModel):
     challengeId: int
 
@@ -77,11 +164,26 @@ class UserResponse(BaseModel):
     created_at: str
 
 # Utility functions
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+def write_queue_full() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many pending writes, please retry",
+        headers={"Retry-After": "1"}
+    )
+
+def hashing_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many concurrent sign-ins, please retry",
+        headers={"Retry-After": "1"}
+    )
 
-def verify_password(password: str, hashed_password: str) -> bool:
-    return hash_password(password) == hashed_password
+def rate_limited(seconds: float) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Too many requests, please slow down",
+        headers={"Retry-After": retry_after(seconds)}
+    )
 
 def create_jwt_token(user_id: str) -> str:
     payload = {
@@ -91,13 +193,117 @@ def create_jwt_token(user_id: str) -> str:
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
 
 def verify_jwt_token(token: str) -> Optional[str]:
+    # Entries never outlive the token's own expiry, so a cached hit can
+    # never honor an expired token.
+    cached = token_cache.get(token)
+    if cached is not None:
+        user_id, expires_at = cached
+        if expires_at > time.time():
+            return user_id
+        token_cache.invalidate(token)
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get('user_id')
-    except jwt.ExpiredSignatureError:
-        return None
     except jwt.InvalidTokenError:
         return None
+    user_id = payload.get('user_id')
+    expires_at = payload.get('exp')
+    if user_id and expires_at:
+        token_cache.set(token, (user_id, expires_at), ttl=expires_at - time.time())
+    return user_id
+
+def encode_history_cursor(mood: dict) -> str:
+    raw = json.dumps([api_timestamp(mood["date"]), mood["_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_history_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, mood_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(date, str) or not isinstance(mood_id, str):
+            raise ValueError(cursor)
+        return parse_timestamp(date), mood_id
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def parse_range_bound(value: Optional[str], name: str) -> Optional[datetime]:
+    if value is None:
+        return None
+    try:
+        return parse_timestamp(value)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid '{name}' timestamp")
+
+def analytics_range(date_from: Optional[str], date_to: Optional[str]):
+    """Inclusive day range of an analytics query; the last 365 days by default."""
+    last = parse_range_bound(date_to, "to")
+    last = last.date() if last else datetime.utcnow().date()
+    first = parse_range_bound(date_from, "from")
+    first = first.date() if first else last - timedelta(days=364)
+    if first > last:
+        raise HTTPException(status_code=400, detail="'from' is after 'to'")
+    if (last - first).days >= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=422, detail=f"Range is limited to {ANALYTICS_MAX_DAYS} days")
+    return first, last
+
+async def analytics_as_of() -> Optional[str]:
+    """How far the population rollups reach (``manage.py rollup-population``)."""
+    state = await db.population_rollups.get_state()
+    return api_timestamp(state.get("watermark")) if state else None
+
+def mood_payload(mood: dict) -> dict:
+    return {
+        "mood": mood.get("mood"),
+        "date": api_timestamp(mood.get("date")),
+        "created_at": api_timestamp(mood.get("created_at"))
+    }
+
+async def check_not_modified(request: Request, response: Response, user_id: str, *variant) -> bool:
+    """Set the ETag for this user's data version; True if the client's copy is current.
+
+    ``variant`` covers whatever else the payload depends on (query
+    parameters, the current day). Users without a summary yet get no ETag.
+    """
+    version = await db.summaries.version(user_id)
+    if version is None:
+        return False
+    etag = make_etag(user_id, version, request.url.path, request.url.query, *variant)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    return etag_matches(request.headers.get("if-none-match"), etag)
+
+def not_modified(response: Response) -> Response:
+    return Response(status_code=304, headers=dict(response.headers))
+
+def user_payload(user: dict) -> dict:
+    return {
+        "id": user["_id"],
+        "username": user["username"],
+        "email": user["email"],
+        "created_at": user["created_at"]
+    }
+
+def progress_payload(summary: dict) -> dict:
+    return {
+        "total_points": summary.get("total_points", 0),
+        "completed_challenges": summary.get("completed_count", 0),
+        "current_challenges": [
+            {**challenge, "started_at": api_timestamp(challenge.get("started_at"))}
+            for challenge in summary.get("current_challenges", [])
+        ],
+        "recent_completions": [
+            {**completion, "completed_at": api_timestamp(completion.get("completed_at"))}
+            for completion in summary.get("recent_completions", [])
+        ]
+    }
+
+def stats_payload(summary: dict, user: dict) -> dict:
+    return {
+        "mood_entries": summary.get("mood_count", 0),
+        "completed_challenges": summary.get("completed_count", 0),
+        "current_streak": current_streak(summary),
+        "longest_streak": longest_streak(summary),
+        "member_since": user["created_at"]
+    }
 
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
@@ -108,7 +314,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail="Invalid or expired token"
         )
     
-    user = users_collection.find_one({"_id": user_id})
+    wait = user_limiter.acquire(user_id)
+    if wait:
+        ADMISSION_REJECTIONS.inc("user_rate")
+        raise rate_limited(wait)
+    
+    user = await db.users.get_by_id(user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -117,22 +328,36 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     
     return user
 
+async def limit_client_ip(request: Request):
+    """Rate limit for routes called before there is a user to key on."""
+    wait = ip_limiter.acquire(request.client.host if request.client else None)
+    if wait:
+        ADMISSION_REJECTIONS.inc("ip_rate")
+        raise rate_limited(wait)
+
+async def require_admin(x_admin_key: Optional[str] = Header(None)):
+    """Admin routes: only exist when ADMIN_API_KEY is set, and need it in X-Admin-Key."""
+    if not ADMIN_API_KEY:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if x_admin_key is None or not hmac.compare_digest(x_admin_key.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin key")
+
 # API Routes
 @app.get("/")
 async def root():
     return {"message": "Daily Wellness API is running! 🌟"}
 
-@app.post("/api/auth/register")
+@app.post("/api/auth/register", dependencies=[Depends(limit_client_ip)])
 async def register(user_data: UserRegister):
     try:
         # Check if user already exists
-        if users_collection.find_one({"username": user_data.username}):
+        if await db.users.get_by_username(user_data.username):
             raise HTTPException(
                 status_code=400,
                 detail="Username already exists"
             )
         
-        if users_collection.find_one({"email": user_data.email}):
+        if await db.users.get_by_email(user_data.email):
             raise HTTPException(
                 status_code=400,
                 detail="Email already exists"
@@ -144,22 +369,27 @@ async def register(user_data: UserRegister):
             "_id": user_id,
             "username": user_data.username,
             "email": user_data.email,
-            "password": hash_password(user_data.password),
+            "password": await hasher.hash(user_data.password),
             "created_at": datetime.utcnow().isoformat()
         }
         
-        users_collection.insert_one(user)
+        await db.users.create(user)
+        await db.summaries.create(user_id)
         
         return {"message": "User created successfully", "user_id": user_id}
         
+    except HasherBusy:
+        raise hashing_busy()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Registration failed: {str(e)}")
 
-@app.post("/api/auth/login")
+@app.post("/api/auth/login", dependencies=[Depends(limit_client_ip)])
 async def login(user_data: UserLogin):
     try:
         # Find user
-        user = users_collection.find_one({"username": user_data.username})
+        user = await db.users.get_by_username(user_data.username)
         if not user:
             raise HTTPException(
                 status_code=401,
@@ -167,12 +397,17 @@ async def login(user_data: UserLogin):
             )
         
         # Verify password
-        if not verify_password(user_data.password, user["password"]):
+        valid, upgraded_hash = await hasher.verify(user_data.password, user["password"])
+        if not valid:
             raise HTTPException(
                 status_code=401,
                 detail="Invalid credentials"
             )
         
+        # Transparently upgrade legacy or outdated hashes
+        if upgraded_hash:
+            await db.users.update(user["_id"], {"password": upgraded_hash})
+        
         # Create JWT token
         token = create_jwt_token(user["_id"])
         
@@ -185,50 +420,286 @@ async def login(user_data: UserLogin):
             }
         }
         
+    except HasherBusy:
+        raise hashing_busy()
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Login failed: {str(e)}")
 
 @app.get("/api/auth/me")
-async def get_current_user_info(current_user: dict = Depends(get_current_user)):
-    return {
-        "id": current_user["_id"],
-        "username": current_user["username"],
-        "email": current_user["email"],
-        "created_at": current_user["created_at"]
-    }
+async def get_current_user_info(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
+    user_info = user_payload(current_user)
+    # The profile is already in hand (usually from the user cache), so tag
+    # the payload itself rather than paying a version lookup.
+    etag = make_etag(*user_info.values())
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(response)
+    return user_info
 
 @app.post("/api/mood/save")
 async def save_mood(mood_data: MoodEntry, current_user: dict = Depends(get_current_user)):
+    try:
+        date, day = mood_timestamp(mood_data.date)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid date")
+    
     try:
         mood_entry = {
             "_id": str(uuid.uuid4()),
             "user_id": current_user["_id"],
             "mood": mood_data.mood,
-            "date": mood_data.date,
-            "created_at": datetime.utcnow().isoformat()
+            "date": date,
+            "day": day,
+            "created_at": utcnow()
         }
         
-        moods_collection.insert_one(mood_entry)
+        token = await db.summaries.begin_write(current_user["_id"], "mood")
+        try:
+            await db.moods.add(mood_entry)
+        except WriteQueueFull:
+            await db.summaries.end_write(current_user["_id"], token)
+            raise
+        trends_cache.invalidate(current_user["_id"])
+        await db.summaries.record_moods(current_user["_id"], token, 1, [bucket_day(day)])
         return {"message": "Mood saved successfully"}
         
+    except WriteQueueFull:
+        raise write_queue_full()
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to save mood: {str(e)}")
 
+@app.post("/api/mood/bulk")
+async def save_moods_bulk(bulk_data: MoodBulkRequest, current_user: dict = Depends(get_current_user)):
+    try:
+        user_id = current_user["_id"]
+        results = [None] * len(bulk_data.entries)
+        seen_client_ids = set()
+        created = 0
+        created_days = set()
+        # Entries sent again after compaction are no longer in ``moods``
+        check_compacted = (any(entry.clientId is not None for entry in bulk_data.entries)
+                           and await db.summaries.compacted(user_id))
+        token = await db.summaries.begin_write(user_id, "mood")
+        
+        # Insert in bounded chunks so a large backfill never builds every
+        # document up front.
+        for start in range(0, len(bulk_data.entries), MOOD_BULK_CHUNK_SIZE):
+            documents = []
+            positions = []
+            for index in range(start, min(start + MOOD_BULK_CHUNK_SIZE, len(bulk_data.entries))):
+                entry = bulk_data.entries[index]
+                try:
+                    date, day = mood_timestamp(entry.date)
+                except ValueError:
+                    results[index] = {
+                        "index": index,
+                        "clientId": entry.clientId,
+                        "status": "failed",
+                        "error": "Invalid date"
+                    }
+                    continue
+                if entry.clientId is not None:
+                    if entry.clientId in seen_client_ids:
+                        results[index] = {"index": index, "clientId": entry.clientId, "status": "duplicate"}
+                        continue
+                    seen_client_ids.add(entry.clientId)
+                    mood_id = str(uuid.uuid5(MOOD_CLIENT_ID_NAMESPACE, f"{user_id}:{entry.clientId}"))
+                else:
+                    mood_id = str(uuid.uuid4())
+                documents.append({
+                    "_id": mood_id,
+                    "user_id": user_id,
+                    "mood": entry.mood,
+                    "date": date,
+                    "day": day,
+                    "created_at": utcnow()
+                })
+                positions.append(index)
+            
+            if check_compacted:
+                compacted = await compacted_ids(db, [user_id], [
+                    document["_id"] for document, index in zip(documents, positions)
+                    if bulk_data.entries[index].clientId is not None
+                ])
+                for document, index in zip(documents, positions):
+                    if document["_id"] in compacted:
+                        results[index] = {"index": index, "clientId": bulk_data.entries[index].clientId,
+                                          "status": "duplicate"}
+                kept = [offset for offset, document in enumerate(documents) if document["_id"] not in compacted]
+                documents = [documents[offset] for offset in kept]
+                positions = [positions[offset] for offset in kept]
+            
+            errors = await db.moods.add_many(documents)
+            for offset, index in enumerate(positions):
+                code = errors.get(offset)
+                if code is None:
+                    item_status = "created"
+                    created += 1
+                    created_days.add(bucket_day(documents[offset]["day"]))
+                elif code == DUPLICATE_KEY_ERROR:
+                    item_status = "duplicate"
+                else:
+                    item_status = "failed"
+                results[index] = {
+                    "index": index,
+                    "clientId": bulk_data.entries[index].clientId,
+                    "status": item_status
+                }
+        
+        if created:
+            trends_cache.invalidate(user_id)
+            await db.summaries.record_moods(user_id, token, created, created_days)
+        else:
+            await db.summaries.end_write(user_id, token)
+        
+        return {
+            "created": created,
+            "duplicates": sum(1 for result in results if result["status"] == "duplicate"),
+            "failed": sum(1 for result in results if result["status"] == "failed"),
+            "results": results
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save moods: {str(e)}")
+
 @app.get("/api/mood/history")
-async def get_mood_history(current_user: dict = Depends(get_current_user)):
+async def get_mood_history(
+    request: Request,
+    response: Response,
+    limit: int = Query(30, ge=1, le=MOOD_HISTORY_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Newest-first mood entries, ``from`` inclusive and ``to`` exclusive.
+
+    When more entries exist the ``X-Next-Cursor`` header carries the cursor
+    for the next (older) page.
+    """
+    after = decode_history_cursor(cursor) if cursor else None
+    date_from = parse_range_bound(date_from, "from")
+    date_to = parse_range_bound(date_to, "to")
     try:
-        moods = list(moods_collection.find(
-            {"user_id": current_user["_id"]},
-            {"_id": 0, "user_id": 0}
-        ).sort("date", -1).limit(30))
+        # Only conditional when an acknowledged save is already readable;
+        # otherwise a queued save could be cached under the new version.
+        if db.moods.acknowledged_writes_visible:
+            if await check_not_modified(request, response, current_user["_id"]):
+                return not_modified(response)
         
-        return moods
+        moods = await history_page(
+            db, current_user["_id"], limit=limit, date_from=date_from, date_to=date_to, after=after
+        )
+        
+        if len(moods) == limit:
+            response.headers["X-Next-Cursor"] = encode_history_cursor(moods[-1])
+        
+        return [mood_payload(mood) for mood in moods]
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get mood history: {str(e)}")
 
+@app.get("/api/mood/trends")
+async def get_mood_trends(
+    period: str = Query("daily", pattern="^(" + "|".join(PERIOD_RULES) + ")$"),
+    window: int = Query(7, ge=1, le=365),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        # The data version is read before the load, so a frame cached by
+        # this or any other worker is only served while nothing changed.
+        version = await db.summaries.version(current_user["_id"])
+        cached = trends_cache.get(current_user["_id"])
+        if cached is not None and version is not None and cached[0] == version:
+            daily = cached[1]
+        else:
+            # Entries still queued for write-behind would be missing from
+            # the load, so it is only cached once the database has them.
+            pending = db.moods.pending_writes(current_user["_id"])
+            daily = await load_daily(db, current_user["_id"])
+            if version is not None and not pending and not db.moods.pending_writes(current_user["_id"]):
+                trends_cache.set(current_user["_id"], (version, daily))
+        
+        return compute_trends(daily, period=period, window=window)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get mood trends: {str(e)}")
+
+@app.get("/api/mood/calendar")
+async def get_mood_calendar(
+    request: Request,
+    response: Response,
+    year: Optional[int] = Query(None, ge=1970, le=9999),
+    current_user: dict = Depends(get_current_user)
+):
+    """Year heatmap: one 0/1 entry per day, January 1st first."""
+    try:
+        year = year or datetime.now().year
+        if await check_not_modified(request, response, current_user["_id"], year):
+            return not_modified(response)
+        
+        summary = await get_or_rebuild_summary(db, current_user["_id"])
+        days = ActivityMap(summary.get("activity")).year(year)
+        
+        return {
+            "year": year,
+            "start": f"{year:04d}-01-01",
+            "active_days": sum(days),
+            "days": days
+        }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get mood calendar: {str(e)}")
+
+EXPORT_FIELDS = ["date", "mood", "created_at"]
+
+async def stream_ndjson(moods):
+    async for mood in moods:
+        yield json.dumps(mood_payload(mood)) + "\n"
+
+async def stream_csv(moods):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    async for mood in moods:
+        writer.writerow(mood_payload(mood))
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+@app.get("/api/mood/export")
+async def export_mood_history(
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream the full (or ranged) history straight from the cursors, hot entries first."""
+    date_from = parse_range_bound(date_from, "from")
+    date_to = parse_range_bound(date_to, "to")
+    moods = iter_history(
+        db, current_user["_id"], date_from=date_from, date_to=date_to,
+        batch_size=MOOD_EXPORT_BATCH_SIZE
+    )
+    if format == "csv":
+        body, media_type = stream_csv(moods), "text/csv"
+    else:
+        body, media_type = stream_ndjson(moods), "application/x-ndjson"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="mood-history.{format}"'}
+    )
+
 @app.post("/api/challenge/start")
 async def start_challenge(challenge_data: ChallengeStart, current_user: dict = Depends(get_current_user)):
     try:
@@ -236,49 +707,61 @@ async def start_challenge(challenge_data: ChallengeStart, current_user: dict = D
             "_id": str(uuid.uuid4()),
             "user_id": current_user["_id"],
             "challenge_id": challenge_data.challengeId,
-            "started_at": datetime.utcnow().isoformat(),
+            "started_at": utcnow(),
             "status": "started"
         }
         
-        challenges_collection.insert_one(challenge_entry)
+        token = await db.summaries.begin_write(current_user["_id"], "start")
+        try:
+            started = await db.challenges.start(challenge_entry)
+        except WriteQueueFull:
+            await db.summaries.end_write(current_user["_id"], token)
+            raise
+        if not started:
+            await db.summaries.end_write(current_user["_id"], token)
+            raise HTTPException(status_code=409, detail="Challenge already started")
+        await db.summaries.record_start(current_user["_id"], token, {
+            "challenge_id": challenge_entry["challenge_id"],
+            "started_at": challenge_entry["started_at"],
+            "status": challenge_entry["status"]
+        })
         return {"message": "Challenge started successfully"}
         
+    except WriteQueueFull:
+        raise write_queue_full()
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to start challenge: {str(e)}")
 
 @app.post("/api/challenge/complete")
 async def complete_challenge(challenge_data: ChallengeComplete, current_user: dict = Depends(get_current_user)):
     try:
-        # Update challenge status
-        result = challenges_collection.update_one(
-            {
-                "user_id": current_user["_id"],
-                "challenge_id": challenge_data.challengeId,
-                "status": "started"
-            },
-            {
-                "$set": {
-                    "status": "completed",
-                    "completed_at": datetime.utcnow().isoformat()
-                }
-            }
+        completed_at = utcnow()
+        
+        # The summary holds a pending token until the leaderboards are
+        # updated too; if the request dies in between, the next summary
+        # rebuild repairs both.
+        token = await db.summaries.begin_write(current_user["_id"], "completion")
+        
+        # Complete the attempt and award its points in one atomic write
+        completion = await db.challenges.complete(
+            current_user["_id"],
+            challenge_data.challengeId,
+            completed_at,
+            CHALLENGE_POINTS
         )
         
-        if result.matched_count == 0:
+        if completion is None:
+            await db.summaries.end_write(current_user["_id"], token)
             raise HTTPException(status_code=404, detail="Challenge not found or already completed")
         
-        # Update progress
-        progress_entry = {
-            "_id": str(uuid.uuid4()),
-            "user_id": current_user["_id"],
-            "challenge_id": challenge_data.challengeId,
-            "completed_at": datetime.utcnow().isoformat(),
-            "points": 10  # Award points for completion
-        }
-        
-        progress_collection.insert_one(progress_entry)
+        await leaderboards.record(
+            current_user["_id"], current_user["username"], completion["points"], completed_at
+        )
+        await db.summaries.record_completion(current_user["_id"], token, completion)
         
-        return {"message": "Challenge completed successfully", "points_earned": 10}
+        return {"message": "Challenge completed successfully", "points_earned": completion["points"]}
         
     except HTTPException:
         raise
@@ -286,88 +769,265 @@ async def complete_challenge(challenge_data: ChallengeComplete, current_user: di
         raise HTTPException(status_code=500, detail=f"Failed to complete challenge: {str(e)}")
 
 @app.get("/api/progress")
-async def get_user_progress(current_user: dict = Depends(get_current_user)):
+async def get_user_progress(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        if await check_not_modified(request, response, current_user["_id"]):
+            return not_modified(response)
+        
+        summary = await get_or_rebuild_summary(db, current_user["_id"])
+        
+        return progress_payload(summary)
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get progress: {str(e)}")
+
+DASHBOARD_SECTIONS = ("user", "progress", "history", "stats")
+
+@app.get("/api/dashboard")
+async def get_dashboard(
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="Comma-separated sections, default all"),
+    history_limit: int = Query(30, ge=1, le=MOOD_HISTORY_MAX_LIMIT),
+    current_user: dict = Depends(get_current_user)
+):
+    """User info, progress, recent history and stats in one round trip.
+
+    Authentication happens once, and the summary read and the history
+    page run concurrently. ``fields`` selects sections, e.g.
+    ``fields=progress,history``; unselected sections are neither queried
+    nor returned.
+    """
+    sections = set(DASHBOARD_SECTIONS)
+    if fields is not None:
+        sections = {field.strip() for field in fields.split(",") if field.strip()}
+        if not sections:
+            raise HTTPException(status_code=400, detail="No dashboard fields selected")
+        unknown = sections - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown dashboard fields: {', '.join(sorted(unknown))}"
+            )
+    
     try:
-        # Get completed challenges
-        completed_challenges = list(progress_collection.find(
-            {"user_id": current_user["_id"]},
-            {"_id": 0, "user_id": 0}
-        ).sort("completed_at", -1))
+        user_id = current_user["_id"]
+        if "history" not in sections or db.moods.acknowledged_writes_visible:
+            today = datetime.now().date().isoformat()
+            if await check_not_modified(request, response, user_id, today):
+                return not_modified(response)
         
-        # Calculate total points
-        total_points = sum(challenge.get("points", 0) for challenge in completed_challenges)
+        queries = {}
+        if sections & {"progress", "stats"}:
+            queries["summary"] = get_or_rebuild_summary(db, user_id)
+        if "history" in sections:
+            queries["history"] = history_page(db, user_id, limit=history_limit)
+        results = dict(zip(queries, await asyncio.gather(*queries.values())))
         
-        # Get current challenges
-        current_challenges = list(challenges_collection.find(
-            {"user_id": current_user["_id"], "status": "started"},
-            {"_id": 0, "user_id": 0}
-        ))
+        dashboard = {}
+        if "user" in sections:
+            dashboard["user"] = user_payload(current_user)
+        if "progress" in sections:
+            dashboard["progress"] = progress_payload(results["summary"])
+        if "history" in sections:
+            moods = results["history"]
+            if len(moods) == history_limit:
+                response.headers["X-Next-Cursor"] = encode_history_cursor(moods[-1])
+            dashboard["history"] = [mood_payload(mood) for mood in moods]
+        if "stats" in sections:
+            dashboard["stats"] = stats_payload(results["summary"], current_user)
+        
+        return dashboard
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get dashboard: {str(e)}")
+
+@app.get("/api/leaderboard")
+async def get_leaderboard(
+    period: str = Query("all", pattern="^(all|week)$"),
+    limit: int = Query(10, ge=1, le=100),
+    around: int = Query(2, ge=0, le=25),
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        board = ALL_TIME if period == "all" else week_board(datetime.utcnow())
+        index = await leaderboards.get(board)
+        user_id = current_user["_id"]
         
         return {
-            "total_points": total_points,
-            "completed_challenges": len(completed_challenges),
-            "current_challenges": current_challenges,
-            "recent_completions": completed_challenges[:5]
+            "period": period,
+            "board": board,
+            "total_users": len(index),
+            "top": index.top(limit),
+            "me": {
+                "rank": index.rank(user_id),
+                "points": index.points.get(user_id, 0)
+            },
+            "neighbours": index.around(user_id, around)
         }
         
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get progress: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to get leaderboard: {str(e)}")
 
-@app.get("/api/health")
-async def health_check():
+@app.post("/api/admin/import/{kind}", dependencies=[Depends(require_admin)])
+async def import_data(
+    kind: str,
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$")
+):
+    """Bulk import users, moods or challenges from the raw CSV/NDJSON body (see provisioning.py)."""
+    if kind not in IMPORT_KINDS:
+        raise HTTPException(status_code=404, detail=f"Unknown import kind, expected one of {', '.join(IMPORT_KINDS)}")
+    if index_builder.state != "ready":
+        # Conflicts are only detected once the unique indexes exist
+        raise HTTPException(status_code=503, detail="Indexes are still being built, please retry")
+    import_hash_pool = import_hasher() if kind == "users" else None
+    try:
+        # Spooled to disk past IMPORT_SPOOL_BYTES, so large files stream through
+        with tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_BYTES) as spool:
+            async for chunk in request.stream():
+                spool.write(chunk)
+            spool.seek(0)
+            stream = io.TextIOWrapper(spool, encoding="utf-8-sig", newline="")
+            report = await import_rows(db, kind, read_rows(stream, format), hasher=import_hash_pool)
+        
+        if kind == "moods":
+            trends_cache.clear()
+        
+        return report
+        
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="Import file must be UTF-8")
+    except csv.Error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid CSV: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
+    finally:
+        if import_hash_pool is not None:
+            import_hash_pool.shutdown()
+
+@app.get("/api/admin/analytics/daily", dependencies=[Depends(require_admin)])
+async def get_daily_analytics(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to")
+):
+    first, last = analytics_range(date_from, date_to)
     try:
-        # Test database connection
-        client.admin.command('ping')
+        frame = await load_days(db, first, last)
         return {
-            "status": "healthy",
-            "database": "connected",
-            "timestamp": datetime.utcnow().isoformat()
+            "from": first.isoformat(),
+            "to": last.isoformat(),
+            "as_of": await analytics_as_of(),
+            **daily_view(frame)
         }
+        
     except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get daily analytics: {str(e)}")
+
+@app.get("/api/admin/analytics/participation", dependencies=[Depends(require_admin)])
+async def get_participation_analytics(
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to")
+):
+    first, last = analytics_range(date_from, date_to)
+    try:
+        frame = await load_days(db, first, last)
         return {
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e),
-            "timestamp": datetime.utcnow().isoformat()
+            "from": first.isoformat(),
+            "to": last.isoformat(),
+            "as_of": await analytics_as_of(),
+            **participation_view(frame)
         }
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get participation analytics: {str(e)}")
 
-@app.get("/api/stats")
-async def get_app_stats(current_user: dict = Depends(get_current_user)):
+@app.get("/api/admin/analytics/completion", dependencies=[Depends(require_admin)])
+async def get_completion_analytics(
+    window: int = Query(min(30, COMPLETION_WINDOW_DAYS), ge=1, le=COMPLETION_WINDOW_DAYS)
+):
     try:
-        # Get user's mood entries count
-        mood_count = moods_collection.count_documents({"user_id": current_user["_id"]})
-        
-        # Get user's completed challenges count
-        completed_count = progress_collection.count_documents({"user_id": current_user["_id"]})
-        
-        # Get user's current streak (consecutive days with mood entries)
-        recent_moods = list(moods_collection.find(
-            {"user_id": current_user["_id"]},
-            {"date": 1}
-        ).sort("date", -1).limit(30))
-        
-        streak = 0
-        if recent_moods:
-            # Calculate streak logic here
-            dates = [datetime.fromisoformat(mood["date"]).date() for mood in recent_moods]
-            current_date = datetime.now().date()
-            
-            for i, date in enumerate(dates):
-                if date == current_date - timedelta(days=i):
-                    streak += 1
-                else:
-                    break
+        frame = await load_offsets(db, window)
+        return {
+            "window": window,
+            "as_of": await analytics_as_of(),
+            **completion_view(frame)
+        }
         
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get completion analytics: {str(e)}")
+
+@app.get("/api/health")
+async def health_check():
+    database = await readiness.check()
+    if database["connected"]:
         return {
-            "mood_entries": mood_count,
-            "completed_challenges": completed_count,
-            "current_streak": streak,
-            "member_since": current_user["created_at"]
+            "status": "healthy",
+            "database": "connected",
+            "timestamp": database["checked_at"]
         }
+    return {
+        "status": "unhealthy",
+        "database": "disconnected",
+        "error": database["error"],
+        "timestamp": database["checked_at"]
+    }
+
+@app.get("/api/health/live")
+async def liveness_check():
+    """The process is up and serving; never touches the database."""
+    return {"status": "alive"}
+
+@app.get("/api/health/ready")
+async def readiness_check(response: Response):
+    """Ready once the database answers (cached briefly) and the indexes are built."""
+    database = await readiness.check()
+    ready = database["connected"] and index_builder.state == "ready"
+    if not ready:
+        response.status_code = 503
+    return {
+        "status": "ready" if ready else "not_ready",
+        "database": "connected" if database["connected"] else "disconnected",
+        "indexes": index_builder.state,
+        "skipped_indexes": index_builder.skipped,
+        "error": database["error"] or index_builder.error,
+        "checked_at": database["checked_at"]
+    }
+
+@app.get("/api/metrics")
+async def get_metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/api/stats")
+async def get_app_stats(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user)
+):
+    try:
+        # The streak lapses at midnight without any write, so the day is
+        # part of the tag.
+        today = datetime.now().date().isoformat()
+        if await check_not_modified(request, response, current_user["_id"], today):
+            return not_modified(response)
+        
+        summary = await get_or_rebuild_summary(db, current_user["_id"])
+        
+        return stats_payload(summary, current_user)
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get stats: {str(e)}")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
+    from serve import serve
+    # Each prefork worker opens its own connection pool after fork()
+    serve(
+        app,
+        post_fork=lambda: db.bind(create_client()),
+        single_process=("STORAGE_ENGINE=memory keeps the data inside each worker"
+                        if STORAGE_ENGINE == "memory" and not MEMORY_ENGINE_ALLOW_WORKERS else None)
+    )
\ No newline at end of file
@@ -0,0 +1,119 @@
+"""Per-user summary documents backing ``/api/stats`` and ``/api/progress``.
+
+The summary is kept current incrementally by the write endpoints (see
+``SummaryRepository``); the helpers here derive streaks and rebuild a
+summary from the raw collections when it is missing, stale, written by
+an older version of the schema or left behind by a write that failed
+half way.
+"""
+from datetime import date, datetime
+from typing import Optional
+
+from activity import ActivityMap, build_activity
+from leaderboard import rebuild_user_leaderboards
+from timestamps import bucket_day
+
+REBUILD_ATTEMPTS = 5
+
+
+def current_streak(summary: dict, today: Optional[date] = None) -> int:
+    """A streak only counts while it includes today, as it always has."""
+    return ActivityMap(summary.get("activity")).current_streak(today or datetime.now().date())
+
+
+def longest_streak(summary: dict) -> int:
+    return ActivityMap(summary.get("activity")).longest_streak()
+
+
+async def mood_fields(db, user_id: str) -> dict:
+    """Mood count and activity bitmap, from hot ``moods`` plus monthly rollups.
+
+    ``compacted`` is only included (as True) when there are rollups.
+    """
+    mood_count = 0
+    days = set()
+    compacted = False
+    async for mood in db.moods.iter_days(user_id):
+        mood_count += 1
+        if mood.get("day") is not None:
+            days.add(bucket_day(mood["day"]))
+    async for rollup in db.mood_rollups.iter_for_user(user_id):
+        compacted = True
+        mood_count += rollup.get("count", 0)
+        days.update(day for day, _ in db.mood_rollups.day_totals(rollup))
+    fields = {"mood_count": mood_count, "activity": build_activity(days)}
+    if compacted:
+        fields["compacted"] = True
+    return fields
+
+
+async def rebuild_summary(db, user_id: str) -> dict:
+    """Recompute one user's summary from ``moods`` (and its rollups) and ``challenges``.
+
+    The scan is redone if a write lands while it runs (see
+    ``SummaryRepository.replace``). While another write is pending the
+    result is returned unsaved: that write still counts itself. A
+    completion left pending past its deadline may never have reached the
+    leaderboards, so the user's entries there are recomputed as well.
+    After ``REBUILD_ATTEMPTS`` busy scans the last result is returned
+    unsaved; the stored summary is left as it was, so the next read tries
+    again.
+    """
+    for _ in range(REBUILD_ATTEMPTS):
+        version, pending = await db.summaries.begin_rebuild(user_id)
+        summary = await scan_summary(db, user_id)
+        if not all(db.summaries.expired(write) for write in pending.values()):
+            break
+        if any(write["kind"] == "completion" for write in pending.values()):
+            await rebuild_user_leaderboards(db, user_id)
+        if await db.summaries.replace(summary, version):
+            break
+    return summary
+
+
+async def scan_summary(db, user_id: str) -> dict:
+    completed_count = 0
+    total_points = 0
+    recent_completions = []
+    current_challenges = []
+    async for attempt in db.challenges.iter_for_user(user_id):
+        if attempt.get("status") != "completed":
+            current_challenges.append({
+                "challenge_id": attempt["challenge_id"],
+                "started_at": attempt.get("started_at"),
+                "status": attempt.get("status")
+            })
+            continue
+        completed_count += 1
+        total_points += attempt.get("points", 0)
+        if len(recent_completions) < db.summaries.RECENT_COMPLETIONS:
+            recent_completions.append({
+                "challenge_id": attempt["challenge_id"],
+                "completed_at": attempt.get("completed_at"),
+                "points": attempt.get("points", 0)
+            })
+
+    return {
+        "_id": user_id,
+        "schema": db.summaries.SCHEMA,
+        **(await mood_fields(db, user_id)),
+        "completed_count": completed_count,
+        "total_points": total_points,
+        "recent_completions": recent_completions,
+        "current_challenges": current_challenges,
+    }
+
+
+async def get_or_rebuild_summary(db, user_id: str) -> dict:
+    summary = await db.summaries.get(user_id)
+    if not db.summaries.is_current(summary):
+        summary = await rebuild_summary(db, user_id)
+    return summary
+
+
+async def rebuild_all_summaries(db) -> int:
+    rebuilt = 0
+    async for user in db.users.iter_ids():
+        await rebuild_summary(db, user["_id"])
+        rebuilt += 1
+    return rebuilt
@@ -0,0 +1,62 @@
+"""Timestamps of stored mood and challenge records.
+
+Timestamps are stored as native BSON datetimes, naive and in UTC like the
+other datetimes in the database, so they sort and range-filter in time
+order whatever offset the client sent, and reads never re-parse strings.
+A mood also carries ``day``, an integer bucket (days since 1970-01-01) of
+the calendar day as the client wrote it, which streaks, calendars,
+trends and rollups group by. Client timestamps without an offset are
+taken to be UTC.
+
+The API keeps speaking ISO 8601 strings: ``api_timestamp`` renders stored
+values in UTC with a ``Z`` suffix. ``manage.py migrate-dates`` converts
+records written before this format.
+"""
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Tuple, Union
+
+EPOCH = date(1970, 1, 1)
+
+
+def _as_datetime(value: Union[str, date, datetime]) -> datetime:
+    if isinstance(value, str):
+        return datetime.fromisoformat(value)
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime.combine(value, datetime.min.time())
+    raise ValueError(f"Not a timestamp: {value!r}")
+
+
+def parse_timestamp(value: Union[str, date, datetime]) -> datetime:
+    """Naive UTC datetime, truncated to milliseconds like BSON dates; ValueError if invalid."""
+    value = _as_datetime(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
+
+
+def day_bucket(day: date) -> int:
+    return (day - EPOCH).days
+
+
+def bucket_day(bucket: int) -> date:
+    return EPOCH + timedelta(days=bucket)
+
+
+def mood_timestamp(value: Union[str, date, datetime]) -> Tuple[datetime, int]:
+    """``(date, day)`` fields of a mood dated ``value``; ValueError if invalid."""
+    written = _as_datetime(value)
+    return parse_timestamp(written), day_bucket(written.date())
+
+
+def api_timestamp(value) -> Optional[str]:
+    """ISO 8601 UTC string for a stored timestamp; strings from older records pass through."""
+    if isinstance(value, datetime):
+        return value.isoformat(timespec="milliseconds") + "Z"
+    return value
+
+
+def utcnow() -> datetime:
+    """The current time as stored: naive UTC, millisecond precision."""
+    return parse_timestamp(datetime.utcnow())
@@ -0,0 +1,112 @@
+"""Mood trend analytics for ``/api/mood/trends``.
+
+A user's full history is loaded once as two columns (day bucket, mood) and
+reduced to one row per day holding the count, sum and sum of squares of
+that day's mood values. Every statistic the endpoint returns is then a
+vectorized reduction over that daily frame, which is what gets cached.
+"""
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+PERIOD_RULES = {
+    "daily": None,
+    "weekly": "W-MON",
+    "monthly": "MS",
+}
+DAY_NAMES = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def build_daily(days: Iterable[Optional[int]], moods: Iterable[float]) -> pd.DataFrame:
+    """Per-day ``count``/``sum``/``sum_sq`` frame indexed by day, from day buckets."""
+    moods = np.asarray(moods, dtype=float)
+    days = np.asarray([np.nan if day is None else day for day in days], dtype=float)
+    valid = ~np.isnan(days) & ~np.isnan(moods)
+    frame = pd.DataFrame({
+        "count": np.ones(valid.sum()),
+        "sum": moods[valid],
+        "sum_sq": moods[valid] ** 2,
+    }, index=pd.to_datetime(days[valid].astype("int64"), unit="D"))
+    return frame.groupby(level=0).sum().sort_index()
+
+
+async def load_daily(db, user_id: str) -> pd.DataFrame:
+    """Daily frame of the hot entries, plus the per-day totals of compacted months."""
+    days = []
+    moods = []
+    async for mood in db.moods.iter_values(user_id):
+        days.append(mood.get("day"))
+        moods.append(mood.get("mood", np.nan))
+    daily = build_daily(days, moods)
+
+    cold_days = []
+    totals = []
+    async for rollup in db.mood_rollups.iter_for_user(user_id):
+        for day, day_totals in db.mood_rollups.day_totals(rollup):
+            cold_days.append(day)
+            totals.append(day_totals)
+    if not cold_days:
+        return daily
+    cold = pd.DataFrame(totals, index=pd.DatetimeIndex(cold_days), columns=daily.columns, dtype=float)
+    return pd.concat([daily, cold]).groupby(level=0).sum().sort_index()
+
+
+def _mean_series(frame: pd.DataFrame, label: str) -> list:
+    frame = frame[frame["count"] > 0]
+    means = (frame["sum"] / frame["count"]).round(3)
+    return [
+        {label: day, "mean": mean, "count": count}
+        for day, mean, count in zip(
+            frame.index.strftime("%Y-%m-%d"), means.tolist(), frame["count"].astype(int).tolist()
+        )
+    ]
+
+
+def compute_trends(daily: pd.DataFrame, period: str = "daily", window: int = 7) -> dict:
+    if daily.empty:
+        return {
+            "period": period,
+            "window": window,
+            "overall": {"count": 0, "mean": None, "variance": None, "std": None},
+            "series": [],
+            "rolling": [],
+            "day_of_week": [],
+        }
+
+    totals = daily.sum()
+    mean = totals["sum"] / totals["count"]
+    variance = max(totals["sum_sq"] / totals["count"] - mean ** 2, 0.0)
+
+    rule = PERIOD_RULES[period]
+    periods = daily if rule is None else daily.resample(rule, label="left", closed="left").sum()
+
+    # Entry-weighted rolling mean over a calendar window, reported on days with entries.
+    rolling = daily[["count", "sum"]].rolling(f"{window}D").sum()
+    rolling_means = (rolling["sum"] / rolling["count"]).round(3)
+
+    weekdays = daily.groupby(daily.index.dayofweek)[["count", "sum"]].sum()
+
+    return {
+        "period": period,
+        "window": window,
+        "overall": {
+            "count": int(totals["count"]),
+            "mean": round(float(mean), 3),
+            "variance": round(float(variance), 3),
+            "std": round(float(np.sqrt(variance)), 3),
+        },
+        "series": _mean_series(periods, "start"),
+        "rolling": [
+            {"date": day, "mean": value}
+            for day, value in zip(rolling_means.index.strftime("%Y-%m-%d"), rolling_means.tolist())
+        ],
+        "day_of_week": [
+            {
+                "day": DAY_NAMES[weekday],
+                "mean": round(float(row["sum"] / row["count"]), 3),
+                "count": int(row["count"]),
+            }
+            for weekday, row in weekdays.iterrows()
+        ],
+    }
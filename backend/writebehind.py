@@ -0,0 +1,181 @@
+"""Write-behind group commit for high-volume inserts.
+
+With ``WRITE_BEHIND_MODE`` set, mood entries (and, in ``flush`` mode,
+challenge starts) are not inserted one request at a time. They go through a bounded in-process
+queue, and a single flusher task writes them with ``insert_many`` once
+``batch_size`` documents are waiting or ``max_delay`` has passed since
+the oldest one arrived.
+
+Durability is configurable:
+
+* ``flush``: the request is acknowledged after its batch is written, so
+  no acknowledged write can be lost. Concurrent requests share one round
+  trip (group commit).
+* ``enqueue``: the request is acknowledged as soon as the document is
+  queued. This is the fastest mode, but writes still queued when the
+  process dies are lost, and reads may briefly miss queued documents.
+
+When the queue is full, producers wait up to ``enqueue_timeout`` and then
+get ``WriteQueueFull`` (the API answers 503). ``close()`` stops intake and
+drains whatever is still queued. ``pending_for(user_id)`` counts a user's
+documents that are accepted but not yet written, so caches can tell when
+the database is still behind.
+"""
+import asyncio
+import os
+import time
+from collections import Counter
+from typing import Hashable, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+WRITE_BEHIND_MODE = os.environ.get('WRITE_BEHIND_MODE', 'off')
+WRITE_BEHIND_BATCH_SIZE = int(os.environ.get('WRITE_BEHIND_BATCH_SIZE', '500'))
+WRITE_BEHIND_MAX_DELAY_MS = float(os.environ.get('WRITE_BEHIND_MAX_DELAY_MS', '20'))
+WRITE_BEHIND_MAX_PENDING = int(os.environ.get('WRITE_BEHIND_MAX_PENDING', '10000'))
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.environ.get('WRITE_BEHIND_ENQUEUE_TIMEOUT', '1'))
+
+WRITE_BEHIND_MODES = ("off", "flush", "enqueue")
+
+_STOP = object()
+
+
+class WriteQueueFull(Exception):
+    """Raised when the write-behind queue stays full past the enqueue timeout."""
+
+
+class WriteBehindQueue:
+    def __init__(self, collection, durability: str = "flush",
+                 batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+                 max_delay: float = WRITE_BEHIND_MAX_DELAY_MS / 1000,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 enqueue_timeout: float = WRITE_BEHIND_ENQUEUE_TIMEOUT):
+        if durability not in ("flush", "enqueue"):
+            raise ValueError(f"Unknown write-behind durability {durability!r}")
+        self.collection = collection
+        self.durability = durability
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.queue: Optional[asyncio.Queue] = None
+        self.batch_ready: Optional[asyncio.Event] = None
+        self.task: Optional[asyncio.Task] = None
+        self.written = 0
+        self.failed = 0
+        self.pending = Counter()
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    def pending_for(self, user_id: Hashable) -> int:
+        return self.pending[user_id]
+
+    def start(self):
+        self.queue = asyncio.Queue(self.max_pending)
+        self.batch_ready = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def _put(self, item):
+        try:
+            await asyncio.wait_for(self.queue.put(item), self.enqueue_timeout)
+        except asyncio.TimeoutError:
+            raise WriteQueueFull()
+        if self.queue.qsize() >= self.batch_size:
+            self.batch_ready.set()
+
+    async def submit(self, document: dict):
+        if self.task is None or self.task.done():
+            # Not started, or already drained: write through.
+            await self.collection.insert_one(document)
+            return
+        future = None if self.durability == "enqueue" else asyncio.get_running_loop().create_future()
+        owner = document.get("user_id")
+        # Counted before it can be written, so the count never goes negative.
+        self.pending[owner] += 1
+        try:
+            await self._put((document, future, time.monotonic()))
+        except WriteQueueFull:
+            self._written(owner)
+            raise
+        if future is not None:
+            await future
+
+    def _written(self, owner: Hashable):
+        self.pending[owner] -= 1
+        if self.pending[owner] <= 0:
+            del self.pending[owner]
+
+    async def flush(self):
+        """Write everything queued so far, regardless of batch size or delay."""
+        if self.task is None or self.task.done():
+            return
+        future = asyncio.get_running_loop().create_future()
+        await self._put((None, future, time.monotonic()))
+        self.batch_ready.set()
+        await future
+
+    async def close(self):
+        if self.task is None or self.task.done():
+            return
+        await self.queue.put(_STOP)
+        self.batch_ready.set()
+        await self.task
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [await self.queue.get()]
+            if batch[0] is not _STOP and batch[0][0] is not None:
+                # The oldest document may already have waited out the
+                # previous write; only wait for what is left of its delay.
+                remaining = self.max_delay - (time.monotonic() - batch[0][2])
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(self.batch_ready.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if self.queue.qsize() < self.batch_size:
+                self.batch_ready.clear()
+            if _STOP in batch:
+                stopping = True
+                batch.remove(_STOP)
+                while not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+            await self._write(batch)
+
+    async def _write(self, batch: List[tuple]):
+        documents = [document for document, _, _ in batch if document is not None]
+        futures = [future for document, future, _ in batch if document is not None]
+        errors = {}
+        failure = None
+        if documents:
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                errors = {error["index"]: error for error in e.details.get("writeErrors", [])}
+            except Exception as e:
+                failure = e
+        for document in documents:
+            self._written(document.get("user_id"))
+        for index, future in enumerate(futures):
+            error = failure or (BulkWriteError({"writeErrors": [errors[index]]}) if index in errors else None)
+            if error is None:
+                self.written += 1
+            else:
+                self.failed += 1
+            if future is None:
+                if error is not None:
+                    print(f"❌ Write-behind insert into {self.collection.name} failed: {error}")
+            elif not future.done():
+                if error is None:
+                    future.set_result(None)
+                else:
+                    future.set_exception(error)
+        # Flush markers resolve once everything queued before them is written.
+        for document, future, _ in batch:
+            if document is None and not future.done():
+                future.set_result(None)
@@ -1,27 +1,105 @@
 import requests
 import unittest
+import hashlib
 import json
+import os
+import socket
+import subprocess
+import sys
 import time
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# One session for the suite. Rate-limited requests (429) are retried after
+# their Retry-After like any client would; test_28 checks the limit itself.
+http = requests.Session()
+adapter = HTTPAdapter(max_retries=Retry(
+    total=5, status_forcelist=[429], allowed_methods=None, respect_retry_after_header=True, raise_on_status=False
+))
+http.mount("http://", adapter)
+http.mount("https://", adapter)
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+
+class LocalServer:
+    """The API from this checkout in a subprocess, for settings the server under test may not run with"""
+
+    def __init__(self, **env):
+        with socket.socket() as sock:
+            sock.bind(("127.0.0.1", 0))
+            port = sock.getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}"
+        self.process = subprocess.Popen(
+            [sys.executable, "server.py"],
+            cwd=BACKEND_DIR,
+            env=dict(os.environ, SERVER_HOST="127.0.0.1", SERVER_PORT=str(port), WEB_CONCURRENCY="1", **env),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        deadline = time.time() + 60
+        while True:
+            try:
+                if requests.get(f"{self.url}/api/health/ready").status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            if time.time() > deadline or self.process.poll() is not None:
+                self.stop()
+                raise RuntimeError(f"Local server on {self.url} did not become ready")
+            time.sleep(0.2)
+
+    def stop(self) -> int:
+        """Shut down as on a deploy (SIGTERM) and return the exit code"""
+        if self.process.poll() is None:
+            self.process.terminate()
+        return self.process.wait(timeout=60)
+
+    def sign_up(self, username: str, password: str = "localpass123") -> dict:
+        """Register ``username`` unless it exists, log in and return the auth headers"""
+        http.post(
+            f"{self.url}/api/auth/register",
+            json={"username": username, "email": f"{username}@example.com", "password": password}
+        )
+        response = http.post(f"{self.url}/api/auth/login", json={"username": username, "password": password})
+        if response.status_code != 200:
+            raise RuntimeError(f"Login on {self.url} failed: {response.status_code} {response.text}")
+        return {"Authorization": f"Bearer {response.json()['token']}"}
 
 class DailyWellnessAPITest(unittest.TestCase):
+    # Token and user id from test_03, shared so the suite signs in once
+    session = None
+
     def setUp(self):
-        self.base_url = "https://8175f143-29c4-47cc-bd68-4ef24845d1d0.preview.emergentagent.com"
+        self.base_url = os.environ.get(
+            "BACKEND_URL", "https://8175f143-29c4-47cc-bd68-4ef24845d1d0.preview.emergentagent.com"
+        )
         self.test_user = {
             "username": "testuser",
             "email": "test@example.com",
             "password": "testpass123"
         }
-        self.token = None
-        self.user_id = None
+        self.admin_key = os.environ.get("ADMIN_API_KEY")
+        # The per-IP sign-in limit the server under test runs with (its defaults unless set)
+        self.ip_rate = float(os.environ.get("RATE_LIMIT_IP_PER_SECOND", "1"))
+        self.ip_burst = float(os.environ.get("RATE_LIMIT_IP_BURST", "20"))
+        self.token, self.user_id = self.session or (None, None)
 
     def test_01_health_check(self):
         """Test the API health endpoint"""
         print("\n🔍 Testing API health...")
-        response = requests.get(f"{self.base_url}/api/health")
+        response = http.get(f"{self.base_url}/api/health")
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(data["status"], "healthy")
+        
+        response = http.get(f"{self.base_url}/api/health/live")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "alive")
+        
+        response = http.get(f"{self.base_url}/api/health/ready")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "ready")
         print("✅ API health check passed")
 
     def test_02_register_user(self):
@@ -29,7 +107,7 @@ class DailyWellnessAPITest(unittest.TestCase):
         print("\n🔍 Testing user registration...")
         # First try to delete the user if it exists (for test repeatability)
         try:
-            response = requests.post(
+            response = http.post(
                 f"{self.base_url}/api/auth/login",
                 json={"username": self.test_user["username"], "password": self.test_user["password"]}
             )
@@ -42,7 +120,7 @@ class DailyWellnessAPITest(unittest.TestCase):
             pass
 
         # Register new user
-        response = requests.post(
+        response = http.post(
             f"{self.base_url}/api/auth/register",
             json=self.test_user
         )
@@ -55,7 +133,7 @@ class DailyWellnessAPITest(unittest.TestCase):
     def test_03_login_user(self):
         """Test user login"""
         print("\n🔍 Testing user login...")
-        response = requests.post(
+        response = http.post(
             f"{self.base_url}/api/auth/login",
             json={"username": self.test_user["username"], "password": self.test_user["password"]}
         )
@@ -65,12 +143,13 @@ class DailyWellnessAPITest(unittest.TestCase):
         self.assertIn("user", data)
         self.token = data["token"]
         self.user_id = data["user"]["id"]
+        DailyWellnessAPITest.session = (self.token, self.user_id)
         print("✅ User login passed")
 
     def test_04_invalid_login(self):
         """Test invalid login attempt"""
         print("\n🔍 Testing invalid login...")
-        response = requests.post(
+        response = http.post(
             f"{self.base_url}/api/auth/login",
             json={"username": self.test_user["username"], "password": "wrongpassword"}
         )
@@ -83,7 +162,7 @@ class DailyWellnessAPITest(unittest.TestCase):
         if not self.token:
             self.test_03_login_user()
             
-        response = requests.get(
+        response = http.get(
             f"{self.base_url}/api/auth/me",
             headers={"Authorization": f"Bearer {self.token}"}
         )
@@ -104,7 +183,7 @@ class DailyWellnessAPITest(unittest.TestCase):
             "date": datetime.now().isoformat()
         }
         
-        response = requests.post(
+        response = http.post(
             f"{self.base_url}/api/mood/save",
             headers={"Authorization": f"Bearer {self.token}"},
             json=mood_data
@@ -120,7 +199,7 @@ class DailyWellnessAPITest(unittest.TestCase):
         if not self.token:
             self.test_03_login_user()
             
-        response = requests.get(
+        response = http.get(
             f"{self.base_url}/api/mood/history",
             headers={"Authorization": f"Bearer {self.token}"}
         )
@@ -139,14 +218,18 @@ class DailyWellnessAPITest(unittest.TestCase):
             "challengeId": 1
         }
         
-        response = requests.post(
+        response = http.post(
             f"{self.base_url}/api/challenge/start",
             headers={"Authorization": f"Bearer {self.token}"},
             json=challenge_data
         )
-        self.assertEqual(response.status_code, 200)
+        # 409 when challenge 1 is still running from an earlier start
+        self.assertIn(response.status_code, (200, 409))
         data = response.json()
-        self.assertIn("message", data)
+        if response.status_code == 200:
+            self.assertIn("message", data)
+        else:
+            self.assertEqual(data["detail"], "Challenge already started")
         print("✅ Challenge start passed")
 
     def test_09_complete_challenge(self):
@@ -162,7 +245,7 @@ class DailyWellnessAPITest(unittest.TestCase):
             "challengeId": 1
         }
         
-        response = requests.post(
+        response = http.post(
             f"{self.base_url}/api/challenge/complete",
             headers={"Authorization": f"Bearer {self.token}"},
             json=challenge_data
@@ -179,7 +262,7 @@ class DailyWellnessAPITest(unittest.TestCase):
         if not self.token:
             self.test_03_login_user()
             
-        response = requests.get(
+        response = http.get(
             f"{self.base_url}/api/progress",
             headers={"Authorization": f"Bearer {self.token}"}
         )
@@ -195,7 +278,7 @@ class DailyWellnessAPITest(unittest.TestCase):
         if not self.token:
             self.test_03_login_user()
             
-        response = requests.get(
+        response = http.get(
             f"{self.base_url}/api/stats",
             headers={"Authorization": f"Bearer {self.token}"}
         )
@@ -204,8 +287,573 @@ class DailyWellnessAPITest(unittest.TestCase):
         self.assertIn("mood_entries", data)
         self.assertIn("completed_challenges", data)
         self.assertIn("current_streak", data)
+        self.assertIn("longest_streak", data)
+        self.assertGreaterEqual(data["longest_streak"], data["current_streak"])
         print("✅ Stats retrieval passed")
 
+    def test_12_bulk_save_mood(self):
+        """Test bulk mood saving with idempotency keys"""
+        print("\n🔍 Testing bulk mood saving...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        key = f"bulk-{time.time()}"
+        bulk_data = {
+            "entries": [
+                {"mood": 3, "date": datetime.now().isoformat(), "clientId": key},
+                {"mood": 3, "date": datetime.now().isoformat(), "clientId": key}
+            ]
+        }
+        
+        response = http.post(
+            f"{self.base_url}/api/mood/bulk",
+            headers={"Authorization": f"Bearer {self.token}"},
+            json=bulk_data
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["created"], 1)
+        self.assertEqual(data["duplicates"], 1)
+        self.assertEqual([r["status"] for r in data["results"]], ["created", "duplicate"])
+        print("✅ Bulk mood saving passed")
+
+    def test_13_mood_history_pagination(self):
+        """Test cursor pagination and export of mood history"""
+        print("\n🔍 Testing mood history pagination...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        headers = {"Authorization": f"Bearer {self.token}"}
+        response = http.get(
+            f"{self.base_url}/api/mood/history",
+            headers=headers,
+            params={"limit": 1}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor:
+            response = http.get(
+                f"{self.base_url}/api/mood/history",
+                headers=headers,
+                params={"limit": 1, "cursor": cursor}
+            )
+            self.assertEqual(response.status_code, 200)
+        
+        response = http.get(
+            f"{self.base_url}/api/mood/export",
+            headers=headers,
+            params={"format": "csv"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.text.startswith("date,mood,created_at"))
+        print("✅ Mood history pagination passed")
+
+    def test_14_leaderboard(self):
+        """Test all-time and weekly leaderboards"""
+        print("\n🔍 Testing leaderboard...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        for period in ("all", "week"):
+            response = http.get(
+                f"{self.base_url}/api/leaderboard",
+                headers={"Authorization": f"Bearer {self.token}"},
+                params={"period": period, "limit": 5}
+            )
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertIn("top", data)
+            self.assertIn("me", data)
+            self.assertLessEqual(len(data["top"]), 5)
+        print("✅ Leaderboard passed")
+
+    def test_15_conditional_get(self):
+        """Test ETag revalidation of read endpoints"""
+        print("\n🔍 Testing conditional GET...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        headers = {"Authorization": f"Bearer {self.token}"}
+        for path in ("/api/mood/history", "/api/progress", "/api/stats", "/api/auth/me"):
+            response = http.get(f"{self.base_url}{path}", headers=headers)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers.get("ETag")
+            self.assertIsNotNone(etag)
+            response = http.get(f"{self.base_url}{path}", headers={**headers, "If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+        
+        etag = http.get(f"{self.base_url}/api/stats", headers=headers).headers["ETag"]
+        response = http.post(
+            f"{self.base_url}/api/mood/save",
+            headers=headers,
+            json={"mood": 3, "date": datetime.now().isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        response = http.get(f"{self.base_url}/api/stats", headers={**headers, "If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        print("✅ Conditional GET passed")
+
+    def test_16_mood_calendar(self):
+        """Test the yearly mood calendar"""
+        print("\n🔍 Testing mood calendar...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        year = datetime.now().year
+        response = http.get(
+            f"{self.base_url}/api/mood/calendar",
+            headers={"Authorization": f"Bearer {self.token}"},
+            params={"year": year}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["year"], year)
+        self.assertIn(len(data["days"]), (365, 366))
+        self.assertEqual(data["active_days"], sum(data["days"]))
+        self.assertEqual(data["days"][datetime.now().timetuple().tm_yday - 1], 1)
+        print("✅ Mood calendar passed")
+
+    def test_17_dashboard(self):
+        """Test the consolidated dashboard and its field selection"""
+        print("\n🔍 Testing dashboard...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        headers = {"Authorization": f"Bearer {self.token}"}
+        response = http.get(f"{self.base_url}/api/dashboard", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(set(data), {"user", "progress", "history", "stats"})
+        self.assertEqual(data["user"]["username"], self.test_user["username"])
+        self.assertIn("total_points", data["progress"])
+        self.assertIsInstance(data["history"], list)
+        self.assertIn("current_streak", data["stats"])
+        
+        response = http.get(
+            f"{self.base_url}/api/dashboard",
+            headers=headers,
+            params={"fields": "progress,stats"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.json()), {"progress", "stats"})
+        
+        response = http.get(
+            f"{self.base_url}/api/dashboard",
+            headers=headers,
+            params={"fields": "user,nonsense"}
+        )
+        self.assertEqual(response.status_code, 400)
+        
+        for fields in (",", "", "nonsense"):
+            response = http.get(
+                f"{self.base_url}/api/dashboard",
+                headers=headers,
+                params={"fields": fields}
+            )
+            self.assertEqual(response.status_code, 400)
+        print("✅ Dashboard passed")
+
+    def test_18_timestamp_normalization(self):
+        """Test that mood dates with different offsets sort and filter in time order"""
+        print("\n🔍 Testing timestamp normalization...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        headers = {"Authorization": f"Bearer {self.token}"}
+        for date in ("2030-01-01T01:00:00+05:00", "2029-12-31T21:00:00Z"):
+            response = http.post(
+                f"{self.base_url}/api/mood/save",
+                headers=headers,
+                json={"mood": 4, "date": date}
+            )
+            self.assertEqual(response.status_code, 200)
+        
+        response = http.get(
+            f"{self.base_url}/api/mood/history",
+            headers=headers,
+            params={"from": "2029-12-31T00:00:00Z", "to": "2030-01-02T00:00:00Z"}
+        )
+        self.assertEqual(response.status_code, 200)
+        dates = [mood["date"] for mood in response.json()]
+        self.assertEqual(dates, ["2029-12-31T21:00:00.000Z", "2029-12-31T20:00:00.000Z"])
+        
+        response = http.post(
+            f"{self.base_url}/api/mood/save",
+            headers=headers,
+            json={"mood": 4, "date": "not a date"}
+        )
+        self.assertEqual(response.status_code, 400)
+        print("✅ Timestamp normalization passed")
+
+    def test_19_duplicate_challenge_start(self):
+        """Test that a running challenge cannot be started twice"""
+        print("\n🔍 Testing duplicate challenge start...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        headers = {"Authorization": f"Bearer {self.token}"}
+        challenge_data = {"challengeId": int(time.time() * 1000)}
+        response = http.post(f"{self.base_url}/api/challenge/start", headers=headers, json=challenge_data)
+        self.assertEqual(response.status_code, 200)
+        
+        response = http.post(f"{self.base_url}/api/challenge/start", headers=headers, json=challenge_data)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["detail"], "Challenge already started")
+        
+        # Once completed it can be started again
+        response = http.post(f"{self.base_url}/api/challenge/complete", headers=headers, json=challenge_data)
+        self.assertEqual(response.status_code, 200)
+        response = http.post(f"{self.base_url}/api/challenge/start", headers=headers, json=challenge_data)
+        self.assertEqual(response.status_code, 200)
+        print("✅ Duplicate challenge start passed")
+
+    def test_20_mood_trends(self):
+        """Test mood trends for each period, including a save made after caching"""
+        print("\n🔍 Testing mood trends...")
+        if not self.token:
+            self.test_03_login_user()
+            
+        headers = {"Authorization": f"Bearer {self.token}"}
+        response = http.get(f"{self.base_url}/api/mood/trends", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        count = response.json()["overall"]["count"]
+        
+        response = http.post(
+            f"{self.base_url}/api/mood/save",
+            headers=headers,
+            json={"mood": 5, "date": datetime.now().isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        
+        for period in ("daily", "weekly", "monthly"):
+            response = http.get(
+                f"{self.base_url}/api/mood/trends",
+                headers=headers,
+                params={"period": period, "window": 7}
+            )
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertEqual(data["period"], period)
+            self.assertEqual(data["window"], 7)
+            self.assertEqual(data["overall"]["count"], count + 1)
+            self.assertGreater(len(data["series"]), 0)
+            self.assertEqual(sum(point["count"] for point in data["series"]), count + 1)
+        
+        response = http.get(
+            f"{self.base_url}/api/mood/trends",
+            headers=headers,
+            params={"period": "hourly"}
+        )
+        self.assertEqual(response.status_code, 422)
+        print("✅ Mood trends passed")
+
+    def test_21_admin_import(self):
+        """Test importing users and moods, with duplicate rows, and using the result"""
+        print("\n🔍 Testing admin import...")
+        if not self.admin_key:
+            self.skipTest("ADMIN_API_KEY is not set")
+            
+        admin = {"X-Admin-Key": self.admin_key}
+        username = f"imported{int(time.time() * 1000)}"
+        users = "\n".join(json.dumps(row) for row in (
+            {"username": username, "email": f"{username}@example.com", "password": "importpass123"},
+            {"username": username, "email": f"{username}-2@example.com", "password": "importpass123"}
+        ))
+        response = http.post(
+            f"{self.base_url}/api/admin/import/users",
+            headers=admin,
+            params={"format": "ndjson"},
+            data=users
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["processed"], data["created"], data["duplicates"]), (2, 1, 1))
+        self.assertEqual(data["errors"], [{"line": 2, "error": "Username already exists"}])
+        
+        moods = f"username,mood,date\n{username},4,2030-02-01T09:00:00Z\n{username},4,2030-02-01T09:00:00Z\n"
+        response = http.post(
+            f"{self.base_url}/api/admin/import/moods",
+            headers=admin,
+            params={"format": "csv"},
+            data=moods
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["processed"], data["created"], data["duplicates"]), (2, 1, 1))
+        self.assertEqual(data["errors"], [{"line": 3, "error": "Already imported"}])
+        
+        # Importing the same file again only finds duplicates
+        response = http.post(
+            f"{self.base_url}/api/admin/import/moods",
+            headers=admin,
+            params={"format": "csv"},
+            data=moods
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["created"], response.json()["duplicates"]), (0, 2))
+        
+        response = http.post(
+            f"{self.base_url}/api/auth/login",
+            json={"username": username, "password": "importpass123"}
+        )
+        self.assertEqual(response.status_code, 200)
+        headers = {"Authorization": f"Bearer {response.json()['token']}"}
+        response = http.get(f"{self.base_url}/api/mood/history", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([mood["date"] for mood in response.json()], ["2030-02-01T09:00:00.000Z"])
+        response = http.get(f"{self.base_url}/api/stats", headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["mood_entries"], 1)
+        print("✅ Admin import passed")
+
+    def test_22_admin_key_required(self):
+        """Test that admin routes reject a missing or wrong key"""
+        print("\n🔍 Testing admin key check...")
+        if not self.admin_key:
+            self.skipTest("ADMIN_API_KEY is not set")
+            
+        for headers in ({}, {"X-Admin-Key": self.admin_key + "-wrong"}):
+            response = http.post(
+                f"{self.base_url}/api/admin/import/users",
+                headers=headers,
+                data=json.dumps({"username": "nobody", "email": "nobody@example.com", "password": "x"})
+            )
+            self.assertEqual(response.status_code, 403)
+            response = http.get(f"{self.base_url}/api/admin/analytics/daily", headers=headers)
+            self.assertEqual(response.status_code, 403)
+        print("✅ Admin key check passed")
+
+    def test_23_write_behind_modes(self):
+        """Test mood saves on local servers in both write-behind modes"""
+        print("\n🔍 Testing write-behind modes...")
+        for mode in ("flush", "enqueue"):
+            server = LocalServer(STORAGE_ENGINE="memory", WRITE_BEHIND_MODE=mode, WRITE_BEHIND_MAX_DELAY_MS="200")
+            try:
+                headers = server.sign_up(f"writebehind-{mode}")
+                for day in range(1, 6):
+                    response = http.post(
+                        f"{server.url}/api/mood/save",
+                        headers=headers,
+                        json={"mood": day, "date": f"2030-03-0{day}T09:00:00Z"}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                
+                # Both modes count an entry as soon as it is acknowledged
+                response = http.get(f"{server.url}/api/stats", headers=headers)
+                self.assertEqual(response.json()["mood_entries"], 5)
+                
+                # flush acknowledges after the write, enqueue before: its
+                # entries show up once the flush delay has passed
+                deadline = time.time() + (0 if mode == "flush" else 10)
+                while True:
+                    response = http.get(f"{server.url}/api/mood/history", headers=headers)
+                    self.assertEqual(response.status_code, 200)
+                    if len(response.json()) == 5 or time.time() > deadline:
+                        break
+                    time.sleep(0.1)
+                self.assertEqual([mood["mood"] for mood in response.json()], [5, 4, 3, 2, 1])
+            finally:
+                self.assertEqual(server.stop(), 0)
+            print(f"  ✓ {mode}")
+        print("✅ Write-behind modes passed")
+
+    def test_24_write_behind_drain(self):
+        """Test that entries still queued at shutdown are written before the server exits"""
+        print("\n🔍 Testing write-behind drain on shutdown...")
+        mongo_url = os.environ.get("MONGO_URL")
+        if not mongo_url:
+            self.skipTest("MONGO_URL is not set; the drain is only visible in a persistent database")
+            
+        from pymongo import MongoClient
+        database = {"STORAGE_ENGINE": "mongo", "MONGO_URL": mongo_url,
+                    "MONGO_DB_NAME": f"wellness_drain_test_{int(time.time() * 1000)}"}
+        try:
+            # Nothing is flushed on its own within a minute
+            server = LocalServer(WRITE_BEHIND_MODE="enqueue", WRITE_BEHIND_MAX_DELAY_MS="60000", **database)
+            try:
+                headers = server.sign_up("drainuser")
+                for day in range(1, 4):
+                    response = http.post(
+                        f"{server.url}/api/mood/save",
+                        headers=headers,
+                        json={"mood": 4, "date": f"2030-04-0{day}T09:00:00Z"}
+                    )
+                    self.assertEqual(response.status_code, 200)
+                response = http.get(f"{server.url}/api/mood/history", headers=headers)
+                self.assertEqual(response.json(), [])
+            finally:
+                self.assertEqual(server.stop(), 0)
+            
+            server = LocalServer(WRITE_BEHIND_MODE="off", **database)
+            try:
+                headers = server.sign_up("drainuser")
+                response = http.get(f"{server.url}/api/mood/history", headers=headers)
+                self.assertEqual(len(response.json()), 3)
+            finally:
+                server.stop()
+        finally:
+            client = MongoClient(mongo_url)
+            client.drop_database(database["MONGO_DB_NAME"])
+            client.close()
+        print("✅ Write-behind drain passed")
+
+    def test_25_population_analytics_range(self):
+        """Test analytics over a range without entries and over one that is too long"""
+        print("\n🔍 Testing population analytics ranges...")
+        if not self.admin_key:
+            self.skipTest("ADMIN_API_KEY is not set")
+            
+        admin = {"X-Admin-Key": self.admin_key}
+        response = http.get(
+            f"{self.base_url}/api/admin/analytics/daily",
+            headers=admin,
+            params={"from": "1990-01-01", "to": "1990-01-31"}
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual((data["from"], data["to"]), ("1990-01-01", "1990-01-31"))
+        self.assertEqual(data["days"], [])
+        self.assertIsNone(data["overall"])
+        
+        response = http.get(
+            f"{self.base_url}/api/admin/analytics/participation",
+            headers=admin,
+            params={"from": "1990-01-01", "to": "1990-01-31"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["segments"], response.json()["daily_means"]), ({}, []))
+        
+        # 1096 days (three years and a leap day) is the longest range
+        for path in ("daily", "participation"):
+            response = http.get(
+                f"{self.base_url}/api/admin/analytics/{path}",
+                headers=admin,
+                params={"from": "2020-01-01", "to": "2022-12-31"}
+            )
+            self.assertEqual(response.status_code, 200)
+            response = http.get(
+                f"{self.base_url}/api/admin/analytics/{path}",
+                headers=admin,
+                params={"from": "2020-01-01", "to": "2023-01-01"}
+            )
+            self.assertEqual(response.status_code, 422)
+            self.assertEqual(response.json()["detail"], "Range is limited to 1096 days")
+        print("✅ Population analytics ranges passed")
+
+    def test_26_population_analytics_rollup(self):
+        """Test analytics over entries rolled up by manage.py rollup-population on a local server"""
+        print("\n🔍 Testing population analytics after a rollup...")
+        mongo_url = os.environ.get("MONGO_URL")
+        if not mongo_url:
+            self.skipTest("MONGO_URL is not set; the rollup job needs a database it shares with the API")
+            
+        from pymongo import MongoClient
+        env = {"STORAGE_ENGINE": "mongo", "MONGO_URL": mongo_url, "ADMIN_API_KEY": "local-admin-key",
+               "MONGO_DB_NAME": f"wellness_analytics_test_{int(time.time() * 1000)}"}
+        server = LocalServer(**env)
+        try:
+            for username, moods in (("analytics1", (2, 4)), ("analytics2", (3,))):
+                headers = server.sign_up(username)
+                for day, mood in enumerate(moods, start=1):
+                    response = http.post(
+                        f"{server.url}/api/mood/save",
+                        headers=headers,
+                        json={"mood": mood, "date": f"2030-05-0{day}T09:00:00Z"}
+                    )
+                    self.assertEqual(response.status_code, 200)
+            
+            subprocess.run(
+                [sys.executable, "manage.py", "rollup-population"],
+                cwd=BACKEND_DIR,
+                env=dict(os.environ, POPULATION_ROLLUP_LAG_SECONDS="0", **env),
+                check=True,
+                stdout=subprocess.DEVNULL
+            )
+            
+            response = http.get(
+                f"{server.url}/api/admin/analytics/daily",
+                headers={"X-Admin-Key": env["ADMIN_API_KEY"]},
+                params={"from": "2030-05-01", "to": "2030-05-31"}
+            )
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertIsNotNone(data["as_of"])
+            self.assertEqual(
+                [(day["date"], day["entries"], day["mean"], day["histogram"]) for day in data["days"]],
+                [("2030-05-01", 2, 2.5, {"2": 1, "3": 1}), ("2030-05-02", 1, 4.0, {"4": 1})]
+            )
+            self.assertEqual((data["overall"]["entries"], data["overall"]["mean"]), (3, 3.0))
+        finally:
+            server.stop()
+            client = MongoClient(mongo_url)
+            client.drop_database(env["MONGO_DB_NAME"])
+            client.close()
+        print("✅ Population analytics after a rollup passed")
+
+    def test_27_legacy_password_upgrade(self):
+        """Test signing in with an imported legacy SHA-256 hash, before and after its upgrade"""
+        print("\n🔍 Testing legacy password upgrade...")
+        if not self.admin_key:
+            self.skipTest("ADMIN_API_KEY is not set")
+            
+        username = f"legacy{int(time.time() * 1000)}"
+        password = "legacypass123"
+        response = http.post(
+            f"{self.base_url}/api/admin/import/users",
+            headers={"X-Admin-Key": self.admin_key},
+            data=json.dumps({
+                "username": username,
+                "email": f"{username}@example.com",
+                "password_hash": hashlib.sha256(password.encode()).hexdigest()
+            })
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["created"], 1)
+        
+        response = http.post(f"{self.base_url}/api/auth/login", json={"username": username, "password": "wrong"})
+        self.assertEqual(response.status_code, 401)
+        # The first login verifies the legacy hash and stores a PBKDF2 one,
+        # which the second login verifies
+        for _ in range(2):
+            response = http.post(f"{self.base_url}/api/auth/login", json={"username": username, "password": password})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["user"]["username"], username)
+        response = http.post(f"{self.base_url}/api/auth/login", json={"username": username, "password": "wrong"})
+        self.assertEqual(response.status_code, 401)
+        print("✅ Legacy password upgrade passed")
+
+    def test_28_ip_rate_limit(self):
+        """Test the per-IP limit on sign-in: 429 with Retry-After, then recovery (runs last)"""
+        print("\n🔍 Testing per-IP rate limit...")
+        if self.ip_rate <= 0:
+            self.skipTest("RATE_LIMIT_IP_PER_SECOND is 0, the per-IP limit is off")
+            
+        # Unknown usernames are rejected without hashing, so the loop is quick
+        started = time.time()
+        response = None
+        for attempts in range(1, int(self.ip_burst) + 100):
+            response = requests.post(
+                f"{self.base_url}/api/auth/login",
+                json={"username": f"nobody-{time.time()}", "password": "wrongpassword"}
+            )
+            if response.status_code != 401:
+                break
+        self.assertEqual(response.status_code, 429)
+        # Only tokens refilled during the loop allow more than the burst
+        self.assertLessEqual(attempts, self.ip_burst + 1 + (time.time() - started) * self.ip_rate)
+        self.assertEqual(response.json()["detail"], "Too many requests, please slow down")
+        wait = int(response.headers["Retry-After"])
+        self.assertGreaterEqual(wait, 1)
+        
+        time.sleep(wait)
+        response = http.post(
+            f"{self.base_url}/api/auth/login",
+            json={"username": self.test_user["username"], "password": self.test_user["password"]}
+        )
+        self.assertEqual(response.status_code, 200)
+        print("✅ Per-IP rate limit passed")
+
 if __name__ == "__main__":
     # Run tests in order
     test_suite = unittest.TestSuite()
@@ -220,6 +868,23 @@ if __name__ == "__main__":
     test_suite.addTest(DailyWellnessAPITest('test_09_complete_challenge'))
     test_suite.addTest(DailyWellnessAPITest('test_10_get_progress'))
     test_suite.addTest(DailyWellnessAPITest('test_11_get_stats'))
+    test_suite.addTest(DailyWellnessAPITest('test_12_bulk_save_mood'))
+    test_suite.addTest(DailyWellnessAPITest('test_13_mood_history_pagination'))
+    test_suite.addTest(DailyWellnessAPITest('test_14_leaderboard'))
+    test_suite.addTest(DailyWellnessAPITest('test_15_conditional_get'))
+    test_suite.addTest(DailyWellnessAPITest('test_16_mood_calendar'))
+    test_suite.addTest(DailyWellnessAPITest('test_17_dashboard'))
+    test_suite.addTest(DailyWellnessAPITest('test_18_timestamp_normalization'))
+    test_suite.addTest(DailyWellnessAPITest('test_19_duplicate_challenge_start'))
+    test_suite.addTest(DailyWellnessAPITest('test_20_mood_trends'))
+    test_suite.addTest(DailyWellnessAPITest('test_21_admin_import'))
+    test_suite.addTest(DailyWellnessAPITest('test_22_admin_key_required'))
+    test_suite.addTest(DailyWellnessAPITest('test_23_write_behind_modes'))
+    test_suite.addTest(DailyWellnessAPITest('test_24_write_behind_drain'))
+    test_suite.addTest(DailyWellnessAPITest('test_25_population_analytics_range'))
+    test_suite.addTest(DailyWellnessAPITest('test_26_population_analytics_rollup'))
+    test_suite.addTest(DailyWellnessAPITest('test_27_legacy_password_upgrade'))
+    test_suite.addTest(DailyWellnessAPITest('test_28_ip_rate_limit'))
     
     runner = unittest.TextTestRunner(verbosity=2)
     runner.run(test_suite)
\ No newline at end of file
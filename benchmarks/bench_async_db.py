@@ -0,0 +1,144 @@
+"""Requests/second of the API with a blocking vs. a non-blocking data layer.
+
+Drives ``backend/server.py`` in-process through httpx's ASGI transport.
+The database is replaced by an in-process stand-in that charges a fixed
+round-trip latency per operation, either with ``time.sleep`` (what calling
+pymongo from an ``async def`` handler did) or with ``asyncio.sleep`` (what
+motor does).
+
+    python benchmarks/bench_async_db.py --latency-ms 2 --requests 2000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+# A few users send every request from one address, so rate limits would dominate.
+os.environ.setdefault("RATE_LIMIT_USER_PER_SECOND", "0")
+os.environ.setdefault("RATE_LIMIT_IP_PER_SECOND", "0")
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+
+
+class StandInCursor:
+    def __init__(self, collection, docs):
+        self.collection = collection
+        self.docs = docs
+
+    def sort(self, key, direction=1):
+        self.docs.sort(key=lambda d: d.get(key, ""), reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        await self.collection.round_trip()
+        return self.docs[:length] if length else self.docs
+
+
+class StandInCollection:
+    """Equality-filter collection that pays ``latency`` per round trip."""
+
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+        self.docs = []
+
+    async def round_trip(self):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+
+    def _match(self, flt):
+        return [d for d in self.docs if all(d.get(k) == v for k, v in flt.items())]
+
+    async def find_one(self, flt, projection=None):
+        await self.round_trip()
+        found = self._match(flt)
+        return dict(found[0]) if found else None
+
+    def find(self, flt, projection=None):
+        return StandInCursor(self, [dict(d) for d in self._match(flt)])
+
+    async def insert_one(self, doc):
+        await self.round_trip()
+        self.docs.append(dict(doc))
+
+    async def update_one(self, flt, update):
+        await self.round_trip()
+        found = self._match(flt)
+        if found:
+            found[0].update(update.get("$set", {}))
+        return SimpleNamespace(matched_count=len(found[:1]))
+
+    async def count_documents(self, flt):
+        await self.round_trip()
+        return len(self._match(flt))
+
+
+def install_stand_in(latency: float, blocking: bool, users: int, password_hash: str = ""):
+    for repo in (server.db.users, server.db.moods, server.db.mood_archive, server.db.mood_rollups,
+                 server.db.challenges, server.db.summaries):
+        repo.collection = StandInCollection(latency, blocking)
+    tokens = []
+    for i in range(users):
+        user_id = f"bench-user-{i}"
+        server.db.users.collection.docs.append({
+            "_id": user_id,
+            "username": f"bench{i}",
+            "email": f"bench{i}@example.com",
+            "password": password_hash,
+            "created_at": "2024-01-01T00:00:00"
+        })
+        server.db.summaries.collection.docs.append({
+            "_id": user_id, "schema": server.db.summaries.SCHEMA, "version": 0, "mood_count": 0
+        })
+        tokens.append(server.create_jwt_token(user_id))
+    return tokens
+
+
+async def drive(concurrency: int, total: int, tokens):
+    transport = httpx.ASGITransport(app=server.app)
+    paths = ["/api/auth/me", "/api/mood/history", "/api/progress", "/api/stats"]
+    counter = iter(range(total))
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def worker():
+            for i in counter:
+                headers = {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}
+                response = await http.get(paths[i % len(paths)], headers=headers)
+                response.raise_for_status()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return total / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency-ms", type=float, default=2.0)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 250, 500])
+    args = parser.parse_args()
+
+    print(f"{'clients':>8} {'blocking req/s':>16} {'async req/s':>12} {'speedup':>8}")
+    for concurrency in args.concurrency:
+        results = {}
+        for blocking in (True, False):
+            tokens = install_stand_in(args.latency_ms / 1000, blocking, args.users)
+            results[blocking] = asyncio.run(drive(concurrency, args.requests, tokens))
+        print(f"{concurrency:>8} {results[True]:>16.0f} {results[False]:>12.0f} "
+              f"{results[False] / results[True]:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
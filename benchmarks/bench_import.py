@@ -0,0 +1,86 @@
+"""User provisioning: one register call per user versus the bulk import.
+
+Provisions ``--users`` users on the embedded engine twice: the way
+``POST /api/auth/register`` does it (two existence lookups, one hash and
+one insert per user, one user at a time) and through
+``provisioning.import_rows`` (parallel hashing, unordered batched
+inserts, conflicts left to the unique indexes). ``--rounds`` sets the
+PBKDF2 rounds; hashing dominates both at production settings.
+
+    python benchmarks/bench_import.py --users 2000 --rounds 600000
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import Database  # noqa: E402
+from memorydb import MemoryClient  # noqa: E402
+from passwords import PASSWORD_HASH_ROUNDS, PasswordHasher  # noqa: E402
+from provisioning import IMPORT_HASH_WORKERS, import_rows  # noqa: E402
+
+
+def rows(users: int):
+    for index in range(users):
+        yield index + 2, {"username": f"user{index}", "email": f"user{index}@example.com",
+                          "password": f"password-{index}"}, None
+
+
+async def fresh_db():
+    db = Database(MemoryClient(), write_behind="off")
+    await db.create_indexes()
+    return db
+
+
+async def register_each(users: int, rounds: int) -> float:
+    db = await fresh_db()
+    hasher = PasswordHasher(rounds=rounds)
+    started = time.perf_counter()
+    for _, row, _ in rows(users):
+        if await db.users.get_by_username(row["username"]) or await db.users.get_by_email(row["email"]):
+            raise RuntimeError("unexpected conflict")
+        await db.users.create({
+            "_id": str(uuid.uuid4()),
+            "username": row["username"],
+            "email": row["email"],
+            "password": await hasher.hash(row["password"]),
+        })
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return elapsed
+
+
+async def bulk_import(users: int, rounds: int, batch_size: int) -> float:
+    db = await fresh_db()
+    hasher = PasswordHasher(rounds=rounds, workers=IMPORT_HASH_WORKERS, max_pending=batch_size, queue_timeout=None)
+    started = time.perf_counter()
+    report = await import_rows(db, "users", rows(users), hasher=hasher, batch_size=batch_size)
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    assert report["created"] == users, report
+    return elapsed
+
+
+async def run(args):
+    print(f"{'mode':>10} {'users':>7} {'seconds':>8} {'users/s':>9}")
+    for mode, elapsed in (
+        ("register", await register_each(args.users, args.rounds)),
+        ("import", await bulk_import(args.users, args.rounds, args.batch_size)),
+    ):
+        print(f"{mode:>10} {args.users:>7} {elapsed:>8.2f} {args.users / elapsed:>9.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=PASSWORD_HASH_ROUNDS, help="PBKDF2 rounds")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
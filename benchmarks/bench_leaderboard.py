@@ -0,0 +1,44 @@
+"""Rank-query and update throughput of the in-process leaderboard index.
+
+    python benchmarks/bench_leaderboard.py --users 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from leaderboard import RankIndex  # noqa: E402
+
+
+def rate(fn, count):
+    started = time.perf_counter()
+    for i in range(count):
+        fn(i)
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    index = RankIndex()
+    user_ids = [f"user-{i}" for i in range(args.users)]
+    started = time.perf_counter()
+    for user_id in user_ids:
+        index.set(user_id, user_id, random.randrange(0, 5000, 10))
+    print(f"loaded {args.users} users in {time.perf_counter() - started:.2f}s")
+
+    picks = [random.choice(user_ids) for _ in range(args.queries)]
+    print(f"  rank           {rate(lambda i: index.rank(picks[i]), args.queries):>12,.0f} /s")
+    print(f"  top 10         {rate(lambda i: index.top(10), args.queries):>12,.0f} /s")
+    print(f"  me + 2 around  {rate(lambda i: index.around(picks[i], 2), args.queries):>12,.0f} /s")
+    print(f"  +10 points     {rate(lambda i: index.set(picks[i], picks[i], index.points[picks[i]] + 10), args.queries):>12,.0f} /s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Login throughput and event-loop responsiveness during a login storm.
+
+Drives ``POST /api/auth/login`` in-process with N concurrent clients while
+a probe keeps requesting ``GET /``. With hashing inline on the event loop
+(``--workers 0``) every other request waits behind each PBKDF2 call; with
+the worker pool the probe stays fast while logins proceed in parallel.
+
+    python benchmarks/bench_login.py --logins 400 --rounds 600000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx  # noqa: E402
+
+from bench_async_db import install_stand_in, server  # noqa: E402
+from passwords import PASSWORD_HASH_ROUNDS, PasswordHasher  # noqa: E402
+
+
+async def drive(concurrency: int, total: int, users: int):
+    transport = httpx.ASGITransport(app=server.app)
+    counter = iter(range(total))
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        async def login_worker():
+            for i in counter:
+                response = await http.post("/api/auth/login", json={
+                    "username": f"bench{i % users}", "password": "bench"
+                })
+                response.raise_for_status()
+
+        async def probe():
+            # Measured from when the probe asks to be woken, so time spent
+            # waiting for a blocked event loop is included.
+            while not done.is_set():
+                started = time.perf_counter()
+                await asyncio.sleep(0.005)
+                await http.get("/")
+                probe_latencies.append((time.perf_counter() - started - 0.005) * 1000)
+
+        probe_task = asyncio.create_task(probe())
+        started = time.perf_counter()
+        await asyncio.gather(*(login_worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        await probe_task
+
+    probe_latencies.sort()
+    p99 = probe_latencies[int(len(probe_latencies) * 0.99) - 1] if probe_latencies else 0.0
+    return total / elapsed, statistics.median(probe_latencies or [0.0]), p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=400)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=PASSWORD_HASH_ROUNDS)
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 2, 4, 8])
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'logins/s':>9} {'probe p50 ms':>13} {'probe p99 ms':>13}")
+    for workers in args.workers:
+        server.hasher = PasswordHasher(rounds=args.rounds, workers=workers,
+                                       max_pending=args.concurrency, queue_timeout=60)
+        password_hash = server.hasher.context.hash("bench")
+        install_stand_in(0.0005, False, args.users, password_hash=password_hash)
+        rate, p50, p99 = asyncio.run(drive(args.concurrency, args.logins, args.users))
+        server.hasher.shutdown()
+        print(f"{workers:>8} {rate:>9.0f} {p50:>13.1f} {p99:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
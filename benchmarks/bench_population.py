@@ -0,0 +1,108 @@
+"""Population analytics: rollup job cost and query latency.
+
+Seeds ``--users`` users with ``--days`` of daily entries (a third of them
+starting and completing a challenge along the way) on the embedded engine,
+then times a full rollup rebuild, an incremental run covering one more
+day of entries, and each admin analytics view over the whole range. The
+views read one rollup document per day (or offset) whatever the number of
+users, so their latency does not grow with ``--users``.
+
+    python benchmarks/bench_population.py --users 300 --days 365
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import Database  # noqa: E402
+from memorydb import MemoryClient  # noqa: E402
+from population import (  # noqa: E402
+    completion_view, daily_view, load_days, load_offsets, participation_view, update_population_rollups
+)
+from timestamps import day_bucket  # noqa: E402
+
+
+def entry(user_id: str, moment: datetime, created_at: datetime) -> dict:
+    return {
+        "_id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "mood": random.randint(1, 5),
+        "date": moment,
+        "day": day_bucket(moment.date()),
+        "created_at": created_at,
+    }
+
+
+async def seed(db, users: int, days: int, start: datetime):
+    user_ids = []
+    for index in range(users):
+        user_id = str(uuid.uuid4())
+        user_ids.append(user_id)
+        await db.users.create({"_id": user_id, "username": user_id, "email": user_id})
+        moments = [start + timedelta(days=offset, hours=9) for offset in range(days)]
+        await db.moods.add_many([entry(user_id, moment, moment) for moment in moments])
+        if index % 3 == 0:
+            started_at = start + timedelta(days=random.randrange(days), hours=12)
+            await db.challenges.add_many([{
+                "_id": str(uuid.uuid4()),
+                "user_id": user_id,
+                "challenge_id": 1,
+                "started_at": started_at,
+                "completed_at": started_at + timedelta(days=7),
+                "status": "completed",
+                "points": 10,
+            }])
+    return user_ids
+
+
+async def timed(coroutine):
+    started = time.perf_counter()
+    result = await coroutine
+    return (time.perf_counter() - started) * 1000, result
+
+
+async def run(args):
+    random.seed(1)
+    db = Database(MemoryClient(), write_behind="off")
+    await db.create_indexes()
+    start = datetime(2025, 1, 1)
+    end = start + timedelta(days=args.days)
+    user_ids = await seed(db, args.users, args.days, start)
+
+    elapsed, result = await timed(update_population_rollups(db, rebuild=True, now=end))
+    print(f"rebuild        {elapsed:>9.1f} ms  {result['entries']} entries")
+    await db.moods.add_many([entry(user_id, end + timedelta(hours=9), end + timedelta(hours=9))
+                             for user_id in user_ids])
+    elapsed, result = await timed(update_population_rollups(db, now=end + timedelta(days=1)))
+    print(f"incremental    {elapsed:>9.1f} ms  {result['entries']} entries")
+
+    first, last = start.date(), end.date()
+    for name, load, view in (
+        ("daily", lambda: load_days(db, first, last), daily_view),
+        ("participation", lambda: load_days(db, first, last), participation_view),
+        ("completion", lambda: load_offsets(db, 90), completion_view),
+    ):
+        samples = []
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            view(await load())
+            samples.append((time.perf_counter() - started) * 1000)
+        print(f"{name:<14} {min(samples):>9.1f} ms  (best of {args.repeat})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=300)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
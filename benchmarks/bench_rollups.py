@@ -0,0 +1,101 @@
+"""Read cost before and after compacting old mood entries into rollups.
+
+Seeds users with ``--years`` of history on the embedded engine, times the
+first history page, a trends load and a summary rebuild, runs the
+compaction from ``backend/rollups.py`` and times them again. The hot
+``moods`` collection shrinks to the ``MOOD_HOT_DAYS`` window while the
+trends and summary results stay identical.
+
+    python benchmarks/bench_rollups.py --users 20 --years 1 5 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+import uuid
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import Database  # noqa: E402
+from memorydb import MemoryClient  # noqa: E402
+from rollups import compact_all, history_page  # noqa: E402
+from summaries import rebuild_summary  # noqa: E402
+from timestamps import day_bucket  # noqa: E402
+from trends import load_daily  # noqa: E402
+
+
+async def seed(db, users: int, years: int, per_day: int):
+    today = date.today()
+    user_ids = []
+    for _ in range(users):
+        user_id = str(uuid.uuid4())
+        user_ids.append(user_id)
+        await db.users.create({"_id": user_id, "username": user_id, "email": user_id})
+        entries = []
+        for offset in range(365 * years):
+            day = today - timedelta(days=offset)
+            for i in range(per_day):
+                moment = datetime.combine(day, datetime.min.time()) + timedelta(hours=8 + i)
+                entries.append({
+                    "_id": str(uuid.uuid4()),
+                    "user_id": user_id,
+                    "mood": random.randint(1, 5),
+                    "date": moment,
+                    "day": day_bucket(day),
+                    "created_at": moment + timedelta(seconds=1),
+                })
+        await db.moods.add_many(entries)
+    return user_ids
+
+
+async def timed(function, user_ids, repeat: int):
+    started = time.perf_counter()
+    results = []
+    for _ in range(repeat):
+        results = [await function(user_id) for user_id in user_ids]
+    return (time.perf_counter() - started) / (repeat * len(user_ids)) * 1000, results
+
+
+async def measure(db, user_ids, repeat: int):
+    timings = {}
+    timings["history"], _ = await timed(lambda user_id: history_page(db, user_id, limit=30), user_ids, repeat)
+    timings["trends"], daily = await timed(lambda user_id: load_daily(db, user_id), user_ids, repeat)
+    timings["rebuild"], summaries = await timed(lambda user_id: rebuild_summary(db, user_id), user_ids, repeat)
+    checks = [(frame.to_dict(), summary["mood_count"], summary["activity"]) for frame, summary in zip(daily, summaries)]
+    return timings, checks
+
+
+async def run(args):
+    print(f"{'years':>5} {'hot rows':>9} {'':>6} {'history ms':>11} {'trends ms':>10} {'rebuild ms':>11}")
+    for years in args.years:
+        random.seed(1)
+        db = Database(MemoryClient(), write_behind="off")
+        await db.create_indexes()
+        user_ids = await seed(db, args.users, years, args.per_day)
+        for stage in ("raw", "tiered"):
+            if stage == "tiered":
+                await compact_all(db)
+            timings, checks = await measure(db, user_ids, args.repeat)
+            if stage == "raw":
+                expected = checks
+            else:
+                assert checks == expected, "compaction changed trends or summaries"
+            hot = len(db.db["moods"].documents)
+            print(f"{years:>5} {hot:>9} {stage:>6} {timings['history']:>11.3f} "
+                  f"{timings['trends']:>10.2f} {timings['rebuild']:>11.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--per-day", type=int, default=2, help="mood entries per day")
+    parser.add_argument("--repeat", type=int, default=3)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cost of streak and calendar queries for users with long histories.
+
+Compares answering current streak, longest streak and one year's heatmap
+from the per-user activity bitmap in ``backend/activity.py`` against
+scanning every mood date and walking the sorted days, which is what a
+full-history answer costs without the bitmap.
+
+    python benchmarks/bench_streaks.py --years 1 5 20 --per-day 2
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from activity import ActivityMap, build_activity  # noqa: E402
+
+
+def history(years: int, per_day: int, coverage: float):
+    today = date.today()
+    start = today - timedelta(days=365 * years)
+    dates = []
+    for offset in range((today - start).days + 1):
+        if offset == (today - start).days or random.random() < coverage:
+            day = datetime.combine(start + timedelta(days=offset), datetime.min.time())
+            dates.extend((day + timedelta(hours=8 + i)).isoformat() for i in range(per_day))
+    return dates, today
+
+
+def scan(dates, today):
+    days = sorted({datetime.fromisoformat(value).date() for value in dates})
+    longest = run = 0
+    previous = None
+    for day in days:
+        run = run + 1 if previous is not None and day - previous == timedelta(days=1) else 1
+        longest = max(longest, run)
+        previous = day
+    active = set(days)
+    current = 0
+    day = today
+    while day in active:
+        current += 1
+        day -= timedelta(days=1)
+    first = date(today.year, 1, 1)
+    year = [int(first + timedelta(days=i) in active) for i in range((date(today.year + 1, 1, 1) - first).days)]
+    return current, longest, year
+
+
+def bitmap(activity, today):
+    view = ActivityMap(activity)
+    return view.current_streak(today), view.longest_streak(), view.year(today.year)
+
+
+def timed(function, *args, repeat: int):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(*args)
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--per-day", type=int, default=2, help="mood entries per active day")
+    parser.add_argument("--coverage", type=float, default=0.97, help="fraction of days with an entry")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    random.seed(1)
+
+    print(f"{'years':>5} {'entries':>8} {'stored ints':>11} {'scan ms':>9} {'bitmap ms':>10} {'speedup':>8}")
+    for years in args.years:
+        dates, today = history(years, args.per_day, args.coverage)
+        activity = build_activity({datetime.fromisoformat(value).date() for value in dates})
+        scan_ms, expected = timed(scan, dates, today, repeat=args.repeat)
+        bitmap_ms, result = timed(bitmap, activity, today, repeat=args.repeat)
+        assert result == expected, "bitmap and scan disagree"
+        words = sum(len(year) for year in activity.values())
+        print(f"{years:>5} {len(dates):>8} {words:>11} {scan_ms:>9.2f} {bitmap_ms:>10.3f} "
+              f"{scan_ms / bitmap_ms:>7.0f}x")
+
+
+if __name__ == "__main__":
+    main()
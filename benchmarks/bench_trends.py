@@ -0,0 +1,73 @@
+"""Cost of /api/mood/trends for users with large histories.
+
+Compares the columnar daily-aggregate pipeline in ``backend/trends.py``
+(cold, i.e. aggregate from stored day buckets, and warm, i.e. from the
+cached daily frame) against a per-document Python loop parsing ISO date
+strings and computing the same monthly means, variance and day-of-week
+profile.
+
+    python benchmarks/bench_trends.py --entries 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from timestamps import day_bucket  # noqa: E402
+from trends import build_daily, compute_trends  # noqa: E402
+
+
+def python_loop(dates, moods):
+    monthly = defaultdict(lambda: [0, 0])
+    weekdays = defaultdict(lambda: [0, 0])
+    total = total_sq = 0
+    for date, mood in zip(dates, moods):
+        day = datetime.fromisoformat(date).date()
+        monthly[(day.year, day.month)][0] += mood
+        monthly[(day.year, day.month)][1] += 1
+        weekdays[day.weekday()][0] += mood
+        weekdays[day.weekday()][1] += 1
+        total += mood
+        total_sq += mood * mood
+    mean = total / len(moods)
+    return {
+        "monthly": {key: s / n for key, (s, n) in sorted(monthly.items())},
+        "weekdays": {key: s / n for key, (s, n) in sorted(weekdays.items())},
+        "variance": total_sq / len(moods) - mean * mean,
+    }
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    start = datetime(2015, 1, 1)
+    dates = [(start + timedelta(minutes=97 * i)).isoformat() for i in range(args.entries)]
+    days = [day_bucket(datetime.fromisoformat(date).date()) for date in dates]
+    moods = [random.randint(1, 5) for _ in range(args.entries)]
+    daily = build_daily(days, moods)
+
+    print(f"{args.entries} entries over {len(daily)} days (best of {args.repeat})")
+    print(f"  python loop          {timed(lambda: python_loop(dates, moods), args.repeat):9.1f} ms")
+    print(f"  columnar, cold       {timed(lambda: compute_trends(build_daily(days, moods), 'monthly'), args.repeat):9.1f} ms")
+    print(f"  columnar, cached     {timed(lambda: compute_trends(daily, 'monthly'), args.repeat):9.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
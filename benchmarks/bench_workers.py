@@ -0,0 +1,135 @@
+"""Throughput of the prefork server (``backend/serve.py``) vs. worker count.
+
+For each worker count, starts ``backend/server.py`` with ``WEB_CONCURRENCY``
+set, waits for ``/api/health/live``, then drives it over real TCP from
+``--clients`` load-generator processes (each with ``--concurrency``
+keep-alive connections) for ``--duration`` seconds, and reports
+requests/second and p99 latency.
+
+    python benchmarks/bench_workers.py --workers 1 2 4 8 --clients 4
+
+Run it on a machine with at least as many cores as the largest worker
+count plus the load generators, or the numbers only measure contention.
+With the embedded engine every worker has its own data (the server only
+allows that with ``MEMORY_ENGINE_ALLOW_WORKERS=1``, which this sets), so
+the default path needs no shared state; for authenticated endpoints run against a
+real MongoDB (``--engine mongo``, a throwaway ``MONGO_DB_NAME``) and pass
+``--header "Authorization: Bearer ..."``.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--engine", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--path", action="append", help="request path (repeatable)")
+    parser.add_argument("--header", action="append", default=[], help='e.g. "Authorization: Bearer ..."')
+    parser.add_argument("--clients", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per client process")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    args.path = args.path or ["/api/health/live"]
+    return args
+
+
+def client_process(url, paths, headers, concurrency, duration, results):
+    import httpx
+
+    async def run():
+        latencies = []
+        errors = 0
+        deadline = time.perf_counter() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, headers=headers, limits=limits) as http:
+            async def worker(offset):
+                nonlocal errors
+                i = offset
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    response = await http.get(paths[i % len(paths)])
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        errors += 1
+                    i += 1
+            await asyncio.gather(*(worker(offset) for offset in range(concurrency)))
+        return latencies, errors
+
+    results.put(asyncio.run(run()))
+
+
+def wait_until_live(url, timeout=60.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/api/health/live").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"server at {url} did not come up")
+
+
+def measure(workers, args, headers):
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), SERVER_HOST="127.0.0.1",
+               SERVER_PORT=str(args.port), STORAGE_ENGINE=args.engine,
+               MEMORY_ENGINE_ALLOW_WORKERS="1")
+    server = subprocess.Popen([sys.executable, "server.py"], cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.port}"
+    try:
+        wait_until_live(url)
+        results = multiprocessing.Queue()
+        clients = [
+            multiprocessing.Process(target=client_process,
+                                    args=(url, args.path, headers, args.concurrency, args.duration, results))
+            for _ in range(args.clients)
+        ]
+        for client in clients:
+            client.start()
+        latencies, errors = [], 0
+        for _ in clients:
+            client_latencies, client_errors = results.get()
+            latencies.extend(client_latencies)
+            errors += client_errors
+        for client in clients:
+            client.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+    latencies.sort()
+    return {
+        "rps": len(latencies) / args.duration,
+        "p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000 if latencies else 0.0,
+        "errors": errors,
+    }
+
+
+def main():
+    args = parse_args()
+    headers = dict(header.split(": ", 1) for header in args.header)
+    print(f"{os.cpu_count()} CPUs, {args.clients} client processes x {args.concurrency} connections, "
+          f"{args.duration:.0f}s per run, paths {args.path}")
+    print(f"{'workers':>7} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'scaling':>8}")
+    baseline = None
+    for workers in args.workers:
+        result = measure(workers, args, headers)
+        baseline = baseline or result["rps"]
+        print(f"{workers:>7} {result['rps']:>9.0f} {result['p50_ms']:>8.2f} {result['p99_ms']:>8.2f} "
+              f"{result['errors']:>7} {result['rps'] / baseline:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
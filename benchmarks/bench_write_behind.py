@@ -0,0 +1,121 @@
+"""Inserts/second of mood writes: one insert_one per write vs. write-behind.
+
+Drives ``MoodRepository.add`` from many concurrent writers (the morning
+peak: every request saves one mood) against the embedded storage engine
+wrapped to behave like a networked mongod: each round trip holds one of
+``--pool-size`` connections for ``--latency-ms``, and the server commits
+one write at a time for ``--commit-us`` plus ``--per-doc-us`` per
+document. Compares direct inserts with the ``flush`` and ``enqueue``
+write-behind modes.
+
+    python benchmarks/bench_write_behind.py --writers 200 --writes 20000 --latency-ms 1
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import MONGO_MAX_POOL_SIZE, MoodRepository  # noqa: E402
+from memorydb import MemoryClient  # noqa: E402
+from writebehind import (  # noqa: E402
+    WRITE_BEHIND_BATCH_SIZE, WRITE_BEHIND_MAX_DELAY_MS, WRITE_BEHIND_MAX_PENDING, WriteBehindQueue
+)
+
+
+class LatencyCollection:
+    """Charges a pooled round trip and a serialized commit on every insert."""
+
+    def __init__(self, collection, latency: float, commit: float, per_doc: float, pool_size: int):
+        self.collection = collection
+        self.name = collection.name
+        self.latency = latency
+        self.commit = commit
+        self.per_doc = per_doc
+        self.pool = asyncio.Semaphore(pool_size)
+        self.server = asyncio.Lock()
+        self.round_trips = 0
+
+    async def round_trip(self, documents: int):
+        self.round_trips += 1
+        async with self.pool:
+            await asyncio.sleep(self.latency)
+            async with self.server:
+                await asyncio.sleep(self.commit + self.per_doc * documents)
+
+    async def insert_one(self, document):
+        await self.round_trip(1)
+        return await self.collection.insert_one(document)
+
+    async def insert_many(self, documents, ordered=True):
+        await self.round_trip(len(documents))
+        return await self.collection.insert_many(documents, ordered=ordered)
+
+
+async def run(mode, args):
+    collection = LatencyCollection(
+        MemoryClient()["bench"]["moods"], args.latency_ms / 1000, args.commit_us / 1_000_000,
+        args.per_doc_us / 1_000_000, args.pool_size
+    )
+    writer = None
+    if mode != "off":
+        writer = WriteBehindQueue(
+            collection, durability=mode, batch_size=args.batch_size,
+            max_delay=args.max_delay_ms / 1000, max_pending=args.max_pending
+        )
+        writer.start()
+    moods = MoodRepository(collection, writer=writer)
+    remaining = iter(range(args.writes))
+    latencies = []
+
+    async def produce():
+        for i in remaining:
+            started = time.perf_counter()
+            await moods.add({"_id": str(uuid.uuid4()), "user_id": f"user-{i % 1000}", "mood": i % 5 + 1})
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(produce() for _ in range(args.writers)))
+    acknowledged = time.perf_counter() - started
+    if writer is not None:
+        await writer.close()
+    durable = time.perf_counter() - started
+
+    stored = await collection.collection.count_documents({})
+    assert stored == args.writes, f"{mode}: {stored} of {args.writes} documents stored"
+    latencies.sort()
+    return {
+        "acked_rps": args.writes / acknowledged,
+        "durable_rps": args.writes / durable,
+        "p99_ms": latencies[int(0.99 * (len(latencies) - 1))] * 1000,
+        "round_trips": collection.round_trips,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=200, help="concurrent producers")
+    parser.add_argument("--writes", type=int, default=20000)
+    parser.add_argument("--latency-ms", type=float, default=1.0, help="cost of one round trip")
+    parser.add_argument("--commit-us", type=float, default=200.0, help="serialized server cost per write")
+    parser.add_argument("--per-doc-us", type=float, default=5.0, help="extra server cost per document")
+    parser.add_argument("--pool-size", type=int, default=MONGO_MAX_POOL_SIZE)
+    parser.add_argument("--batch-size", type=int, default=WRITE_BEHIND_BATCH_SIZE)
+    parser.add_argument("--max-delay-ms", type=float, default=WRITE_BEHIND_MAX_DELAY_MS)
+    parser.add_argument("--max-pending", type=int, default=WRITE_BEHIND_MAX_PENDING)
+    args = parser.parse_args()
+
+    print(f"{args.writes} writes from {args.writers} writers, "
+          f"{args.latency_ms} ms/round trip, {args.commit_us} us/commit + {args.per_doc_us} us/document")
+    print(f"{'mode':<10} {'acked/s':>10} {'durable/s':>10} {'p99 ms':>9} {'round trips':>12}")
+    for mode in ("off", "flush", "enqueue"):
+        result = asyncio.run(run(mode, args))
+        print(f"{mode:<10} {result['acked_rps']:>10.0f} {result['durable_rps']:>10.0f} "
+              f"{result['p99_ms']:>9.2f} {result['round_trips']:>12}")
+
+
+if __name__ == "__main__":
+    main()
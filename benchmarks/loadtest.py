@@ -0,0 +1,256 @@
+"""Load test and latency benchmark for the Daily Wellness API.
+
+Boots ``backend/server.py`` in-process (through httpx's ASGI transport, so
+no sockets are involved), seeds users with mood and challenge history,
+then drives a weighted concurrent mix of login, mood save, history,
+progress and stats requests. Per endpoint it reports requests/second and
+p50/p95/p99 latency, and ``--output`` writes the same numbers as JSON so
+runs can be compared across versions with ``--baseline``.
+
+    python benchmarks/loadtest.py --users 200 --moods 365 --requests 20000 \\
+        --concurrency 50 --output results.json
+
+The embedded storage engine is used by default; ``--engine mongo`` runs
+against ``MONGO_URL`` instead (use a throwaway ``MONGO_DB_NAME``).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+PASSWORD = "loadtest-password"
+
+DEFAULT_MIX = {
+    "login": 5,
+    "mood_save": 25,
+    "history": 25,
+    "progress": 20,
+    "stats": 25,
+}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--engine", choices=["memory", "mongo"], default="memory")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--moods", type=int, default=365, help="mood entries seeded per user")
+    parser.add_argument("--challenges", type=int, default=20, help="completed challenges seeded per user")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--mix", type=json.loads, default=DEFAULT_MIX,
+                        help='JSON weights, e.g. \'{"history": 1, "stats": 1}\'')
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a previous --output file")
+    return parser.parse_args()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def seed(server, users, moods, challenges):
+    """Write users and history straight through the repositories."""
+    from summaries import rebuild_summary
+    from timestamps import day_bucket
+
+    password_hash = await server.hasher.hash(PASSWORD)
+    today = datetime.utcnow().replace(hour=9, minute=0, second=0, microsecond=0)
+    tokens = []
+    for i in range(users):
+        user_id = f"loadtest-{i}"
+        await server.db.users.create({
+            "_id": user_id,
+            "username": f"loadtest{i}",
+            "email": f"loadtest{i}@example.com",
+            "password": password_hash,
+            "created_at": (today - timedelta(days=moods)).isoformat()
+        })
+        await server.db.moods.add_many([
+            {
+                "_id": f"{user_id}-mood-{day}",
+                "user_id": user_id,
+                "mood": random.randint(1, 5),
+                "date": today - timedelta(days=day),
+                "day": day_bucket((today - timedelta(days=day)).date()),
+                "created_at": today - timedelta(days=day)
+            }
+            for day in range(moods)
+        ])
+        for challenge in range(challenges):
+            completed_at = today - timedelta(days=challenge)
+            await server.db.challenges.start({
+                "_id": f"{user_id}-challenge-{challenge}",
+                "user_id": user_id,
+                "challenge_id": challenge,
+                "started_at": completed_at,
+                "status": "started"
+            })
+            await server.db.challenges.complete(user_id, challenge, completed_at, server.CHALLENGE_POINTS)
+        await rebuild_summary(server.db, user_id)
+        tokens.append(server.create_jwt_token(user_id))
+    return tokens
+
+
+def build_requests(users, tokens):
+    def auth(i):
+        return {"Authorization": f"Bearer {tokens[i]}"}
+
+    return {
+        "login": lambda i: ("POST", "/api/auth/login", None,
+                            {"username": f"loadtest{i}", "password": PASSWORD}),
+        "mood_save": lambda i: ("POST", "/api/mood/save", auth(i),
+                                {"mood": random.randint(1, 5), "date": datetime.utcnow().isoformat()}),
+        "history": lambda i: ("GET", "/api/mood/history", auth(i), None),
+        "progress": lambda i: ("GET", "/api/progress", auth(i), None),
+        "stats": lambda i: ("GET", "/api/stats", auth(i), None),
+    }
+
+
+async def drive(server, tokens, args):
+    import httpx
+
+    builders = build_requests(args.users, tokens)
+    names = [name for name in args.mix if args.mix[name] > 0]
+    weights = [args.mix[name] for name in names]
+    plan = random.choices(names, weights=weights, k=args.requests)
+    latencies = {name: [] for name in names}
+    errors = {name: 0 for name in names}
+    queue = iter(enumerate(plan))
+
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://loadtest") as http:
+        async def worker():
+            for i, name in queue:
+                method, path, headers, body = builders[name](i % args.users)
+                started = time.perf_counter()
+                response = await http.request(method, path, headers=headers, json=body)
+                latencies[name].append((time.perf_counter() - started) * 1000)
+                if response.status_code >= 400:
+                    errors[name] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return latencies, errors, elapsed
+
+
+def summarize(latencies, errors, elapsed):
+    endpoints = {}
+    for name, values in latencies.items():
+        values.sort()
+        endpoints[name] = {
+            "count": len(values),
+            "errors": errors[name],
+            "rps": round(len(values) / elapsed, 1),
+            "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+            "p50_ms": round(percentile(values, 0.50), 3),
+            "p95_ms": round(percentile(values, 0.95), 3),
+            "p99_ms": round(percentile(values, 0.99), 3),
+        }
+    every = sorted(value for values in latencies.values() for value in values)
+    total = {
+        "count": len(every),
+        "errors": sum(errors.values()),
+        "rps": round(len(every) / elapsed, 1),
+        "elapsed_s": round(elapsed, 3),
+        "p50_ms": round(percentile(every, 0.50), 3),
+        "p95_ms": round(percentile(every, 0.95), 3),
+        "p99_ms": round(percentile(every, 0.99), 3),
+    }
+    return endpoints, total
+
+
+def report(endpoints, total, baseline=None):
+    header = f"{'endpoint':<12} {'count':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(endpoints.items()) + [("TOTAL", total)]
+    for name, row in rows:
+        line = (f"{name:<12} {row['count']:>7} {row['errors']:>5} {row['rps']:>9.1f} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+        previous = None
+        if baseline:
+            previous = baseline["total"] if name == "TOTAL" else baseline["endpoints"].get(name)
+        if previous and previous.get("p99_ms"):
+            line += f"   p99 {100 * (row['p99_ms'] / previous['p99_ms'] - 1):+6.1f}%"
+            line += f"   req/s {100 * (row['rps'] / previous['rps'] - 1):+6.1f}%"
+        print(line)
+
+
+def main():
+    args = parse_args()
+    random.seed(args.seed)
+    os.environ["STORAGE_ENGINE"] = args.engine
+    # Every simulated client shares one address and hammers a few users, so
+    # rate limits are off unless set explicitly in the environment.
+    os.environ.setdefault("RATE_LIMIT_USER_PER_SECOND", "0")
+    os.environ.setdefault("RATE_LIMIT_IP_PER_SECOND", "0")
+    sys.path.insert(0, BACKEND)
+    import server
+
+    async def run():
+        await server.db.create_indexes()
+        seeding_started = time.perf_counter()
+        tokens = await seed(server, args.users, args.moods, args.challenges)
+        print(f"Seeded {args.users} users x {args.moods} moods, {args.challenges} challenges "
+              f"in {time.perf_counter() - seeding_started:.1f}s ({args.engine} engine)")
+        return await drive(server, tokens, args)
+
+    latencies, errors, elapsed = asyncio.run(run())
+    endpoints, total = summarize(latencies, errors, elapsed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(endpoints, total, baseline)
+
+    if args.output:
+        results = {
+            "meta": {
+                "timestamp": datetime.utcnow().isoformat(),
+                "git_revision": git_revision(),
+                "app_version": server.app.version,
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+                "engine": args.engine,
+                "users": args.users,
+                "moods_per_user": args.moods,
+                "challenges_per_user": args.challenges,
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "mix": args.mix,
+            },
+            "endpoints": endpoints,
+            "total": total,
+        }
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
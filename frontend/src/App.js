@@ -147,8 +147,7 @@ function App() {
   useEffect(() => {
     if (isAuthenticated) {
       updateDailyQuote();
-      loadUserProgress();
-      loadMoodHistory();
+      loadDashboard();
     }
   }, [isAuthenticated, moodLevel]);
 
@@ -248,6 +247,22 @@ function App() {
     }
   };
 
+  const loadDashboard = async () => {
+    try {
+      const token = localStorage.getItem('token');
+      const response = await fetch(`${API_URL}/api/dashboard?fields=progress,history`, {
+        headers: { 'Authorization': `Bearer ${token}` }
+      });
+      if (response.ok) {
+        const data = await response.json();
+        setUserProgress(data.progress);
+        setMoodHistory(data.history);
+      }
+    } catch (error) {
+      console.error('Error loading dashboard:', error);
+    }
+  };
+
   const loadUserProgress = async () => {
     try {
       const token = localStorage.getItem('token');
@@ -0,0 +1,120 @@
+"""Mood compaction (rollups.py) on the embedded engine.
+
+    python -m unittest tests.test_rollups
+"""
+import asyncio
+import os
+import sys
+import unittest
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+
+from database import MOOD_CLIENT_ID_NAMESPACE, Database  # noqa: E402
+from memorydb import MemoryClient  # noqa: E402
+from provisioning import import_rows  # noqa: E402
+from rollups import compact_user, compacted_ids, history_page, hot_boundary  # noqa: E402
+from summaries import rebuild_summary  # noqa: E402
+from timestamps import mood_timestamp, utcnow  # noqa: E402
+
+USER_ID = "user-1"
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+class CompactionTest(unittest.TestCase):
+    """Three entries older than the hot window, two inside it."""
+
+    def setUp(self):
+        self.db = Database(MemoryClient(), write_behind="off")
+        self.boundary = hot_boundary()
+        self.old_ids = [self.client_id_mood(f"old-{day}") for day in range(3)]
+        run(self.seed())
+
+    @staticmethod
+    def client_id_mood(client_id: str) -> str:
+        return str(uuid.uuid5(MOOD_CLIENT_ID_NAMESPACE, f"{USER_ID}:{client_id}"))
+
+    async def seed(self):
+        await self.db.create_indexes()
+        await self.db.users.create({"_id": USER_ID, "username": "compact", "email": "compact@example.com",
+                                    "password": "x", "created_at": utcnow().isoformat()})
+        await self.db.summaries.create(USER_ID)
+        moods = []
+        for day, mood_id in enumerate(self.old_ids):
+            moods.append((mood_id, self.boundary - timedelta(days=10 + day), 2))
+        for day in range(2):
+            moods.append((str(uuid.uuid4()), datetime.utcnow() - timedelta(days=day), 4))
+        for mood_id, moment, mood in moods:
+            date, day = mood_timestamp(moment)
+            await self.db.moods.add({"_id": mood_id, "user_id": USER_ID, "mood": mood,
+                                     "date": date, "day": day, "created_at": utcnow()})
+
+    def count(self, collection) -> int:
+        return run(collection.count_documents({"user_id": USER_ID}))
+
+    def test_01_compaction_moves_old_entries(self):
+        compacted = run(compact_user(self.db, USER_ID, self.boundary, archive="archive"))
+        self.assertEqual(compacted, 3)
+        self.assertEqual(self.count(self.db.moods.collection), 2)
+        self.assertEqual(self.count(self.db.mood_archive.collection), 3)
+        rollups = run(self.db.mood_rollups.iter_for_user(USER_ID).to_list(length=None))
+        self.assertEqual(sum(rollup["count"] for rollup in rollups), 3)
+        self.assertTrue(run(self.db.summaries.compacted(USER_ID)))
+
+    def test_02_summary_and_history_keep_compacted_entries(self):
+        run(compact_user(self.db, USER_ID, self.boundary, archive="archive"))
+        summary = run(rebuild_summary(self.db, USER_ID))
+        self.assertEqual(summary["mood_count"], 5)
+        self.assertTrue(summary["compacted"])
+        page = run(history_page(self.db, USER_ID, limit=10))
+        self.assertEqual(len(page), 5)
+        dates = [entry["date"] for entry in page]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_03_interrupted_compaction_is_not_counted_twice(self):
+        delete_ids = self.db.moods.delete_ids
+
+        async def crash(ids):
+            raise RuntimeError("interrupted")
+        self.db.moods.delete_ids = crash
+        with self.assertRaises(RuntimeError):
+            run(compact_user(self.db, USER_ID, self.boundary, archive="archive"))
+        self.db.moods.delete_ids = delete_ids
+
+        run(compact_user(self.db, USER_ID, self.boundary, archive="archive"))
+        self.assertEqual(self.count(self.db.moods.collection), 2)
+        self.assertEqual(run(rebuild_summary(self.db, USER_ID))["mood_count"], 5)
+
+    def test_04_delete_mode_keeps_only_rollups(self):
+        compacted = run(compact_user(self.db, USER_ID, self.boundary, archive="delete"))
+        self.assertEqual(compacted, 3)
+        self.assertEqual(self.count(self.db.mood_archive.collection), 0)
+        self.assertEqual(run(rebuild_summary(self.db, USER_ID))["mood_count"], 5)
+
+    def test_05_compacted_entries_are_recognised(self):
+        for archive in ("delete", "archive"):
+            with self.subTest(archive=archive):
+                self.setUp()
+                run(compact_user(self.db, USER_ID, self.boundary, archive=archive))
+                found = run(compacted_ids(self.db, [USER_ID], self.old_ids + ["unknown"]))
+                self.assertEqual(found, set(self.old_ids))
+
+    def test_06_reimport_after_compaction_adds_nothing(self):
+        rows = [
+            (line + 2, {"username": "compact", "mood": 2, "clientId": f"old-{line}",
+                        "date": (self.boundary - timedelta(days=10 + line)).isoformat()}, None)
+            for line in range(3)
+        ]
+        run(compact_user(self.db, USER_ID, self.boundary, archive="archive"))
+        report = run(import_rows(self.db, "moods", rows))
+        self.assertEqual(report["created"], 0)
+        self.assertEqual(report["duplicates"], 3)
+        self.assertEqual(self.count(self.db.moods.collection), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()